@@ -0,0 +1,189 @@
+import fcntl
+import json
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import ADMISSION_FOLDER, ADMISSION_SLOTS, ADMISSION_MEMORY_BYTES, EXCLUSIVE_FRACTION
+from errors import overloaded_error
+from metrics import Counter, stage
+
+PRIORITY_FREE = 0
+PRIORITY_PRO = 1
+
+# Seed for the service-time estimate until real runs have been measured
+INITIAL_SERVICE_SECONDS = 2.0
+EWMA_ALPHA = 0.2
+POLL_INTERVAL = 0.02
+
+REJECTED = Counter('byewatermark_admission_rejected_total', 'Requests shed with 503 OVERLOADED', ('priority',))
+PRIORITY_NAMES = {PRIORITY_FREE: 'free', PRIORITY_PRO: 'pro'}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class AdmissionController:
+    """Node-wide cap on concurrent tool work with priority queueing and load shedding.
+
+    State (holders, waiters, service-time estimate) lives in one small JSON
+    file guarded by an flock, so every gunicorn worker, job thread and batch
+    pool process on the node shares the same budget. Entries of processes
+    that died are dropped on the next access. Waiters are served Pro first,
+    then FIFO; a new request whose predicted wait is over its limit is
+    rejected with a 503 before it queues.
+
+    Each job holds one of `slots` and its decoded-pixel cost against
+    `memory_bytes`, so many small images run side by side while a large
+    one waits for room. Jobs at EXCLUSIVE_FRACTION of the budget or more
+    are charged the whole budget and run alone. Grants follow queue order
+    strictly, so small jobs cannot starve a large one at the head.
+    """
+
+    def __init__(self, folder=ADMISSION_FOLDER, slots=ADMISSION_SLOTS, memory_bytes=ADMISSION_MEMORY_BYTES):
+        self.slots = slots
+        self.memory_bytes = memory_bytes
+        self.state_path = os.path.join(folder, 'state.json')
+        self.lock_path = os.path.join(folder, 'state.lock')
+        os.makedirs(folder, exist_ok=True)
+
+    @contextmanager
+    def _state(self):
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.state_path) as f:
+                        state = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    state = {'holders': {}, 'waiters': {}, 'service': INITIAL_SERVICE_SECONDS}
+                before = json.dumps(state, sort_keys=True)
+                for table in ('holders', 'waiters'):
+                    state[table] = {t: e for t, e in state[table].items() if _pid_alive(e['pid'])}
+                yield state
+                if json.dumps(state, sort_keys=True) != before:
+                    tmp = f"{self.state_path}.tmp"
+                    with open(tmp, 'w') as f:
+                        json.dump(state, f)
+                    os.replace(tmp, self.state_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def charge(self, cost):
+        """Memory actually reserved for a job of estimated `cost` bytes."""
+        if cost >= self.memory_bytes * EXCLUSIVE_FRACTION:
+            return self.memory_bytes
+        return cost
+
+    @staticmethod
+    def _queue(state):
+        # Pro first, then arrival order
+        return sorted(state['waiters'], key=lambda t: (-state['waiters'][t]['priority'], state['waiters'][t]['since']))
+
+    def _grantable(self, state):
+        """Waiters that can start now: the longest queue prefix that fits."""
+        slots = self.slots - len(state['holders'])
+        memory = self.memory_bytes - sum(h['cost'] for h in state['holders'].values())
+        granted = []
+        for ticket in self._queue(state):
+            cost = state['waiters'][ticket]['cost']
+            if slots <= 0 or cost > memory:
+                break
+            granted.append(ticket)
+            slots -= 1
+            memory -= cost
+        return granted
+
+    def _predict(self, state, priority, cost=0):
+        """Seconds until a new request gets to run, from slot and memory backlog."""
+        ahead = [w for w in state['waiters'].values() if w['priority'] >= priority]
+        slot_backlog = (len(state['holders']) + len(ahead) - self.slots + 1) / self.slots
+        used = sum(h['cost'] for h in state['holders'].values()) + sum(w['cost'] for w in ahead)
+        memory_backlog = (used + self.charge(cost) - self.memory_bytes) / self.memory_bytes
+        backlog = max(slot_backlog, memory_backlog)
+        if backlog <= 0:
+            return 0.0
+        return backlog * state['service']
+
+    def predicted_wait(self, priority=PRIORITY_FREE, cost=0):
+        with self._state() as state:
+            return self._predict(state, priority, cost)
+
+    def check(self, priority, max_wait, cost=0):
+        """Raise 503 OVERLOADED now if a request of this priority would wait too long."""
+        wait = self.predicted_wait(priority, cost)
+        if max_wait is not None and wait > max_wait:
+            REJECTED.inc(priority=PRIORITY_NAMES[priority])
+            raise overloaded_error(wait)
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_FREE, max_wait=None, cost=0, sample=True):
+        """Hold one tool slot and `cost` bytes of memory budget for the block.
+
+        With max_wait set, the request is rejected up front if the predicted
+        wait is longer, and gives up (also 503) if it ends up waiting more
+        than twice that. max_wait=None queues until a slot frees up (work
+        that was already accepted, e.g. async jobs). sample=False keeps the
+        block's duration out of the service-time estimate (short work that
+        is not a tool run, like the watermark pre-check).
+        """
+        ticket = uuid.uuid4().hex
+        with self._state() as state:
+            wait = self._predict(state, priority, cost)
+            if max_wait is not None and wait > max_wait:
+                REJECTED.inc(priority=PRIORITY_NAMES[priority])
+                raise overloaded_error(wait)
+            state['waiters'][ticket] = {'pid': os.getpid(), 'priority': priority, 'since': time.time(), 'cost': self.charge(cost)}
+
+        deadline = time.monotonic() + max_wait * 2 if max_wait is not None else None
+        try:
+            with stage('queue'):
+                self._wait(ticket, priority, deadline)
+        except BaseException:
+            with self._state() as state:
+                state['waiters'].pop(ticket, None)
+            raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            with self._state() as state:
+                state['holders'].pop(ticket, None)
+                if sample:
+                    state['service'] = (1 - EWMA_ALPHA) * state['service'] + EWMA_ALPHA * elapsed
+
+    def _wait(self, ticket, priority, deadline):
+        while True:
+            with self._state() as state:
+                if ticket in self._grantable(state):
+                    waiter = state['waiters'].pop(ticket)
+                    state['holders'][ticket] = {'pid': os.getpid(), 'since': time.time(), 'cost': waiter['cost']}
+                    return
+                if deadline is not None and time.monotonic() > deadline:
+                    REJECTED.inc(priority=PRIORITY_NAMES[priority])
+                    raise overloaded_error(self._predict(state, priority))
+            time.sleep(POLL_INTERVAL * (0.5 + random.random()))
+
+    def stats(self):
+        with self._state() as state:
+            return {
+                'slots': self.slots,
+                'in_flight': len(state['holders']),
+                'queued': len(state['waiters']),
+                'queued_pro': sum(1 for w in state['waiters'].values() if w['priority'] == PRIORITY_PRO),
+                'memory_budget': self.memory_bytes,
+                'memory_used': sum(h['cost'] for h in state['holders'].values()),
+                'service_seconds': round(state['service'], 3),
+                'predicted_wait': round(self._predict(state, PRIORITY_FREE), 3),
+            }
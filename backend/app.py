@@ -1,16 +1,13 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, redirect, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-import subprocess
 import os
 import uuid
 import time
-import threading
-from functools import wraps
 import hashlib
 import hmac
+import threading
 from dotenv import load_dotenv
-from supabase import create_client, Client
 from datetime import datetime, timezone
 
 # Load env vars from .env and .env.local
@@ -18,8 +15,39 @@ load_dotenv()
 load_dotenv('.env.local')
 
 import re
+import json
+
+from config import (
+    UPLOAD_FOLDER, OUTPUT_FOLDER, JOB_FOLDER, CACHE_FOLDER, ALLOWED_EXTENSIONS,
+    INDEX_FOLDER, JOB_WORKERS, JOB_QUEUE_SIZE, RESULT_CACHE_MAX_BYTES, DOWNLOAD_ACCEL_PREFIX,
+    SUPABASE_TIMEOUT, ADMISSION_MAX_WAIT, ADMISSION_MAX_WAIT_PRO, PRECHECK, S3_PRESIGN,
+    PREVIEW_FOLDER, OUTPUT_TTL, CONTACT_LIMIT_PER_DAY, CONTACT_MAX_LENGTH, JOB_EVENT_STREAMS,
+    ENTITLEMENT_FOLDER
+)
+from pipeline import ProcessingError, process_upload, dry_run as tool_dry_run
+from jobs import JobStore, JobQueue, QueueFull, TERMINAL_STATES
+from preprocess import timing_stats, probe_image, warm_codecs
+from uploads import UploadRequest, claim_upload, discard_unclaimed
+from result_cache import ResultCache, hash_file
+from file_index import FileIndex, file_id_from_output
+from storage import CHUNK_SIZE as STORAGE_CHUNK_SIZE, get_storage, is_not_found
+from janitor import Janitor, track as track_output
+from entitlements import EntitlementCache
+from rate_limiter import RateLimiter
+from batch import BatchError, collect_items, stream_zip
+from detect import has_watermark, warm as warm_detector
+from derivatives import KINDS as PREVIEW_KINDS, derivative_name, derivative_path
+import metrics
+from metrics import Gauge, stage
+from admission import AdmissionController, PRIORITY_FREE, PRIORITY_PRO
+from webhooks import WebhookSpool, event_key
+from outbox import Outbox
+from contact import send_batch as send_contact_batch
+from warmup import Warmup
 
 app = Flask(__name__)
+# Stream uploads straight to UPLOAD_FOLDER with a hard byte cap (see uploads.py)
+app.request_class = UploadRequest
 
 # Security: Allowed Origins
 ALLOWED_ORIGINS = [
@@ -37,9 +65,6 @@ def is_origin_allowed(origin):
 # 1. Strict CORS
 CORS(app, resources={r"/api/*": {"origins": "*"}}) # We'll enforce stricter logic in before_request
 
-# Supabase Setup
-# Supabase Setup
-# Supabase Setup
 # Supabase Setup
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_SECRET_KEY")
@@ -47,14 +72,34 @@ SUPABASE_KEY = os.environ.get("SUPABASE_SECRET_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     print("⚠️  WARNING: Supabase credentials not found. Pro user verification will FAIL.")
     print("   Please set SUPABASE_URL and SUPABASE_SECRET_KEY in backend/.env.local")
-    supabase = None
-else:
-    try:
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("✅ Connected to Supabase")
-    except Exception as e:
-        print(f"❌ Failed to connect to Supabase: {e}")
-        supabase = None
+
+supabase = None  # Created on first use by get_supabase()
+_supabase_pid = None
+_supabase_lock = threading.Lock()
+
+def get_supabase():
+    """Supabase client for this process, created on first use (None without credentials).
+
+    Lazy so importing the app stays cheap, and per process so a client made
+    before a fork (--preload master) is replaced rather than shared.
+    """
+    global supabase, _supabase_pid
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        return supabase
+    # Not yet tried in this process, or inherited from the parent over a fork
+    if _supabase_pid != os.getpid() and (supabase is None or _supabase_pid is not None):
+        with _supabase_lock:
+            if _supabase_pid != os.getpid() and (supabase is None or _supabase_pid is not None):
+                from supabase import create_client, ClientOptions
+                try:
+                    # Bounded timeout: a slow Supabase must not hang the /api/remove hot path
+                    supabase = create_client(SUPABASE_URL, SUPABASE_KEY, options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT))
+                    print("✅ Connected to Supabase")
+                except Exception as e:
+                    print(f"❌ Failed to connect to Supabase: {e}")
+                    supabase = None
+                _supabase_pid = os.getpid()
+    return supabase
 
 # Lemon Squeezy Setup
 LEMONSQUEEZY_WEBHOOK_SECRET = os.environ.get("LEMONSQUEEZY_WEBHOOK_SECRET")
@@ -67,43 +112,33 @@ def check_security():
         return
 
     origin = request.headers.get('Origin')
-    referer = request.headers.get('Referer')
     client_ip = get_client_ip()
 
-    # Skip check for Health check and Webhooks
-    if request.path == '/api/health' or request.path.startswith('/api/webhooks'):
+    # Skip check for Health/Readiness checks and Webhooks
+    if request.path in ('/api/health', '/api/ready') or request.path.startswith('/api/webhooks'):
         return
 
     # In Production: Enforce Origin/Referer
     # In Local Dev: We can be more lenient, but let's test logic
     # If Origin is present, it MUST be allowed
     if origin and not is_origin_allowed(origin):
-        # logger.warning(f"⛔ Blocked unauthorized Origin: {origin} from IP {client_ip}") 
+        print(f"⛔ Blocked unauthorized Origin: {origin} from IP {client_ip}")
         return jsonify({'error': 'Unauthorized Origin'}), 403
 
     # If no Origin (e.g. direct browser navigation or curl), check Referer
     # APIs called from fetch() usually have Origin.
     # Note: Curl/Postman can spoof this, but it stops simple browser console attacks from other sites.
 
-# Config
-UPLOAD_FOLDER = '/tmp/uploads'
-OUTPUT_FOLDER = '/tmp/outputs'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
-MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB
-TOOL_PATH = os.environ.get('WATERMARK_TOOL_PATH', '/opt/byewatermark/GeminiWatermarkTool')
-
 # Rate limiting (Redis -> In-Memory Fallback)
-rate_limit_store = {}
 FREE_LIMIT_PER_DAY = 3
 
-# Redis Setup
+# Redis Setup (from_url does not connect; the warm-up pings it, and each call
+# falls back to local state if Redis is unreachable)
 redis_client = None
 if os.environ.get('REDIS_URL'):
     try:
         import redis
         redis_client = redis.from_url(os.environ.get('REDIS_URL'))
-        redis_client.ping() # Test connection
-        print("✅ Connected to Redis")
     except Exception as e:
         print(f"⚠️ Redis connection failed: {e}")
         redis_client = None
@@ -112,106 +147,99 @@ else:
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+os.makedirs(PREVIEW_FOLDER, exist_ok=True)
+
+result_cache = ResultCache(CACHE_FOLDER, OUTPUT_FOLDER, RESULT_CACHE_MAX_BYTES)
+file_index = FileIndex(redis_client)
+# Where downloads come from: OUTPUT_FOLDER, or a bucket shared by all replicas (STORAGE_BACKEND=s3)
+storage = get_storage()
 
 def get_client_ip():
     return request.headers.get('CF-Connecting-IP', 
            request.headers.get('X-Forwarded-For', 
            request.remote_addr))
 
+rate_limiter = RateLimiter(FREE_LIMIT_PER_DAY, redis_client)
+contact_limiter = RateLimiter(CONTACT_LIMIT_PER_DAY, redis_client, prefix='contact_limit')
+
 def get_rate_limit_usage(ip):
-    today = time.strftime('%Y-%m-%d')
-    key = f"rate_limit:{ip}:{today}"
-    
-    if redis_client:
-        try:
-            val = redis_client.get(key)
-            return int(val) if val else 0
-        except Exception as e:
-            print(f"⚠️ Redis READ error: {e}")
-            pass # Fallback to memory
-            
-    return rate_limit_store.get(key, 0)
+    return rate_limiter.usage(ip)
 
 # Check User Subscription Status
-# Check User Subscription Status
+def fetch_entitlement(user_id):
+    """Read Pro status from Supabase. Returns (is_pro, pro_until); pro_until is a
+    unix timestamp for expiring Pro, None otherwise. Raises on query errors."""
+    # Check profiles table for is_pro AND pro_expires_at
+    response = get_supabase().table('profiles').select('is_pro, pro_expires_at').eq('id', user_id).execute()
+
+    if response.data and len(response.data) > 0:
+        user_data = response.data[0]
+
+        # 1. Check permanent Pro status
+        if user_data.get('is_pro'):
+            return True, None
+
+        # 2. Check temporary/expiring Pro status
+        expires_at_str = user_data.get('pro_expires_at')
+        if expires_at_str:
+            # Handle ISO format from Supabase (may contain Z or offset)
+            try:
+                # Helper to handle 'Z' if python < 3.11, though fromisoformat usually handles it in newer pythons
+                # Being safe by replacing Z with +00:00
+                expires_at = datetime.fromisoformat(expires_at_str.replace('Z', '+00:00'))
+
+                # Ensure timezone awareness for comparison
+                if expires_at.tzinfo is None:
+                    expires_at = expires_at.replace(tzinfo=timezone.utc)
+
+                now = datetime.now(timezone.utc)
+
+                if expires_at > now:
+                    return True, expires_at.timestamp()
+            except ValueError:
+                print(f"⚠️ Date parse error for user {user_id}: {expires_at_str}")
+
+    return False, None
+
+entitlements = EntitlementCache(fetch_entitlement, redis_client)
+
 def is_pro_user(user_id):
-    if not supabase or not user_id:
+    if not user_id or not get_supabase():
         return False
-    try:
-        # Check profiles table for is_pro AND pro_expires_at
-        response = supabase.table('profiles').select('is_pro, pro_expires_at').eq('id', user_id).execute()
-        
-        if response.data and len(response.data) > 0:
-            user_data = response.data[0]
-            
-            # 1. Check permanent Pro status
-            if user_data.get('is_pro'):
-                return True
-                
-            # 2. Check temporary/expiring Pro status
-            expires_at_str = user_data.get('pro_expires_at')
-            if expires_at_str:
-                # Handle ISO format from Supabase (may contain Z or offset)
-                try:
-                    # Helper to handle 'Z' if python < 3.11, though fromisoformat usually handles it in newer pythons
-                    # Being safe by replacing Z with +00:00
-                    expires_at = datetime.fromisoformat(expires_at_str.replace('Z', '+00:00'))
-                    
-                    # Ensure timezone awareness for comparison
-                    if expires_at.tzinfo is None:
-                        expires_at = expires_at.replace(tzinfo=timezone.utc)
-                        
-                    now = datetime.now(timezone.utc)
-                    
-                    if expires_at > now:
-                        return True
-                except ValueError:
-                    print(f"⚠️ Date parse error for user {user_id}: {expires_at_str}")
-                    
-    except Exception as e:
-        print(f"Supabase Check Error: {e}")
-    return False
+    return entitlements.is_pro(user_id)
 
 def check_rate_limit(ip, user_id=None):
+    """Check the limit and reserve one use in a single step.
+
+    Returns (allowed, reserved). Pro users are never reserved against; a
+    reservation must be given back with rate_limiter.refund(ip) if the
+    request ends up not producing a new result.
+    """
     # 1. If User is Pro, perform NO LIMIT check
     if user_id and is_pro_user(user_id):
-        return True # Unlimited
-
-    # 2. Else, check daily limit by IP
-    count = get_rate_limit_usage(ip)
-    return count < FREE_LIMIT_PER_DAY
+        return True, False # Unlimited
 
-def increment_rate_limit(ip):
-    today = time.strftime('%Y-%m-%d')
-    key = f"rate_limit:{ip}:{today}"
-    
-    if redis_client:
-        try:
-            redis_client.incr(key)
-            redis_client.expire(key, 86400) # Expire in 24 hours
-            return
-        except Exception as e:
-            print(f"⚠️ Redis WRITE error: {e}")
-            pass
-            
-    rate_limit_store[key] = rate_limit_store.get(key, 0) + 1
+    # 2. Else, check-and-reserve the daily limit by IP
+    allowed = rate_limiter.reserve(ip)
+    return allowed, allowed
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def cleanup_old_files():
-    """Remove files older than 1 hour"""
-    while True:
-        time.sleep(3600)
-        now = time.time()
-        for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
-            for f in os.listdir(folder):
-                path = os.path.join(folder, f)
-                if os.path.isfile(path) and now - os.path.getmtime(path) > 3600:
-                    os.remove(path)
-
-# Start cleanup thread
-threading.Thread(target=cleanup_old_files, daemon=True).start()
+def on_output_deleted(path):
+    file_id = file_id_from_output(os.path.basename(path))
+    file_index.remove(file_id)
+    # Local previews are swept with the other scratch folders; bucket copies go with their output
+    if storage.remote:
+        for kind in PREVIEW_KINDS:
+            try:
+                storage.delete(f"previews/{derivative_name(file_id, kind)}")
+            except Exception as e:
+                print(f"⚠️ Could not remove {kind} preview of {file_id} from storage: {e}")
+
+# Output expiry + disk quota (one leader per node, see janitor.py)
+janitor = Janitor(OUTPUT_FOLDER, sweep_folders=[UPLOAD_FOLDER, JOB_FOLDER, INDEX_FOLDER, PREVIEW_FOLDER, ENTITLEMENT_FOLDER], on_delete=on_output_deleted,
+                  storage=storage, on_evict=result_cache.release)
 
 # --- WEBHOOKS ---
 @app.route('/api/webhooks/lemonsqueezy', methods=['POST'])
@@ -234,51 +262,140 @@ def lemonsqueezy_webhook():
     if not hmac.compare_digest(digest, signature):
         return jsonify({'error': 'Invalid signature'}), 401
 
-    # 2. Process Event
-    data = request.json
+    # 2. Spool the event and ack at once; the consumer applies it (see webhooks.py)
+    try:
+        data = json.loads(request.data)
+    except ValueError:
+        return jsonify({'error': 'Invalid JSON'}), 400
     event_name = data.get('meta', {}).get('event_name')
-    payload = data.get('data', {}).get('attributes', {})
-    
+
     # Custom Data contains User ID
     custom_data = data.get('meta', {}).get('custom_data', {})
     user_id = custom_data.get('user_id')
 
     print(f"🔔 Webhook received: {event_name} for User {user_id}")
 
-    if not user_id or not supabase:
+    if not user_id or not get_supabase():
         print("⚠️ Missing User ID or Supabase Client")
         return jsonify({'status': 'ignored'}), 200
 
-    try:
-        if event_name == 'subscription_created' or event_name == 'subscription_updated':
-            status = payload.get('status')
-            # Active statuses: active, on_trial, past_due (usually give grace period)
-            is_active = status in ['active', 'on_trial']
-            
-            supabase.table('profiles').update({
+    # Keyed on the resource and its updated_at, so a re-signed retry is still a duplicate.
+    # A failed write returns 500 and the provider retries later.
+    queued = webhook_spool.enqueue(event_key(data, request.data), data)
+    return jsonify({'status': 'queued' if queued else 'duplicate'})
+
+def apply_webhook(event):
+    """Apply one spooled Lemon Squeezy event. Raising makes the consumer retry it."""
+    data = event['data']
+    event_name = event['event_name']
+    user_id = event['user_id']
+    payload = data.get('data', {}).get('attributes', {})
+
+    if event_name == 'subscription_created' or event_name == 'subscription_updated':
+        status = payload.get('status')
+        # Active statuses: active, on_trial, past_due (usually give grace period)
+        is_active = status in ['active', 'on_trial']
+
+        with stage('supabase'):
+            get_supabase().table('profiles').update({
                 'is_pro': is_active,
                 'subscription_id': data.get('data', {}).get('id'),
                 'customer_id': payload.get('customer_id')
             }).eq('id', user_id).execute()
-            
-            print(f"✅ User {user_id} Updated: Pro={is_active}")
 
-        elif event_name == 'subscription_cancelled' or event_name == 'subscription_expired':
-            supabase.table('profiles').update({
+        entitlements.invalidate(user_id)
+        print(f"✅ User {user_id} Updated: Pro={is_active}")
+
+    elif event_name == 'subscription_cancelled' or event_name == 'subscription_expired':
+        with stage('supabase'):
+            get_supabase().table('profiles').update({
                 'is_pro': False
             }).eq('id', user_id).execute()
-            print(f"❌ User {user_id} Cancelled Pro")
+        entitlements.invalidate(user_id)
+        print(f"❌ User {user_id} Cancelled Pro")
 
-    except Exception as e:
-        print(f"🔥 Webhook Error: {e}")
-        return jsonify({'error': str(e)}), 500
+webhook_spool = WebhookSpool(apply_webhook, redis_client=redis_client)
+Gauge('byewatermark_webhook_backlog', 'Webhook events received but not yet applied', aggregate='max',
+      fn=lambda: [({}, webhook_spool.stats()['pending'])])
 
-    return jsonify({'status': 'ok'})
+# --- CONTACT FORM ---
+EMAIL_PATTERN = re.compile(r'^[^@\s<>"]{1,64}@[^@\s<>"]+\.[^@\s<>"]+$')
+outbox = Outbox(send_contact_batch)
+Gauge('byewatermark_contact_backlog', 'Contact messages waiting to be emailed', aggregate='max',
+      fn=lambda: [({}, outbox.stats()['pending'])])
 
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({'status': 'ok'})
 
+# --- STARTUP ---
+def ping_redis():
+    if not redis_client:
+        return False
+    redis_client.ping()
+    print("✅ Connected to Redis")
+
+def ping_supabase():
+    client = get_supabase()
+    if not client:
+        return False
+    # Opens the pooled HTTPS connection the first Pro check would otherwise pay for
+    client.table('profiles').select('id').limit(1).execute()
+
+warmup = Warmup()
+warmup.add('pillow', warm_codecs, shared=True, required=True)
+warmup.add('precheck', warm_detector, shared=True)
+warmup.add('tool', tool_dry_run, shared=True, required=True)
+warmup.add('redis', ping_redis)
+warmup.add('supabase', ping_supabase)
+
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+def start_worker():
+    """Per-process start: background threads plus the warm-up steps not done yet.
+
+    Called from gunicorn's post_fork hook (see gunicorn.conf.py) and, as a
+    fallback, on the first request; threads do not survive a fork, so this
+    must run in every worker rather than at import.
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+        janitor.start()
+        webhook_spool.start()
+        outbox.start()
+        warmup.start()
+
+@app.before_request
+def ensure_worker_started():
+    start_worker()
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    is_ready, steps = warmup.report()
+    return jsonify({'ready': is_ready, 'pid': os.getpid(), 'steps': steps}), 200 if is_ready else 503
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        'preprocess': timing_stats(),
+        'result_cache': result_cache.stats(),
+        'janitor': janitor.stats(),
+        'entitlements': entitlements.stats(),
+        'admission': admission.stats(),
+        'webhooks': webhook_spool.stats(),
+        'contact_outbox': outbox.stats()
+    })
+
 @app.route('/api/remaining', methods=['GET'])
 def remaining():
     ip = get_client_ip()
@@ -288,17 +405,123 @@ def remaining():
         'limit': FREE_LIMIT_PER_DAY
     })
 
+def publish_output(file_id, output_path, republish=False):
+    """Make a finished output downloadable (from any replica with remote storage).
+
+    republish=True is for outputs handed out again (result cache hits): the
+    object is only uploaded if it is no longer in storage.
+    """
+    key = os.path.basename(output_path)
+    if not (republish and storage.remote and storage.exists(key)):
+        storage.put(key, output_path)
+    file_index.add(file_id, output_path, remote=storage.remote)
+    track_output(output_path)
+
+def publish_previews(file_id, kinds, republish=False):
+    """Upload derivatives to remote storage. Returns the kinds that can be served.
+
+    republish=True is for result cache hits: previews already swept from disk
+    are left out, the rest are kept alive as long as the re-issued output.
+    """
+    if republish:
+        available = []
+        for kind in kinds:
+            path = derivative_path(file_id, kind)
+            try:
+                os.utime(path)
+            except OSError:
+                continue
+            key = f"previews/{derivative_name(file_id, kind)}"
+            if storage.remote and not storage.exists(key):
+                storage.put(key, path)
+            available.append(kind)
+        return available
+    if storage.remote:
+        for kind in kinds:
+            storage.put(f"previews/{derivative_name(file_id, kind)}", derivative_path(file_id, kind))
+    return kinds
+
+def publish_result(result, digest, ext):
+    """Make a fresh result downloadable and cacheable. Network I/O with remote
+    storage, so callers run it after giving back their admission slot."""
+    file_id = result['download_id']
+    publish_output(file_id, os.path.join(OUTPUT_FOLDER, result['filename']))
+    publish_previews(file_id, result.get('previews', []))
+    # Only real removals: a missed watermark must not be handed out again for the same bytes
+    if result['watermark_found']:
+        result_cache.store(digest, ext, result)
+    return result
+
+# Node-wide tool capacity shared by requests, job workers and batch processes
+admission = AdmissionController()
+
+def admission_priority(user_id):
+    return PRIORITY_PRO if is_pro_user(user_id) else PRIORITY_FREE
+
+def admission_max_wait(priority):
+    return ADMISSION_MAX_WAIT_PRO if priority == PRIORITY_PRO else ADMISSION_MAX_WAIT
+
+def _run_job(payload):
+    """Job worker entry: same pipeline as the synchronous path.
+
+    The pre-check runs here rather than on the request thread, so async
+    requests return at once; a pass-through gives its reservation back.
+    """
+    consumed = False
+    try:
+        # Already accepted: queue for capacity instead of shedding
+        with admission.slot(payload['priority'], cost=payload['cost']):
+            result = process_upload(payload['input_path'], payload['ext'], payload['file_id'])
+        result = publish_result(result, payload['digest'], payload['ext'])
+        consumed = result['watermark_found']
+        return result
+    finally:
+        # Failed jobs and pass-throughs do not count against the daily limit
+        if payload['reserved'] and not consumed:
+            rate_limiter.refund(payload['ip'])
+        if os.path.exists(payload['input_path']):
+            os.remove(payload['input_path'])
+
+job_queue = JobQueue(_run_job, JobStore(redis_client), workers=JOB_WORKERS, maxsize=JOB_QUEUE_SIZE)
+
+def folder_bytes(folder):
+    total = 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    total += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+Gauge('byewatermark_job_queue_depth', 'Async jobs waiting for a worker', fn=lambda: [({}, job_queue.depth())])
+Gauge('byewatermark_admission_slots_used', 'Tool slots held node-wide', aggregate='max', fn=lambda: [({}, admission.stats()['in_flight'])])
+Gauge('byewatermark_admission_queued', 'Requests waiting for a tool slot node-wide', aggregate='max', fn=lambda: [({}, admission.stats()['queued'])])
+Gauge('byewatermark_disk_bytes', 'Bytes used by upload/output files on this node', ('folder',), aggregate='max', fn=lambda: [
+    ({'folder': 'uploads'}, folder_bytes(UPLOAD_FOLDER)),
+    ({'folder': 'outputs'}, folder_bytes(OUTPUT_FOLDER)),
+])
+
+def error_response(e):
+    response = jsonify(e.to_dict())
+    if e.retry_after:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status
+
+def wants_async():
+    # Opt-in: ?async=1, form field async=1, or RFC 7240 "Prefer: respond-async"
+    flag = request.args.get('async') or request.form.get('async')
+    if flag in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
 @app.route('/api/remove', methods=['POST'])
 def remove_watermark():
     ip = get_client_ip()
-    user_id = request.form.get('user_id') # Get User ID from Frontend
-    
-    # Check rate limit
-    if not check_rate_limit(ip, user_id):
-        return jsonify({
-            'error': 'Daily limit reached. Upgrade to Pro for unlimited access.',
-            'code': 'RATE_LIMITED'
-        }), 429
+    # Parsing the form streams the upload to UPLOAD_FOLDER; over MAX_FILE_SIZE aborts with 413
+    with stage('upload'):
+        user_id = request.form.get('user_id') # Get User ID from Frontend
     
     # Check file
     if 'file' not in request.files:
@@ -311,191 +534,343 @@ def remove_watermark():
     if not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type. Use PNG, JPG, or WebP.'}), 400
     
-    # Check file size
-    file.seek(0, 2)
-    size = file.tell()
-    file.seek(0)
-    if size > MAX_FILE_SIZE:
-        return jsonify({'error': 'File too large. Max 25MB.'}), 400
-    
+    file_id = str(uuid.uuid4())
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    input_path = os.path.join(UPLOAD_FOLDER, f"{file_id}.{ext}")
+    claim_upload(file, input_path)
+
+    reserved = False
+    consumed = False
     try:
-        # Save uploaded file
-        file_id = str(uuid.uuid4())
-        ext = file.filename.rsplit('.', 1)[1].lower()
-        
-        input_filename = f"{file_id}.{ext}"
-        input_path = os.path.join(UPLOAD_FOLDER, input_filename)
-        
-        # Save raw upload (SINGLE TIME)
-        file.save(input_path)
+        # Header-only validation: no pixel decode, hashing or quota for bad uploads
+        probe = probe_image(input_path)
+
+        # Same bytes already cleaned: hand back the existing download (no Pillow, no tool, no quota)
+        digest = hash_file(input_path)
+        cached = result_cache.lookup(digest, ext)
+        if cached:
+            publish_output(cached['download_id'], os.path.join(OUTPUT_FOLDER, cached['filename']), republish=True)
+            cached['previews'] = publish_previews(cached['download_id'], cached['previews'], republish=True)
+            cached['cached'] = True
+            return jsonify(cached)
+
+        # Load shedding: reject now rather than after a long wait (Pro gets more headroom)
+        priority = admission_priority(user_id)
+        max_wait = admission_max_wait(priority)
+
+        # No sparkle in the corner: hand the image back as is (no tool, no quota).
+        # The check and the pass-through (previews) decode the image, so they are
+        # charged against the node's slot and memory budget like a tool run.
+        # Async requests run the check in their job (see _run_job).
+        run_async = wants_async()
+        if PRECHECK and not run_async:
+            with admission.slot(priority, max_wait, probe['memory'], sample=False):
+                found = has_watermark(input_path)
+                if not found:
+                    result = process_upload(input_path, ext, file_id, watermark=False)
+            if not found:
+                return jsonify(publish_result(result, digest, ext))
+
+        # Check rate limit (reserves one use; refunded below unless a new result is produced)
+        allowed, reserved = check_rate_limit(ip, user_id)
+        if not allowed:
+            return jsonify({
+                'error': 'Daily limit reached. Upgrade to Pro for unlimited access.',
+                'code': 'RATE_LIMITED'
+            }), 429
+
+        # Async mode: hand the saved upload to the job workers and return at once.
+        # The worker owns input_path from here on (it removes it when done).
+        if run_async:
+            admission.check(priority, max_wait, probe['memory'])
+            payload = {
+                'input_path': input_path, 'ext': ext, 'file_id': file_id, 'ip': ip, 'digest': digest,
+                'reserved': reserved, 'priority': priority, 'cost': probe['memory']
+            }
+            try:
+                job_id = job_queue.submit(payload)
+            except QueueFull:
+                response = jsonify({'error': 'Server busy. Please retry shortly.', 'code': 'QUEUE_FULL'})
+                response.headers['Retry-After'] = '5'
+                return response, 503
+            # The job now owns the upload and the reservation
+            input_path = None
+            consumed = True
+            response = jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/api/jobs/{job_id}',
+                'events_url': f'/api/jobs/{job_id}/events'
+            })
+            response.headers['Location'] = f'/api/jobs/{job_id}'
+            return response, 202
 
-        # Pre-process: Fix orientation AND enforce RGB (removes Alpha/RGBA issues)
-        try:
-            from PIL import Image, ImageOps
-            
-            # Open and fix orientation
-            with Image.open(input_path) as img:
-                fixed_img = ImageOps.exif_transpose(img)
-                
-                # Force convert to RGB (drops Alpha channel, standardizes format)
-                # This fixes the "black watermark" issue if input was RGBA
-                if fixed_img.mode != 'RGB':
-                    fixed_img = fixed_img.convert('RGB')
-                
-                # Always save back to ensure standardized format (Pillow default JPEG/PNG)
-                # We reuse the input_path. If it was PNG, we might want to ensure it has .png extension,
-                # but the tool handles extensions based on file content usually, or we trust flask extension.
-                
-                # VALIDATION: Check for low resolution (thumbnail/preview images)
-                # The tool requires sufficient resolution to detect the watermark pattern accurately.
-                MIN_DIMENSION = 800
-                if fixed_img.width < MIN_DIMENSION and fixed_img.height < MIN_DIMENSION:
-                     return jsonify({
-                        'error': 'Image resolution too low for accurate removal.',
-                        'code': 'LOW_RESOLUTION',
-                        'message': 'Uploaded image is a low-quality preview (likely from Gemini App). Please upload the original high-res image.'
-                     }), 400
-
-                # OPTIMIZATION: Use Max Quality settings to prevent generation loss
-                save_kwargs = {}
-                # Check format or extension
-                is_jpeg = img.format == 'JPEG' or ext in ['jpg', 'jpeg']
-                is_webp = img.format == 'WEBP' or ext == 'webp'
-                
-                if is_jpeg:
-                    save_kwargs = {'quality': 100, 'subsampling': 0}
-                elif is_webp:
-                    save_kwargs = {'quality': 100, 'lossless': True}
-                
-                fixed_img.save(input_path, **save_kwargs)
-                
-        except Exception as e:
-            print(f"Image pre-processing failed: {e}")
-            # Fallback to raw file if Pillow fails
-        
-        # Output path
-        output_filename = f"{file_id}_clean.{ext}"
-        output_path = os.path.join(OUTPUT_FOLDER, output_filename)
-        
-        # Run the tool
-        if not os.path.exists(TOOL_PATH):
-             print(f"CRITICAL: Tool not found at {TOOL_PATH}")
-             return jsonify({'error': f'Server Config Error: Tool not found at {TOOL_PATH}'}), 500
-
-        # Run the tool
-        # Enable verbose logging only if needed for critical debugging, otherwise standard run
-        result = subprocess.run(
-            [TOOL_PATH, '-i', input_path, '-o', output_path],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
-        if result.returncode != 0:
-            print(f"TOOL FAILED: {result.stderr}")
-            return jsonify({'error': f'Tool execution failed: {result.stderr}'}), 500
-        
-        if not os.path.exists(output_path):
-            return jsonify({'error': 'Processing failed. No output generated.'}), 500
-        
-        # Increment rate limit on success
-        increment_rate_limit(ip)
+        with admission.slot(priority, max_wait, probe['memory']):
+            result = process_upload(input_path, ext, file_id, True)
+        publish_result(result, digest, ext)
+        consumed = True
         
         # Return download URL
-        return jsonify({
-            'success': True,
-            'download_id': file_id,
-            'filename': output_filename
-        })
+        return jsonify(result)
         
-    except subprocess.TimeoutExpired:
-        return jsonify({'error': 'Processing timeout. Try a smaller image.'}), 500
+    except ProcessingError as e:
+        return error_response(e)
     except Exception as e:
         print(f"CRITICAL SERVER ERROR: {e}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
     finally:
+        # Only successful new results count against the daily limit
+        if reserved and not consumed:
+            rate_limiter.refund(ip)
         # Cleanup input file
-        if os.path.exists(input_path):
+        if input_path and os.path.exists(input_path):
             os.remove(input_path)
 
+def register_batch_output(result):
+    publish_output(result['download_id'], result['path'])
+
+@app.route('/api/remove/batch', methods=['POST'])
+def remove_batch():
+    """Pro only: many images (or one ZIP) in, one streamed ZIP of cleaned images out."""
+    # Identify the caller before the body is read, so only Pro uploads get the batch byte cap.
+    # A user_id sent only as a form field still works, under the single-image cap.
+    user_id = request.args.get('user_id') or request.headers.get('X-User-Id')
+    if user_id:
+        if not is_pro_user(user_id):
+            return jsonify({'error': 'Batch processing requires Pro.', 'code': 'PRO_REQUIRED'}), 403
+        request.batch_allowed = True
+    elif not is_pro_user(request.form.get('user_id')):
+        return jsonify({'error': 'Batch processing requires Pro.', 'code': 'PRO_REQUIRED'}), 403
+
+    uploads = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not uploads:
+        return jsonify({'error': 'No file provided'}), 400
+
+    saved = []
+    for file in uploads:
+        ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'bin'
+        path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}.{ext}")
+        claim_upload(file, path)
+        saved.append({'name': secure_filename(file.filename) or f"image.{ext}", 'path': path})
+
+    try:
+        items = collect_items(saved)
+    except BatchError as e:
+        for f in saved:
+            if os.path.exists(f['path']):
+                os.remove(f['path'])
+        return jsonify({'error': str(e), 'code': 'INVALID_BATCH'}), 400
+
+    return Response(stream_with_context(stream_zip(items, register_batch_output)), mimetype='application/zip', headers={
+        'Content-Disposition': 'attachment; filename="cleaned_images.zip"',
+        'X-Accel-Buffering': 'no'
+    })
+
+def job_view(job):
+    view = {'job_id': job['id'], 'status': job['status']}
+    if job['status'] == 'done':
+        view.update(job.get('result') or {})
+    elif job['status'] == 'failed':
+        view.update(job.get('error') or {})
+    return view
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.lookup(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job_view(job))
+
+# Each open stream holds one of the worker's threads; past the cap, clients poll instead
+event_streams = threading.BoundedSemaphore(JOB_EVENT_STREAMS)
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events stream of job status changes; closes on done/failed."""
+    if not job_queue.lookup(job_id):
+        return jsonify({'error': 'Job not found or expired'}), 404
+    if not event_streams.acquire(blocking=False):
+        response = jsonify({
+            'error': 'Too many open event streams. Poll the job status instead.',
+            'code': 'STREAMS_BUSY',
+            'status_url': f'/api/jobs/{job_id}'
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+    def stream():
+        last_status = None
+        last_sent = time.time()
+        deadline = last_sent + 120
+        while time.time() < deadline:
+            job = job_queue.lookup(job_id)
+            if not job:
+                break
+            if job['status'] != last_status:
+                last_status = job['status']
+                last_sent = time.time()
+                yield f"event: status\ndata: {json.dumps(job_view(job))}\n\n"
+                if last_status in TERMINAL_STATES:
+                    return
+            elif time.time() - last_sent > 10:
+                last_sent = time.time()
+                yield ": keep-alive\n\n"
+            time.sleep(0.5)
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(event_streams.release)
+    return response
+
+@app.errorhandler(413)
+def file_too_large(e):
+    limit_mb = request.upload_limit // (1024 * 1024)
+    if request.endpoint == 'remove_batch':
+        message = f'Batch too large. Max {limit_mb}MB per request.'
+        if not request.batch_allowed:
+            message += ' Send user_id in the query string or an X-User-Id header for the Pro batch limit.'
+    else:
+        message = f'File too large. Max {limit_mb}MB.'
+    return jsonify({'error': message, 'code': 'FILE_TOO_LARGE'}), 413
+
+@app.teardown_request
+def remove_upload_parts(exc):
+    discard_unclaimed(request)
+
+@app.before_request
+def start_timings():
+    metrics.begin_request()
+
+@app.after_request
+def add_server_timing(response):
+    server_timing = metrics.end_request()
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    metrics.flush()
+    return response
+
+def file_not_found():
+    return jsonify({'error': 'File not found or expired', 'code': 'FILE_NOT_FOUND'}), 404
+
 @app.route('/api/download/<file_id>', methods=['GET'])
 def download(file_id):
-    # Find file with this ID
-    for f in os.listdir(OUTPUT_FOLDER):
-        if f.startswith(file_id):
-            path = os.path.join(OUTPUT_FOLDER, f)
-            return send_file(path, as_attachment=True, download_name=f'cleaned_{f}')
-    
-    return jsonify({'error': 'File not found or expired'}), 404
+    # Exact id lookup (no prefix matching, no directory scan)
+    try:
+        file_id = str(uuid.UUID(file_id))
+    except ValueError:
+        return file_not_found()
+
+    entry = file_index.get(file_id)
+    if not entry:
+        return file_not_found()
+
+    download_name = f"cleaned_{entry['filename']}"
+
+    # Produced on another replica: serve it from object storage
+    if entry.get('remote') and not os.path.exists(entry['path']):
+        try:
+            if S3_PRESIGN:
+                # Presigning is local; check the object is still there before redirecting to it
+                if not storage.exists(entry['filename']):
+                    file_index.remove(file_id)
+                    return file_not_found()
+                return redirect(storage.presigned_url(entry['filename'], download_name), 302)
+            body = storage.open(entry['filename'])
+        except Exception as e:
+            if not is_not_found(e):
+                raise
+            file_index.remove(file_id)
+            return file_not_found()
+
+        def stream():
+            try:
+                yield from body.iter_chunks(STORAGE_CHUNK_SIZE)
+            finally:
+                body.close()
+
+        response = Response(stream(), mimetype=entry['content_type'])
+        response.headers['Content-Length'] = str(entry['size'])
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        return response
+
+    # Offload the transfer to nginx (internal location mapped onto OUTPUT_FOLDER)
+    if DOWNLOAD_ACCEL_PREFIX:
+        response = Response(mimetype=entry['content_type'])
+        response.headers['X-Accel-Redirect'] = DOWNLOAD_ACCEL_PREFIX.rstrip('/') + '/' + entry['filename']
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        return response
+
+    # conditional=True: ETag/Last-Modified, If-None-Match/If-Modified-Since and Range support.
+    # The body goes out through wsgi.file_wrapper, which gunicorn serves with sendfile().
+    return send_file(
+        entry['path'],
+        mimetype=entry['content_type'],
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=True,
+        last_modified=entry['mtime'],
+        max_age=3600
+    )
+
+@app.route('/api/preview/<file_id>/<kind>', methods=['GET'])
+def preview(file_id, kind):
+    """Small JPEGs for the result view; the full output is only fetched on download."""
+    try:
+        file_id = str(uuid.UUID(file_id))
+    except ValueError:
+        return jsonify({'error': 'Preview not found or expired'}), 404
+    if kind not in PREVIEW_KINDS:
+        return jsonify({'error': 'Preview not found or expired'}), 404
+
+    path = derivative_path(file_id, kind)
+    if not os.path.exists(path) and storage.remote:
+        # Made on another replica: keep a local copy, it is small and asked for again
+        try:
+            body = storage.open(f"previews/{derivative_name(file_id, kind)}")
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    for chunk in body.iter_chunks(STORAGE_CHUNK_SIZE):
+                        f.write(chunk)
+            finally:
+                body.close()
+            os.replace(tmp_path, path)
+        except Exception:
+            pass
+    if not os.path.exists(path):
+        return jsonify({'error': 'Preview not found or expired'}), 404
+
+    # A download id is never reused, so its previews never change: strong ETag, immutable
+    response = send_file(path, mimetype='image/jpeg', conditional=True, etag=f"{file_id}-{kind}", max_age=OUTPUT_TTL)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/api/contact', methods=['POST'])
 def contact_form():
-    data = request.json
-    email = data.get('email')
-    subject = data.get('subject')
-    message = data.get('message')
+    data = request.get_json(silent=True) or {}
+    email = str(data.get('email') or '').strip()
+    subject = str(data.get('subject') or '').strip()
+    message = str(data.get('message') or '').strip()
 
     if not email or not message:
         return jsonify({'error': 'Email and Message are required'}), 400
+    if not EMAIL_PATTERN.match(email) or len(subject) > 200 or len(message) > CONTACT_MAX_LENGTH:
+        return jsonify({'error': 'Invalid email or message too long'}), 400
 
-    # Rate Limit Check for Contact Form (reuse IP check)
+    # Spam throttle per IP; the outbox sender enforces it again node-wide
     ip = get_client_ip()
-    # Optional: Implement strict rate limit for contact form to prevent spam
-    
-    api_key = os.environ.get('RESEND_API_KEY')
-    admin_email = os.environ.get('ADMIN_EMAIL', 'onboarding@resend.dev') # Default sender if verified
+    if not contact_limiter.reserve(ip):
+        return jsonify({'error': 'Too many messages. Please try again tomorrow.', 'code': 'RATE_LIMITED'}), 429
 
-    if api_key:
-        try:
-            import resend
-            resend.api_key = api_key
-            
-            # Email Template
-            html_content = f"""
-            <div style="font-family: sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f4f4f5;">
-              <div style="background-color: #ffffff; padding: 30px; border-radius: 12px; box-shadow: 0 4px 6px -1px rgba(0, 0, 0, 0.1), 0 2px 4px -1px rgba(0, 0, 0, 0.06);">
-                <div style="text-align: center; border-bottom: 1px solid #e5e7eb; padding-bottom: 20px; margin-bottom: 20px;">
-                    <h2 style="color: #2563eb; margin: 0; font-size: 24px;">GeminiWatermark.ai</h2>
-                    <span style="font-size: 14px; color: #6b7280;">New Contact Message</span>
-                </div>
-                
-                <div style="margin-bottom: 20px;">
-                    <p style="margin: 0; color: #6b7280; font-size: 13px; text-transform: uppercase; letter-spacing: 0.05em;">From</p>
-                    <p style="margin: 4px 0 0; color: #111827; font-weight: 600; font-size: 16px;">{email}</p>
-                </div>
-                
-                <div style="margin-bottom: 24px;">
-                    <p style="margin: 0; color: #6b7280; font-size: 13px; text-transform: uppercase; letter-spacing: 0.05em;">Subject</p>
-                    <p style="margin: 4px 0 0; color: #111827; font-weight: 600; font-size: 16px;">{subject}</p>
-                </div>
-                
-                <div style="background-color: #f9fafb; padding: 20px; border-radius: 8px; border: 1px solid #e5e7eb; color: #374151; line-height: 1.6;">
-                    {message}
-                </div>
-                
-                <div style="margin-top: 24px; text-align: center; color: #9ca3af; font-size: 12px; border-top: 1px solid #e5e7eb; padding-top: 20px;">
-                    Sent via GeminiWatermark Contact Form
-                </div>
-              </div>
-            </div>
-            """
-
-            # Send email
-            r = resend.Emails.send({
-                "from": "GeminiWatermark Contact <onboarding@resend.dev>",
-                "to": admin_email, # Send TO the admin
-                "reply_to": email,
-                "subject": f"[GeminiWatermark.ai] {subject}",
-                "html": html_content
-            })
-            return jsonify({'success': True, 'id': r.get('id')})
-        except Exception as e:
-            logger.error(f"Resend Error: {e}")
-            return jsonify({'error': 'Failed to send email'}), 500
-    else:
-        # Mock send (Log only)
-        logger.info(f"MOCK EMAIL SENT: From={email}, Subject={subject}, Message={message}")
-        return jsonify({'success': True, 'mock': True})
+    # Emailed in the background (see outbox.py); the submit never waits on the email API
+    message_id = outbox.enqueue({'email': email, 'subject': subject, 'message': message}, ip)
+    return jsonify({'success': True, 'id': message_id})
 
 if __name__ == '__main__':
     debug_mode = os.environ.get('FLASK_ENV') == 'development'
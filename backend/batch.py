@@ -0,0 +1,175 @@
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, MAX_FILE_SIZE, BATCH_MAX_FILES, BATCH_WORKERS
+from pipeline import process_batch_item
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process pool shared by all batch requests of this worker.
+
+    'spawn' children import only the pipeline modules, never app.py, and do
+    not inherit the worker's threads (janitor, job workers) the way a fork would.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+class BatchError(Exception):
+    pass
+
+
+def _ext(name):
+    return name.rsplit('.', 1)[1].lower() if '.' in name else ''
+
+
+def collect_items(files):
+    """Saved uploads -> [{'name', 'ext', 'path'}]. A single ZIP is expanded.
+
+    Items that cannot be processed (wrong type, too large) are returned with
+    an 'error' instead of a path, so they end up in the manifest.
+    """
+    items = []
+    if len(files) == 1 and _ext(files[0]['name']) == 'zip':
+        zip_path = files[0]['path']
+        try:
+            with zipfile.ZipFile(zip_path) as zf:
+                for info in zf.infolist():
+                    name = os.path.basename(info.filename)
+                    if info.is_dir() or not name or info.filename.startswith('__MACOSX/'):
+                        continue
+                    if len(items) >= BATCH_MAX_FILES:
+                        raise BatchError(f'Too many files. Max {BATCH_MAX_FILES} per batch.')
+                    items.append(_extract(zf, info, name))
+        except Exception as e:
+            # The batch is rejected: members already extracted would otherwise be orphaned
+            for item in items:
+                if 'path' in item and os.path.exists(item['path']):
+                    os.remove(item['path'])
+            if isinstance(e, zipfile.BadZipFile):
+                raise BatchError('Invalid ZIP file.')
+            raise
+        finally:
+            os.remove(zip_path)
+        return items
+
+    if len(files) > BATCH_MAX_FILES:
+        raise BatchError(f'Too many files. Max {BATCH_MAX_FILES} per batch.')
+    for f in files:
+        ext = _ext(f['name'])
+        if ext not in ALLOWED_EXTENSIONS:
+            os.remove(f['path'])
+            items.append({'name': f['name'], 'error': 'Invalid file type. Use PNG, JPG, or WebP.'})
+        elif os.path.getsize(f['path']) > MAX_FILE_SIZE:
+            os.remove(f['path'])
+            items.append({'name': f['name'], 'error': 'File too large. Max 25MB.'})
+        else:
+            items.append({'name': f['name'], 'ext': ext, 'path': f['path']})
+    return items
+
+
+def _extract(zf, info, name):
+    ext = _ext(name)
+    if ext not in ALLOWED_EXTENSIONS:
+        return {'name': name, 'error': 'Invalid file type. Use PNG, JPG, or WebP.'}
+    # Declared size is checked first; the copy below is capped too in case it lies
+    if info.file_size > MAX_FILE_SIZE:
+        return {'name': name, 'error': 'File too large. Max 25MB.'}
+    path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}.{ext}")
+    with zf.open(info) as src, open(path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, MAX_FILE_SIZE + 1)
+        too_large = dst.tell() > MAX_FILE_SIZE
+    if too_large:
+        os.remove(path)
+        return {'name': name, 'error': 'File too large. Max 25MB.'}
+    return {'name': name, 'ext': ext, 'path': path}
+
+
+class _StreamBuffer:
+    """Write-only sink for ZipFile; drained by the response generator."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _unique(name, used):
+    base, dot, ext = name.rpartition('.')
+    candidate, n = name, 1
+    while candidate in used:
+        candidate = f"{base} ({n}).{ext}" if dot else f"{name} ({n})"
+        n += 1
+    used.add(candidate)
+    return candidate
+
+
+def stream_zip(items, on_result=None):
+    """Run every item on the pool and yield a ZIP as results complete.
+
+    Cleaned files are added in completion order; a manifest.json with one
+    entry per input (ok or error) closes the archive. `on_result(result)` is
+    called for each success (e.g. to register the output for download).
+    """
+    buffer = _StreamBuffer()
+    manifest = []
+    used_names = set()
+    pool = get_pool()
+    futures = {}
+    for item in items:
+        if 'error' in item:
+            manifest.append({'name': item['name'], 'status': 'error', 'error': item['error']})
+        else:
+            futures[pool.submit(process_batch_item, item['path'], item['ext'], str(uuid.uuid4()))] = item
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zf:
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'error': f'Server error: {str(e)}'}
+
+                if 'error' in result:
+                    manifest.append(dict(result, name=item['name'], status='error'))
+                    continue
+
+                if on_result:
+                    on_result(result)
+                arcname = _unique(f"cleaned_{os.path.splitext(item['name'])[0]}.{item['ext']}", used_names)
+                zf.write(result['path'], arcname)
+                manifest.append({'name': item['name'], 'status': 'ok', 'file': arcname, 'download_id': result['download_id']})
+                yield buffer.drain()
+
+            zf.writestr('manifest.json', json.dumps(manifest, indent=2))
+        finally:
+            # Client went away or we are done: never leave uploads behind
+            for future, item in futures.items():
+                future.cancel()
+                if os.path.exists(item['path']):
+                    os.remove(item['path'])
+    yield buffer.drain()
@@ -0,0 +1,153 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from fsutil import link_or_copy
+from metrics import TOOL_RUNS, tool_in_flight
+
+
+class ToolBatcher:
+    """Coalesces concurrent tool runs into one directory-mode invocation.
+
+    Callers block in run() exactly as they would on a single subprocess call.
+    A collector thread gathers items for up to `window_ms` (or `max_items`),
+    hard-links them into a per-batch staging directory and runs
+    `TOOL -i <batch>/in -o <batch>/out` once. Each output is moved to the
+    caller's output_path. Items the batch run did not produce are retried
+    through `run_single`, each on its own thread, so a bad image only fails
+    its own request. The batch run gets the same `timeout` as a single run:
+    one image that hangs costs every caller at most that plus its own retry.
+    """
+
+    def __init__(self, tool_path, run_single, staging_folder, window_ms=50, max_items=8, timeout=60):
+        self.tool_path = tool_path
+        self.run_single = run_single
+        self.staging_folder = staging_folder
+        self.window = window_ms / 1000.0
+        self.max_items = max_items
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self._started = False
+        self._lock = threading.Lock()
+        # Stats (per process)
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if not self._started:
+                os.makedirs(self.staging_folder, exist_ok=True)
+                threading.Thread(target=self._collector, name='tool-batcher', daemon=True).start()
+                self._started = True
+
+    def run(self, input_path, output_path):
+        """Submit one item and wait for it. Raises whatever run_single raised."""
+        self._ensure_started()
+        future = Future()
+        self.queue.put((input_path, output_path, future))
+        return future.result()
+
+    def _collector(self):
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(items) < self.max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Run the batch off the collector so the next window starts collecting now
+            threading.Thread(target=self._process, args=(items,), daemon=True).start()
+
+    def _process(self, items):
+        if len(items) == 1:
+            self._run_individually(*items[0])
+            return
+
+        batch_dir = os.path.join(self.staging_folder, str(uuid.uuid4()))
+        in_dir = os.path.join(batch_dir, 'in')
+        out_dir = os.path.join(batch_dir, 'out')
+        pending = []
+        try:
+            os.makedirs(in_dir)
+            os.makedirs(out_dir)
+
+            for n, (input_path, output_path, future) in enumerate(items):
+                # Name staged inputs after the requested output extension: the tool
+                # sniffs content on read and picks the encoder from the file name.
+                name = f"{n}{os.path.splitext(output_path)[1]}"
+                try:
+                    link_or_copy(input_path, os.path.join(in_dir, name))
+                    pending.append((name, input_path, output_path, future))
+                except OSError as e:
+                    print(f"⚠️ Batch staging failed for {input_path}: {e}")
+                    self._run_fallback(input_path, output_path, future)
+
+            if not pending:
+                return
+
+            suspect = None
+            try:
+                with tool_in_flight():
+                    result = subprocess.run(
+                        [self.tool_path, '-i', in_dir, '-o', out_dir],
+                        capture_output=True,
+                        text=True,
+                        timeout=self.timeout
+                    )
+                if result.returncode != 0:
+                    TOOL_RUNS.inc(result=f'exit_{result.returncode}')
+                    print(f"⚠️ Batch tool run exited {result.returncode}: {result.stderr}")
+                else:
+                    TOOL_RUNS.inc(result='ok')
+            except subprocess.TimeoutExpired:
+                TOOL_RUNS.inc(result='timeout')
+                print(f"⚠️ Batch tool run timed out ({len(pending)} items)")
+                # Killed mid-run: the newest output may be half written, so it is redone too
+                produced = [os.path.join(out_dir, name) for name in os.listdir(out_dir)]
+                suspect = max(produced, key=os.path.getmtime, default=None)
+
+            self.batches += 1
+            self.batched_items += len(pending)
+
+            # Fan outputs back out; anything missing is retried on its own
+            for name, input_path, output_path, future in pending:
+                produced = os.path.join(out_dir, name)
+                if os.path.exists(produced) and produced != suspect:
+                    os.replace(produced, output_path)
+                    future.set_result(None)
+                else:
+                    self._run_fallback(input_path, output_path, future)
+        except Exception as e:
+            print(f"⚠️ Batch processing error: {e}")
+            for item in items:
+                if not item[2].done():
+                    self._run_fallback(*item)
+        finally:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+
+    def _run_fallback(self, input_path, output_path, future):
+        # In parallel: callers of one batch must not wait for each other's retries
+        if not future.done():
+            self.fallbacks += 1
+            threading.Thread(
+                target=self._run_individually, args=(input_path, output_path, future), daemon=True
+            ).start()
+
+    def _run_individually(self, input_path, output_path, future):
+        try:
+            self.run_single(input_path, output_path)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
@@ -0,0 +1,140 @@
+"""Accuracy and cost of the watermark pre-check.
+
+    python benchmarks/bench_detect.py --samples ~/gemini-samples
+    python benchmarks/bench_detect.py --samples ~/gemini-samples --threshold 0.3 --clean-share 0.3
+    python benchmarks/bench_detect.py --images 200   # timing only
+
+Accuracy is measured on real images: --samples points at a folder with
+`watermarked/` (images exported from Gemini, sparkle untouched) and
+`clean/` (photos, screenshots and other images that never had one). It
+reports the false-negative rate (watermarked but skipped: the user gets
+the image back unchanged), the false-positive rate (clean but sent to the
+tool), the lowest watermarked and highest clean scores, and the tool time
+saved for a traffic mix with --clean-share clean uploads at --tool-ms per
+tool run. Run it with WATERMARK_TEMPLATE_PATH set to the alpha map the
+check will use in production.
+
+The synthetic run (generated photos per size and format) only measures the
+check's cost: its sparkles are stamped with the detector's own template, so
+any hit rate it showed would say nothing about real watermarks.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from config import ALLOWED_EXTENSIONS, PRECHECK_THRESHOLD, WATERMARK_TEMPLATE_PATH
+from detect import has_watermark, watermark_score
+from fakes import stamp_sparkle
+
+SIZES = [(800, 600), (1600, 1200), (4000, 3000)]
+FORMATS = [('jpg', {'quality': 85}), ('png', {}), ('webp', {'quality': 90})]
+
+
+def make_photo(rng, size):
+    w, h = size
+    base = rng.uniform(0, 200, 3)
+    ramp = base + np.linspace(0, rng.uniform(-60, 60), w)[None, :, None] + np.linspace(0, rng.uniform(-60, 60), h)[:, None, None]
+    grain = rng.normal(0, rng.uniform(2, 20), (h, w, 3))
+    img = Image.fromarray(np.clip(ramp + grain, 0, 255).astype(np.uint8))
+    draw = ImageDraw.Draw(img)
+    for _ in range(20):
+        x, y = int(rng.uniform(0, w)), int(rng.uniform(0, h))
+        r = int(rng.uniform(10, max(w, h) / 6))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(int(v) for v in rng.uniform(0, 255, 3)))
+    return img
+
+
+def sample_files(folder):
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.rsplit('.', 1)[-1].lower() in ALLOWED_EXTENSIONS
+    )
+
+
+def accuracy(samples, threshold, clean_share, tool_ms):
+    scores = {}
+    all_ms = []
+    for label in ('watermarked', 'clean'):
+        scores[label] = []
+        for path in sample_files(os.path.join(samples, label)):
+            start = time.perf_counter()
+            score = watermark_score(path)
+            all_ms.append((time.perf_counter() - start) * 1000)
+            scores[label].append((score, os.path.basename(path)))
+    marked, clean = scores['watermarked'], scores['clean']
+    if not marked or not clean:
+        sys.exit(f"{samples} needs images in both watermarked/ and clean/")
+
+    misses = [name for score, name in marked if score < threshold]
+    false_alarms = [name for score, name in clean if score >= threshold]
+    fn_rate = len(misses) / len(marked)
+    fp_rate = len(false_alarms) / len(clean)
+    print(f"{len(marked)} watermarked, {len(clean)} clean samples")
+    print(f"lowest watermarked score {min(marked)[0]:.3f} ({min(marked)[1]}), "
+          f"highest clean score {max(clean)[0]:.3f} ({max(clean)[1]})")
+    for name in misses:
+        print(f"  missed: {name}")
+    detect_ms = statistics.mean(all_ms)
+    # Per upload: every image pays the check; clean ones caught skip the tool, missed watermarks skip it too
+    skipped = clean_share * (1 - fp_rate) + (1 - clean_share) * fn_rate
+    saved = skipped * tool_ms - detect_ms
+    print(f"\nthreshold {threshold}: false negatives {fn_rate:.1%}, false positives {fp_rate:.1%}")
+    print(f"mean check {detect_ms:.2f}ms; with {clean_share:.0%} clean uploads at {tool_ms:.0f}ms/tool run, "
+          f"{saved:.0f}ms saved per upload ({saved / tool_ms:.1%} of tool time)")
+
+
+def timing(images, seed):
+    rng = np.random.default_rng(seed)
+    folder = tempfile.mkdtemp(prefix='bench-detect-')
+    try:
+        print(f"{'format':<6} {'size':>10}  {'detect p50':>10} {'p95':>8}")
+        for size in SIZES:
+            for ext, options in FORMATS:
+                samples = []
+                for i in range(images):
+                    img = make_photo(rng, size)
+                    if i % 2 == 0:
+                        stamp_sparkle(img, rng.uniform(0.25, 0.6))
+                    path = os.path.join(folder, f"upload.{ext}")
+                    img.save(path, **options)
+                    start = time.perf_counter()
+                    has_watermark(path)
+                    samples.append((time.perf_counter() - start) * 1000)
+                samples.sort()
+                p50, p95 = statistics.median(samples), samples[int(len(samples) * 0.95)]
+                print(f"{ext:<6} {size[0]:>5}x{size[1]:<4}  {p50:>8.2f}ms {p95:>6.2f}ms")
+    finally:
+        shutil.rmtree(folder)
+    print("\nTiming only; pass --samples with real Gemini exports to measure accuracy.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', help='folder with watermarked/ and clean/ real images')
+    parser.add_argument('--images', type=int, default=60, help='synthetic images per size and format (timing run)')
+    parser.add_argument('--threshold', type=float, default=PRECHECK_THRESHOLD)
+    parser.add_argument('--clean-share', type=float, default=0.2, help='share of uploads without a watermark')
+    parser.add_argument('--tool-ms', type=float, default=1000, help='tool time per image')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if not WATERMARK_TEMPLATE_PATH:
+        print("⚠️ WATERMARK_TEMPLATE_PATH is not set: scoring against the drawn approximation\n")
+    if args.samples:
+        accuracy(args.samples, args.threshold, args.clean_share, args.tool_ms)
+    else:
+        timing(args.images, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Load and latency of the real app against a stub tool, fake Redis and fake Supabase.
+
+    python benchmarks/bench_load.py --concurrency 8 --requests 200
+    python benchmarks/bench_load.py --scenario remove --tool-latency-ms 400 --tool-cpu-ms 200
+    python benchmarks/bench_load.py --scenario remove --format png --size 4096
+
+Serves app.py on a local threaded werkzeug server and drives /api/remove,
+/api/download and /api/remaining with a fixed number of concurrent clients.
+It reports p50/p95/p99 latency, throughput and status codes. Every upload
+is unique (so it misses the result cache) and comes from its own client IP
+(so it passes the free limit). --pro-ratio sends that share with a Pro
+user id, which exercises the entitlement path.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import load_app, stamp_sparkle
+
+FORMATS = {'jpg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_image(fmt, size):
+    from PIL import Image
+    # Watermarked, so every upload goes past the pre-check to the tool
+    img = stamp_sparkle(Image.effect_noise((size, size), 64).convert('RGB'))
+    buf = io.BytesIO()
+    img.save(buf, format=FORMATS[fmt])
+    return buf.getvalue()
+
+
+def multipart(fields, filename, data):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+    )
+    parts.append(data)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Client:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def call(self, method, path, body=None, headers=None):
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers or {})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=120) as resp:
+                payload = resp.read()
+                status = resp.status
+        except urllib.error.HTTPError as e:
+            payload = e.read()
+            status = e.code
+        except Exception:
+            payload, status = b'', 'error'
+        return status, time.perf_counter() - start, payload
+
+
+def random_ip():
+    return f"10.{random.randrange(256)}.{random.randrange(256)}.{random.randrange(256)}"
+
+
+def remove_request(client, image, fmt, pro_ratio):
+    # Trailing bytes after the image end are ignored by decoders but change the hash
+    data = image + uuid.uuid4().bytes
+    fields = {'user_id': f"pro-{uuid.uuid4()}" if random.random() < pro_ratio else ''}
+    body, content_type = multipart(fields, f"bench.{fmt}", data)
+    return client.call('POST', '/api/remove', body, {'Content-Type': content_type, 'CF-Connecting-IP': random_ip()})
+
+
+def drive(label, fn, total, concurrency):
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def one(_):
+        status, seconds, _payload = fn()
+        with lock:
+            latencies.append(seconds)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    ms = [percentile(latencies, p) * 1000 for p in (50, 95, 99)]
+    codes = ' '.join(f"{code}x{n}" for code, n in sorted(statuses.items(), key=str))
+    print(f"{label:<10} c={concurrency:<3} n={total:<5} {total / elapsed:>8.1f} req/s  "
+          f"p50 {ms[0]:>8.1f}ms  p95 {ms[1]:>8.1f}ms  p99 {ms[2]:>8.1f}ms  [{codes}]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', choices=['all', 'remove', 'download', 'remaining'], default='all')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='jpg')
+    parser.add_argument('--size', type=int, default=2048, help='square upload size in pixels')
+    parser.add_argument('--pro-ratio', type=float, default=0.5, help='share of uploads sent as a Pro user')
+    parser.add_argument('--tool-latency-ms', type=float, default=200, help='stub tool idle time per image')
+    parser.add_argument('--tool-cpu-ms', type=float, default=100, help='stub tool CPU time per image')
+    parser.add_argument('--redis-latency-ms', type=float, default=0.5, help='fake Redis round trip')
+    parser.add_argument('--supabase-latency-ms', type=float, default=50, help='fake Supabase query time')
+    args = parser.parse_args()
+
+    app_module, fake_redis, fake_supabase = load_app(
+        args.redis_latency_ms, args.supabase_latency_ms, args.tool_latency_ms, args.tool_cpu_ms
+    )
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # No per-request access log
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = Client(f"http://127.0.0.1:{server.server_port}")
+    image = make_image(args.format, args.size)
+    print(f"upload {args.format} {args.size}x{args.size} ({len(image) / 1024:.0f} KB), "
+          f"tool {args.tool_latency_ms:.0f}ms idle + {args.tool_cpu_ms:.0f}ms cpu")
+
+    try:
+        if args.scenario in ('all', 'remaining'):
+            drive('remaining', lambda: client.call('GET', '/api/remaining', headers={'CF-Connecting-IP': random_ip()}),
+                  args.requests, args.concurrency)
+
+        download_ids = []
+        if args.scenario in ('all', 'remove', 'download'):
+            def remove():
+                status, seconds, payload = remove_request(client, image, args.format, args.pro_ratio)
+                if status == 200:
+                    download_ids.append(json.loads(payload)['download_id'])
+                return status, seconds, payload
+            remove_total = args.requests if args.scenario != 'download' else args.concurrency
+            drive('remove', remove, remove_total, args.concurrency)
+
+        if args.scenario in ('all', 'download') and download_ids:
+            drive('download', lambda: client.call('GET', f"/api/download/{random.choice(download_ids)}"),
+                  args.requests, args.concurrency)
+    finally:
+        server.shutdown()
+
+    print(f"fake redis: {fake_redis.commands} commands, fake supabase: {fake_supabase.queries} queries")
+
+
+if __name__ == '__main__':
+    main()
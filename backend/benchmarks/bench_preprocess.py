@@ -0,0 +1,114 @@
+"""Pillow cost of the upload path per format and size.
+
+    python benchmarks/bench_preprocess.py
+    python benchmarks/bench_preprocess.py --sizes 1200 4096 --repeat 20
+
+Times probe_image (header-only validation) and preprocess_image (passthrough or
+rewrite to the tool intermediate) on synthetic uploads: RGB JPEG/WebP/PNG, RGBA PNG
+and an EXIF-rotated JPEG. The 'q100' row is the conversion it replaced: every
+upload decoded, transposed, converted to RGB and re-encoded in its own format
+(JPEG quality 100 without subsampling, lossless WebP, PNG). Reports the median and
+p95 in milliseconds and the size of the file the tool is given.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from preprocess import preprocess_image, probe_image, EXIF_ORIENTATION
+
+CASES = [
+    # label, ext, Pillow format, mode, rotated
+    ('jpeg', 'jpg', 'JPEG', 'RGB', False),
+    ('jpeg-rot', 'jpg', 'JPEG', 'RGB', True),
+    ('webp', 'webp', 'WEBP', 'RGB', False),
+    ('png', 'png', 'PNG', 'RGB', False),
+    ('png-rgba', 'png', 'PNG', 'RGBA', False),
+]
+
+
+def make_upload(folder, ext, fmt, mode, rotated, size):
+    from PIL import Image
+    img = Image.effect_noise((size, size), 64).convert(mode)
+    kwargs = {}
+    if rotated:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 6
+        kwargs['exif'] = exif
+    path = os.path.join(folder, f"upload.{ext}")
+    img.save(path, format=fmt, **kwargs)
+    return path
+
+
+def baseline_preprocess(input_path, ext, output_path):
+    """The old upload path: full decode and max-quality re-encode of every upload."""
+    from PIL import Image, ImageOps
+    with Image.open(input_path) as img:
+        fixed_img = ImageOps.exif_transpose(img)
+        if fixed_img.mode != 'RGB':
+            fixed_img = fixed_img.convert('RGB')
+        save_kwargs = {}
+        if img.format == 'JPEG' or ext in ['jpg', 'jpeg']:
+            save_kwargs = {'quality': 100, 'subsampling': 0}
+        elif img.format == 'WEBP' or ext == 'webp':
+            save_kwargs = {'quality': 100, 'lossless': True}
+        fixed_img.save(output_path, format=img.format, **save_kwargs)
+
+
+def measure(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1200, 2048, 4096], help='square sizes in pixels')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='bench-preprocess-')
+    try:
+        print(f"{'case':<10} {'size':>6} {'upload KB':>10}  {'path':<6} {'p50':>9} {'p95':>9}  {'tool input KB':>13}")
+        for size in args.sizes:
+            for label, ext, fmt, mode, rotated in CASES:
+                path = make_upload(folder, ext, fmt, mode, rotated, size)
+                baseline_path = os.path.join(folder, f"baseline.{ext}")
+                tool_input_size = {}
+
+                def run_baseline():
+                    baseline_preprocess(path, ext, baseline_path)
+                    tool_input_size['q100'] = os.path.getsize(baseline_path)
+                    os.remove(baseline_path)
+
+                def run_preprocess():
+                    tool_input = preprocess_image(path, ext)
+                    tool_input_size['new'] = os.path.getsize(tool_input)
+                    if tool_input != path:
+                        os.remove(tool_input)
+
+                rows = [
+                    ('probe', measure(lambda: probe_image(path), args.repeat)),
+                    ('q100', measure(run_baseline, args.repeat)),
+                    ('new', measure(run_preprocess, args.repeat)),
+                ]
+                for name, (p50, p95) in rows:
+                    kb = f"{tool_input_size[name] / 1024:.0f}" if name in tool_input_size else '-'
+                    print(f"{label:<10} {size:>6} {os.path.getsize(path) / 1024:>10.0f}  {name:<6} "
+                          f"{p50:>7.2f}ms {p95:>7.2f}ms  {kb:>13}")
+                os.remove(path)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Per-request cost of the quota gate: check_rate_limit -> is_pro_user -> reserve.
+
+    python benchmarks/bench_pro_check.py
+    python benchmarks/bench_pro_check.py --redis-latency-ms 1 --supabase-latency-ms 80
+
+Runs the app's own check_rate_limit against fake Redis/Supabase with the
+given latencies. It covers free users (one reserve round trip), Pro users
+with a warm entitlement cache, and Pro users on a cold cache (one Supabase
+query each).
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import load_app
+
+
+def run(label, fn, n):
+    samples = []
+    for i in range(n):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p50, p99 = samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<14} n={n:<7} {n / (sum(samples) / 1000):>10,.0f} ops/sec  p50 {p50:>7.3f}ms  p99 {p99:>7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', type=int, default=5000, help='calls per case')
+    parser.add_argument('--redis-latency-ms', type=float, default=0.0)
+    parser.add_argument('--supabase-latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    app, fake_redis, fake_supabase = load_app(args.redis_latency_ms, args.supabase_latency_ms)
+    ips = [f"10.0.{i >> 8 & 255}.{i & 255}:{i}" for i in range(args.n)]
+
+    run('free', lambda i: app.check_rate_limit(ips[i], None), args.n)
+    app.check_rate_limit('10.9.9.9', 'pro-warm')
+    run('pro (warm)', lambda i: app.check_rate_limit(ips[i], 'pro-warm'), args.n)
+    cold_ids = [f"pro-{uuid.uuid4()}" for _ in range(args.n)]
+    run('pro (cold)', lambda i: app.check_rate_limit(ips[i], cold_ids[i]), args.n)
+    run('free refund', lambda i: app.rate_limiter.refund(ips[i]), args.n)
+
+    print(f"fake redis: {fake_redis.commands} commands, fake supabase: {fake_supabase.queries} queries")
+
+
+if __name__ == '__main__':
+    main()
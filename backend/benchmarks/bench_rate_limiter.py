@@ -0,0 +1,51 @@
+"""Rate limiter throughput and memory under many distinct IPs.
+
+    python benchmarks/bench_rate_limiter.py --ips 2000000
+    REDIS_URL=redis://localhost:6379 python benchmarks/bench_rate_limiter.py --ips 200000
+
+The in-memory fallback is always measured; the Redis path (one Lua
+round trip per reserve) only when REDIS_URL is set.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rate_limiter import RateLimiter
+
+
+def run(limiter, ips, label):
+    start = time.perf_counter()
+    for n in range(ips):
+        limiter.reserve(f"10.{(n >> 16) & 255}.{(n >> 8) & 255}.{n & 255}:{n >> 24}")
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {ips:>10,} reserves  {ips / elapsed:>12,.0f} ops/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ips', type=int, default=2000000, help='distinct client IPs to simulate')
+    parser.add_argument('--max-keys', type=int, default=100000, help='in-memory store cap')
+    args = parser.parse_args()
+
+    run(RateLimiter(3, max_keys=args.max_keys), args.ips, 'memory')
+
+    # Separate pass for memory: tracemalloc itself slows allocation down
+    tracemalloc.start()
+    limiter = RateLimiter(3, max_keys=args.max_keys)
+    run(limiter, args.ips, '(traced)')
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{'':<10} {len(limiter.memory):>10,} keys kept  {current / 1024 / 1024:>8.1f} MB live  {peak / 1024 / 1024:>8.1f} MB peak")
+
+    if os.environ.get('REDIS_URL'):
+        import redis
+        client = redis.from_url(os.environ['REDIS_URL'])
+        run(RateLimiter(3, client), args.ips, 'redis')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Region mode against the full-image path, per output format and size.
+
+    python benchmarks/bench_region.py
+    python benchmarks/bench_region.py --tool /opt/byewatermark/GeminiWatermarkTool --sizes 4096
+
+Both paths produce the same output file. The full-image path hands the upload
+(or its preprocess rewrite) to the tool. Region mode decodes the whole upload in
+the worker, sends only the corner tile to the tool, pastes the result back and
+re-encodes the whole image with Pillow. The tool input shrinks, but the worker's
+full decode and re-encode do not go away.
+
+Without --tool, the tool is modelled as the least any image tool has to do:
+decode its input and encode an output of the same format (lossless settings).
+That is a lower bound for the real tool, so the "saved" column is the most
+region mode can lose. Run it with --tool on a node with the binary to see
+the real difference. Reports median milliseconds per image.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from preprocess import preprocess_image
+from region import OUTPUT_FORMATS, process_region, region_box
+
+CASES = [
+    # label, ext, Pillow format, save options for the upload
+    ('jpeg', 'jpg', 'JPEG', {'quality': 90}),
+    ('png', 'png', 'PNG', {}),
+    ('webp', 'webp', 'WEBP', {'quality': 90}),
+]
+
+
+def make_upload(folder, ext, fmt, options, size):
+    """Photo-like content: a gradient with mild noise (pure noise would not compress at all)."""
+    from PIL import Image, ImageChops
+    width, height = size * 3 // 2, size
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 12)
+    img = Image.merge('RGB', (gradient, ImageChops.add(gradient, noise, scale=2), noise))
+    path = os.path.join(folder, f"upload.{ext}")
+    img.save(path, format=fmt, **options)
+    return path
+
+
+def model_tool(input_path, output_path):
+    from PIL import Image
+    ext = os.path.splitext(output_path)[1].lstrip('.').lower()
+    pil_format, save_kwargs = OUTPUT_FORMATS.get(ext, ('BMP', {}))
+    with Image.open(input_path) as img:
+        img.convert('RGB').save(output_path, format=pil_format, **save_kwargs)
+
+
+def binary_tool(tool_path):
+    def run(input_path, output_path):
+        subprocess.run([tool_path, '-i', input_path, '-o', output_path], capture_output=True, check=True)
+    return run
+
+
+def measure(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2048, 4096], help='image heights; width is 1.5x')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tool', help='GeminiWatermarkTool binary (default: Pillow decode + encode model)')
+    args = parser.parse_args()
+    tool = binary_tool(args.tool) if args.tool else model_tool
+
+    folder = tempfile.mkdtemp(prefix='bench-region-')
+    output = os.path.join(folder, 'out')
+    try:
+        print(f"{'case':<6} {'size':>11} {'tool px':>8}  {'full':>9} {'region':>9} {'saved':>9}")
+        for size in args.sizes:
+            for label, ext, fmt, options in CASES:
+                path = make_upload(folder, ext, fmt, options, size)
+                out_path = f"{output}.{ext}"
+
+                def full():
+                    tool_input = preprocess_image(path, ext)
+                    try:
+                        tool(tool_input, out_path)
+                    finally:
+                        if tool_input != path:
+                            os.remove(tool_input)
+
+                def region():
+                    if not process_region(path, ext, out_path, tool):
+                        raise SystemExit(f"{size}px is too small for region mode")
+
+                width = size * 3 // 2
+                left, top, right, bottom = region_box(width, size)
+                share = (right - left) * (bottom - top) / (width * size)
+                full_ms = measure(full, args.repeat)
+                region_ms = measure(region, args.repeat)
+                print(f"{label:<6} {width:>5}x{size:<5} {share:>7.0%}  {full_ms:>7.0f}ms {region_ms:>7.0f}ms "
+                      f"{full_ms - region_ms:>7.0f}ms")
+                os.remove(path)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
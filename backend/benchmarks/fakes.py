@@ -0,0 +1,257 @@
+"""In-process stand-ins for Redis, Supabase and GeminiWatermarkTool.
+
+Benchmarks call load_app() instead of importing app directly. It installs the
+fakes before app.py runs its module-level setup, so the real routes,
+rate limiter, entitlement cache and pipeline are measured with controllable
+dependency latency.
+"""
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(BACKEND)
+
+
+class FakeRedis:
+    """The subset of redis-py the app uses, with a fixed per-command delay."""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.data = {}
+        self.expires = {}
+        self._mutex = threading.Lock()
+        self.commands = 0
+
+    def _tick(self):
+        self.commands += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _live(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.time():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def ping(self):
+        self._tick()
+        return True
+
+    def get(self, key):
+        self._tick()
+        with self._mutex:
+            value = self._live(key)
+        return value.encode() if isinstance(value, str) else value
+
+    def set(self, key, value, ex=None, nx=False):
+        self._tick()
+        with self._mutex:
+            if nx and self._live(key) is not None:
+                return None
+            self._set(key, value, ex)
+        return True
+
+    def _set(self, key, value, ex=None):
+        self.data[key] = value
+        if ex:
+            self.expires[key] = time.time() + ex
+        else:
+            self.expires.pop(key, None)
+
+    def delete(self, *keys):
+        self._tick()
+        with self._mutex:
+            return sum(self.data.pop(k, None) is not None for k in keys)
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+    def lock(self, name, timeout=None):
+        return _FakeLock(self, name, timeout)
+
+    def register_script(self, script):
+        from rate_limiter import RESERVE_SCRIPT, REFUND_SCRIPT
+        handlers = {RESERVE_SCRIPT: self._reserve, REFUND_SCRIPT: self._refund}
+        handler = handlers[script]
+
+        def call(keys=(), args=(), client=None):
+            self._tick()  # One round trip, like EVALSHA
+            with self._mutex:
+                return handler(keys, args)
+        return call
+
+    def _reserve(self, keys, args):
+        current = int(self._live(keys[0]) or 0)
+        if current >= int(args[0]):
+            return [0, current]
+        current += 1
+        self.data[keys[0]] = str(current)
+        if current == 1:
+            self.expires[keys[0]] = time.time() + int(args[1])
+        return [1, current]
+
+    def _refund(self, keys, args):
+        current = int(self._live(keys[0]) or 0)
+        if current > 0:
+            current -= 1
+            self.data[keys[0]] = str(current)
+        return current
+
+
+class _FakePipeline:
+    """WATCH/MULTI/EXEC for one key at a time; EXEC fails if the key changed."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.watched = None
+        self.queued = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+
+    def reset(self):
+        self.watched = None
+        self.queued = []
+
+    def watch(self, key):
+        self.watched = (key, self.redis.get(key))
+
+    def unwatch(self):
+        self.watched = None
+
+    def get(self, key):
+        return self.redis.get(key)
+
+    def multi(self):
+        self.queued = []
+
+    def set(self, *args, **kwargs):
+        self.queued.append((args, kwargs))
+
+    def execute(self):
+        from redis.exceptions import WatchError
+        with self.redis._mutex:
+            if self.watched:
+                key, seen = self.watched
+                value = self.redis._live(key)
+                if (value.encode() if isinstance(value, str) else value) != seen:
+                    self.reset()
+                    raise WatchError()
+            results = []
+            for args, kwargs in self.queued:
+                self.redis._set(*args, **kwargs)
+                results.append(True)
+        self.reset()
+        return results
+
+
+class _FakeLock:
+    """redis-py Lock stand-in: a key set with nx and a timeout."""
+
+    def __init__(self, redis, name, timeout):
+        self.redis = redis
+        self.name = name
+        self.timeout = timeout
+
+    def acquire(self, blocking=True):
+        return bool(self.redis.set(self.name, 'locked', ex=self.timeout, nx=True))
+
+    def release(self):
+        self.redis.delete(self.name)
+
+
+class _FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.user_id = None
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def update(self, *args, **kwargs):
+        return self
+
+    def eq(self, column, value):
+        self.user_id = value
+        return self
+
+    def limit(self, count):
+        return self
+
+    def execute(self):
+        self.client.queries += 1
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        is_pro = str(self.user_id).startswith(self.client.pro_prefix)
+        return type('Response', (), {'data': [{'is_pro': is_pro, 'pro_expires_at': None}]})()
+
+
+class FakeSupabase:
+    """profiles lookups only: user ids starting with `pro_prefix` are Pro."""
+
+    def __init__(self, latency_ms=0.0, pro_prefix='pro-'):
+        self.latency = latency_ms / 1000.0
+        self.pro_prefix = pro_prefix
+        self.queries = 0
+
+    def table(self, name):
+        return _FakeQuery(self, name)
+
+
+def install_stub_tool(latency_ms=0.0, cpu_ms=0.0):
+    """Point WATERMARK_TOOL_PATH at stub_tool.py. Must run before config is imported."""
+    folder = tempfile.mkdtemp(prefix='stub-tool-')
+    path = os.path.join(folder, 'GeminiWatermarkTool')
+    stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_tool.py')
+    with open(path, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{stub}" "$@"\n')
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ['WATERMARK_TOOL_PATH'] = path
+    os.environ['STUB_TOOL_LATENCY_MS'] = str(latency_ms)
+    os.environ['STUB_TOOL_CPU_MS'] = str(cpu_ms)
+    return path
+
+
+def load_app(redis_latency_ms=0.0, supabase_latency_ms=0.0, tool_latency_ms=0.0, tool_cpu_ms=0.0):
+    """Import app.py wired to the fakes. Returns (app module, FakeRedis, FakeSupabase)."""
+    if 'app' in sys.modules:
+        raise RuntimeError('load_app() must run before anything imports app')
+    install_stub_tool(tool_latency_ms, tool_cpu_ms)
+
+    import redis
+    import supabase
+    fake_redis = FakeRedis(redis_latency_ms)
+    fake_supabase = FakeSupabase(supabase_latency_ms)
+    redis.from_url = lambda url, **kwargs: fake_redis
+    supabase.create_client = lambda url, key, options=None: fake_supabase
+    os.environ.update({
+        'REDIS_URL': 'redis://fake',
+        'SUPABASE_URL': 'https://fake.supabase.co',
+        'SUPABASE_SECRET_KEY': 'fake',
+    })
+    os.environ.pop('DOWNLOAD_ACCEL_PREFIX', None)
+
+    import app
+    return app, fake_redis, fake_supabase
+
+
+def stamp_sparkle(img, opacity=0.5):
+    """Blend a white sparkle into the corner where Gemini puts it, so the pre-check finds it."""
+    import numpy as np
+    from PIL import Image
+    from detect import draw_sparkle, logo_box
+
+    left, top, right, bottom = logo_box(*img.size)
+    alpha = (draw_sparkle(right - left) * opacity)[..., None]
+    corner = np.asarray(img.crop((left, top, right, bottom)), dtype=np.float32)
+    img.paste(Image.fromarray((corner * (1 - alpha) + 255 * alpha).astype(np.uint8)), (left, top))
+    return img
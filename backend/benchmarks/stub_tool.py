@@ -0,0 +1,49 @@
+"""Stand-in for GeminiWatermarkTool: same CLI, no watermark removal.
+
+    stub_tool.py -i INPUT -o OUTPUT      (files or directories, like the real tool)
+
+STUB_TOOL_LATENCY_MS sleeps and STUB_TOOL_CPU_MS busy-loops per image, to
+model an idle wait and the tool's CPU cost separately. Output is a copy of
+the input, re-encoded with Pillow when the extensions differ.
+"""
+import os
+import shutil
+import sys
+import time
+
+
+def burn(ms):
+    deadline = time.perf_counter() + ms / 1000.0
+    x = 0
+    while time.perf_counter() < deadline:
+        x += 1
+
+
+def convert(src, dst):
+    time.sleep(float(os.environ.get('STUB_TOOL_LATENCY_MS', 0)) / 1000.0)
+    burn(float(os.environ.get('STUB_TOOL_CPU_MS', 0)))
+    if os.path.splitext(src)[1].lower() == os.path.splitext(dst)[1].lower():
+        shutil.copyfile(src, dst)
+        return
+    from PIL import Image
+    with Image.open(src) as img:
+        img.convert('RGB').save(dst)
+
+
+def main(argv):
+    args = dict(zip(argv[::2], argv[1::2]))
+    src, dst = args.get('-i'), args.get('-o')
+    if not src or not dst:
+        print('usage: stub_tool.py -i INPUT -o OUTPUT', file=sys.stderr)
+        return 2
+    if os.path.isdir(src):
+        os.makedirs(dst, exist_ok=True)
+        for name in sorted(os.listdir(src)):
+            convert(os.path.join(src, name), os.path.join(dst, name))
+    else:
+        convert(src, dst)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,222 @@
+"""Offline bulk cleaning with the same pipeline as /api/remove.
+
+    python cli.py /data/archive /data/cleaned --workers 8
+    python cli.py images.tar.gz /data/cleaned
+
+SOURCE is a directory (walked recursively) or a tarball. Cleaned images
+keep their relative path under DEST. Every finished file is appended to
+DEST/manifest.jsonl; rerunning the same command skips files already in it
+(use --retry-failed to redo the ones that errored).
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from config import ALLOWED_EXTENSIONS
+from errors import ProcessingError
+from fsutil import link_or_copy
+from pipeline import clean_image
+from preprocess import probe_image
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def _ext(name):
+    return name.rsplit('.', 1)[1].lower() if '.' in name else ''
+
+
+def iter_sources(source, scratch):
+    """Yield (relative_path, size, stage) for every image in a directory or tarball.
+
+    stage() copies the image into `scratch` and returns that path, so workers
+    never write intermediates into the source tree. Tar members are only
+    extracted when staged.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if _ext(name) not in ALLOWED_EXTENSIONS:
+                    continue
+                path = os.path.join(root, name)
+                rel = os.path.relpath(path, source)
+
+                def stage(path=path, name=name):
+                    staged = os.path.join(scratch, f"{uuid.uuid4()}.{_ext(name)}")
+                    link_or_copy(path, staged)
+                    return staged
+
+                yield rel, os.path.getsize(path), stage
+        return
+
+    with tarfile.open(source, 'r:*') as tar:
+        for member in tar:
+            if not member.isfile() or _ext(member.name) not in ALLOWED_EXTENSIONS:
+                continue
+
+            def stage(member=member):
+                staged = os.path.join(scratch, f"{uuid.uuid4()}.{_ext(member.name)}")
+                with tar.extractfile(member) as src, open(staged, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                return staged
+
+            rel = os.path.normpath(member.name).lstrip('/')
+            if rel.startswith('..'):
+                continue  # Never write outside DEST
+            yield rel, member.size, stage
+
+
+def load_manifest(path, retry_failed=False):
+    """Relative paths already finished by a previous run."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from an interrupted run
+            if record.get('status') == 'ok' or not retry_failed:
+                done.add(record['path'])
+            else:
+                done.discard(record['path'])
+    return done
+
+
+def trim_torn_line(path):
+    """Cut a partial last line left by an interrupted run, so appends start on a fresh line."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        # Records are small, so the last newline is near the end
+        start = size
+        while start > 0:
+            start = max(0, start - 64 * 1024)
+            f.seek(start)
+            end = f.read(size - start).rfind(b'\n')
+            if end >= 0:
+                f.truncate(start + end + 1)
+                return
+        f.truncate(0)
+
+
+def clean_one(staged, ext, output_path):
+    """Pool worker: validate, clean, remove the staged copy. Never raises."""
+    start = time.perf_counter()
+    try:
+        probe_image(staged)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        found = clean_image(staged, ext, output_path)
+        record = {'status': 'ok', 'watermark_found': found}
+    except ProcessingError as e:
+        record = dict(e.to_dict(), status='error')
+    except Exception as e:
+        record = {'status': 'error', 'error': str(e)}
+    finally:
+        if os.path.exists(staged):
+            os.remove(staged)
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+class Progress:
+    def __init__(self, interval):
+        self.interval = interval
+        self.start = self.last = time.perf_counter()
+        self.ok = self.failed = self.skipped = 0
+        self.bytes = 0
+
+    def add(self, record, size):
+        if record['status'] == 'ok':
+            self.ok += 1
+        else:
+            self.failed += 1
+        self.bytes += size
+        if time.perf_counter() - self.last >= self.interval:
+            self.report()
+
+    def report(self, final=False):
+        self.last = time.perf_counter()
+        elapsed = max(self.last - self.start, 1e-9)
+        done = self.ok + self.failed
+        print(
+            f"{'done' if final else 'progress'}: {done} processed ({self.ok} ok, {self.failed} failed, "
+            f"{self.skipped} skipped)  {done / elapsed:.2f} images/sec  "
+            f"{self.bytes / elapsed / (1024 * 1024):.2f} MB/sec  {elapsed:.0f}s",
+            flush=True
+        )
+
+
+def run(source, dest, workers=None, retry_failed=False, report_every=5.0):
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(dest, exist_ok=True)
+    manifest_path = os.path.join(dest, MANIFEST_NAME)
+    done = load_manifest(manifest_path, retry_failed)
+    trim_torn_line(manifest_path)
+    progress = Progress(report_every)
+    scratch = tempfile.mkdtemp(prefix='bulk-')
+    pending = {}
+
+    def finish(rel, size, record):
+        record = dict(record, path=rel)
+        manifest.write(json.dumps(record) + '\n')
+        manifest.flush()
+        progress.add(record, size)
+
+    def collect(futures):
+        for future in futures:
+            rel, size = pending.pop(future)
+            finish(rel, size, future.result())
+
+    try:
+        with open(manifest_path, 'a') as manifest, ProcessPoolExecutor(max_workers=workers) as pool:
+            # Bounded in-flight work: staged copies never pile up in scratch
+            max_pending = workers * 4
+            for rel, size, stage in iter_sources(source, scratch):
+                if rel in done:
+                    progress.skipped += 1
+                    continue
+                if len(pending) >= max_pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                try:
+                    staged = stage()
+                except Exception as e:
+                    # Vanished or unreadable source: record it and keep going, like clean_one
+                    finish(rel, size, {'status': 'error', 'error': f'Could not read source: {e}', 'seconds': 0})
+                    continue
+                future = pool.submit(clean_one, staged, _ext(rel), os.path.join(dest, rel))
+                pending[future] = (rel, size)
+            collect(wait(pending).done)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    progress.report(final=True)
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='directory or tarball of images')
+    parser.add_argument('dest', help='output directory (manifest.jsonl goes here)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--retry-failed', action='store_true', help='redo files that failed in a previous run')
+    parser.add_argument('--report-every', type=float, default=5.0, help='seconds between progress lines')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+    progress = run(args.source, args.dest, args.workers, args.retry_failed, args.report_every)
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
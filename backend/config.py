@@ -0,0 +1,146 @@
+import os
+
+# Shared settings for the API, the job workers and the processing pipeline.
+# Read once at import time; app.py loads .env / .env.local before importing this.
+
+# Scratch (uploads, tool intermediates, tool batch dirs): 'tmpfs' keeps it in RAM under /dev/shm
+SCRATCH_BACKEND = os.environ.get('SCRATCH_BACKEND', 'local')
+SCRATCH_ROOT = '/dev/shm/byewatermark' if SCRATCH_BACKEND == 'tmpfs' and os.path.isdir('/dev/shm') else '/tmp'
+UPLOAD_FOLDER = os.path.join(SCRATCH_ROOT, 'uploads')
+OUTPUT_FOLDER = '/tmp/outputs'
+JOB_FOLDER = '/tmp/jobs'
+BATCH_FOLDER = os.path.join(SCRATCH_ROOT, 'batches')
+CACHE_FOLDER = '/tmp/cache'
+INDEX_FOLDER = '/tmp/index'
+JANITOR_FOLDER = '/tmp/janitor'
+METRICS_FOLDER = '/tmp/metrics'
+PREVIEW_FOLDER = '/tmp/previews'
+INDEX_TTL = 2 * 3600  # Outlives the 1 hour output retention
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
+MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB
+MIN_DIMENSION = 800
+TOOL_PATH = os.environ.get('WATERMARK_TOOL_PATH', '/opt/byewatermark/GeminiWatermarkTool')
+TOOL_TIMEOUT = 60
+
+# Format the tool reads when an upload has to be rewritten: bmp, ppm or png (compress_level=0)
+PREPROCESS_INTERMEDIATE = os.environ.get('PREPROCESS_INTERMEDIATE', 'bmp').lower()
+
+# Large images: run the tool on the bottom-right tile only and composite it back. The worker still
+# decodes and re-encodes the whole image; only the tool's input shrinks. benchmarks/bench_region.py
+# shows a gain for JPEG and none for PNG/WebP, where the full lossless re-encode dominates.
+REGION_MODE = os.environ.get('REGION_MODE', '1') == '1'
+REGION_FORMATS = set(os.environ.get('REGION_FORMATS', 'jpg,jpeg').lower().split(','))
+
+# Watermark pre-check: no tool run (and no quota) when the sparkle is not in the corner.
+# The score is the best normalized correlation with the sparkle template; below the threshold = clean.
+# Alpha map of the sparkle (grayscale, white = opaque). The drawn fallback is only an approximation of
+# the real asset, so the check is off by default unless the template is configured.
+WATERMARK_TEMPLATE_PATH = os.environ.get('WATERMARK_TEMPLATE_PATH')
+PRECHECK = os.environ.get('PRECHECK', '1' if WATERMARK_TEMPLATE_PATH else '0') == '1'
+PRECHECK_THRESHOLD = float(os.environ.get('PRECHECK_THRESHOLD', 0.25))
+
+# Async job mode (/api/remove?async=1)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 32))
+JOB_TTL = 3600  # Same retention as outputs
+# A queued/processing job not updated for this long (or whose worker process is gone) is failed
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 1800))
+# Open /api/jobs/<id>/events streams per gunicorn worker; each holds a thread, so keep it
+# well under the worker's thread count. Clients over the cap get 503 and poll instead.
+JOB_EVENT_STREAMS = int(os.environ.get('JOB_EVENT_STREAMS', 1))
+
+# Micro-batching of tool runs (0 = off, every request runs the tool on its own)
+TOOL_BATCH_WINDOW_MS = int(os.environ.get('TOOL_BATCH_WINDOW_MS', 0))
+TOOL_BATCH_MAX = int(os.environ.get('TOOL_BATCH_MAX', 8))
+
+# Content-addressed result cache (0 = off)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+
+# Downloads: set to an nginx `internal` location (e.g. /protected-outputs/) to offload via X-Accel-Redirect
+DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX')
+
+# Result-view derivatives, made while the cleaned image is decoded anyway: a downscaled preview
+# and thumbnail, plus before/after crops of the watermark corner (JPEG, served by /api/preview)
+PREVIEWS = os.environ.get('PREVIEWS', '1') == '1'
+PREVIEW_MAX_SIZE = int(os.environ.get('PREVIEW_MAX_SIZE', 1280))
+THUMB_MAX_SIZE = 320
+PREVIEW_QUALITY = 82
+
+# Where finished outputs are served from: 'local' (OUTPUT_FOLDER, one node) or 's3' (shared by all
+# replicas; any S3-compatible store via S3_ENDPOINT_URL, credentials from the usual AWS_* variables)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+S3_BUCKET = os.environ.get('S3_BUCKET')
+S3_PREFIX = os.environ.get('S3_PREFIX', 'outputs/')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+S3_REGION = os.environ.get('S3_REGION')
+S3_PART_SIZE = int(os.environ.get('S3_PART_SIZE', 8 * 1024 * 1024))  # Multipart above this (S3 minimum: 5MB)
+# Downloads of objects not on this node: 302 to a presigned URL, or stream through the worker
+S3_PRESIGN = os.environ.get('S3_PRESIGN', '1') == '1'
+S3_PRESIGN_TTL = int(os.environ.get('S3_PRESIGN_TTL', 300))
+
+# Output retention: TTL plus a hard ceiling on OUTPUT_FOLDER (0 = half of the volume)
+OUTPUT_TTL = 3600
+OUTPUT_MAX_BYTES = int(os.environ.get('OUTPUT_MAX_BYTES', 0))
+JANITOR_INTERVAL = int(os.environ.get('JANITOR_INTERVAL', 10))
+
+# Pro entitlement cache (seconds). Pro answers never outlive pro_expires_at.
+ENTITLEMENT_TTL = int(os.environ.get('ENTITLEMENT_TTL', 300))
+ENTITLEMENT_NEGATIVE_TTL = int(os.environ.get('ENTITLEMENT_NEGATIVE_TTL', 60))
+# Without Redis, per-user invalidation markers shared by the workers on a node
+ENTITLEMENT_FOLDER = os.environ.get('ENTITLEMENT_FOLDER', '/tmp/entitlements')
+SUPABASE_TIMEOUT = float(os.environ.get('SUPABASE_TIMEOUT', 3))
+
+# /api/remove/batch (Pro): many files or one ZIP, processed on a process pool
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 100))
+BATCH_MAX_BYTES = int(os.environ.get('BATCH_MAX_BYTES', 500 * 1024 * 1024))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))
+
+
+
+def _memory_limit():
+    """Container memory limit (cgroup v2, then v1), else physical memory."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value.isdigit() and int(value) < 1 << 60:
+                return int(value)
+        except OSError:
+            pass
+    return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+
+# Lemon Squeezy webhooks: acked once spooled to disk, applied in the background with retries.
+# WEBHOOK_FOLDER must be a persistent volume (docker-compose mounts one) to keep unapplied events
+# across container restarts. With several replicas set REDIS_URL: dedup and per-user ordering are shared there.
+WEBHOOK_FOLDER = os.environ.get('WEBHOOK_FOLDER', '/tmp/webhooks')
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 10))
+WEBHOOK_RETRY_BASE = 2.0  # Seconds; doubles per attempt
+WEBHOOK_RETRY_MAX = 600
+WEBHOOK_DEDUP_TTL = 3 * 24 * 3600  # Provider retries stop well before this
+
+# Contact form: messages are spooled to OUTBOX_FOLDER and emailed in batches by a background sender.
+# Like WEBHOOK_FOLDER, put it on a persistent volume to keep unsent mail across restarts.
+OUTBOX_FOLDER = os.environ.get('OUTBOX_FOLDER', '/tmp/outbox')
+OUTBOX_BATCH_SIZE = 50  # Resend accepts up to 100 emails per batch call
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_BASE = 5.0  # Seconds; doubles per attempt
+OUTBOX_RETRY_MAX = 1800
+CONTACT_LIMIT_PER_DAY = int(os.environ.get('CONTACT_LIMIT_PER_DAY', 5))  # Messages per IP
+CONTACT_MAX_LENGTH = 5000  # Characters in the message body
+
+
+# Admission control: node-wide cap on concurrent tool work, shared by all workers
+ADMISSION_FOLDER = '/tmp/admission'
+ADMISSION_SLOTS = int(os.environ.get('ADMISSION_SLOTS', 0)) or os.cpu_count() or 1
+# Decoded-pixel memory all running jobs may hold at once (0 = half of the container's memory).
+# Each job is charged its estimated peak from the image header; an image that alone
+# needs EXCLUSIVE_FRACTION of the budget runs by itself.
+ADMISSION_MEMORY_BYTES = int(os.environ.get('ADMISSION_MEMORY_BYTES', 0)) or _memory_limit() // 2
+EXCLUSIVE_FRACTION = 0.5
+# Decompression-bomb guard, checked from the header (also set as Pillow's MAX_IMAGE_PIXELS)
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 150_000_000))
+# Reject with 503 once the predicted queue wait exceeds this (seconds); Pro waits longer.
+# A queued request gives up after twice its limit, which keeps it inside gunicorn's 120s timeout
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 10))
+ADMISSION_MAX_WAIT_PRO = float(os.environ.get('ADMISSION_MAX_WAIT_PRO', 30))
@@ -0,0 +1,80 @@
+import os
+
+from config import PREVIEW_FOLDER, PREVIEW_MAX_SIZE, THUMB_MAX_SIZE, PREVIEW_QUALITY
+from detect import logo_box
+from metrics import stage
+from preprocess import read_orientation
+
+KINDS = ('preview', 'thumb', 'before', 'after')
+
+
+def derivative_name(file_id, kind):
+    return f"{file_id}_{kind}.jpg"
+
+
+def derivative_path(file_id, kind, folder=PREVIEW_FOLDER):
+    return os.path.join(folder, derivative_name(file_id, kind))
+
+
+def corner_box(width, height):
+    """The watermark logo plus its margin, out to the bottom-right edges."""
+    left, top, right, bottom = logo_box(width, height)
+    margin = width - right
+    return (max(0, left - margin), max(0, top - margin), width, height)
+
+
+def _fit(size, max_size):
+    width, height = size
+    scale = min(1.0, max_size / max(width, height))
+    return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+
+def _save(img, path):
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    tmp_path = path + '.tmp'
+    img.save(tmp_path, format='JPEG', quality=PREVIEW_QUALITY)
+    os.replace(tmp_path, path)
+
+
+def write_derivatives(file_id, cleaned, before=None, folder=PREVIEW_FOLDER):
+    """Write the derivatives of an in-memory, display-oriented cleaned image.
+
+    `before` is any bottom-right-aligned crop of the upload that contains
+    corner_box (region mode passes its tile); without it (nothing was
+    removed) no corner pair is written. Returns the kinds written.
+    """
+    from PIL import Image
+
+    os.makedirs(folder, exist_ok=True)
+    with stage('preview'):
+        # reducing_gap: shrink by an integer factor first, then resample the small image
+        preview = cleaned.resize(_fit(cleaned.size, PREVIEW_MAX_SIZE), Image.LANCZOS, reducing_gap=3.0)
+        _save(preview, derivative_path(file_id, 'preview', folder))
+        _save(preview.resize(_fit(preview.size, THUMB_MAX_SIZE), Image.LANCZOS), derivative_path(file_id, 'thumb', folder))
+        if before is None:
+            return ['preview', 'thumb']
+        width, height = cleaned.size
+        left, top, right, bottom = corner_box(width, height)
+        dx, dy = width - before.width, height - before.height
+        _save(before.crop((left - dx, top - dy, right - dx, bottom - dy)), derivative_path(file_id, 'before', folder))
+        _save(cleaned.crop((left, top, right, bottom)), derivative_path(file_id, 'after', folder))
+    return list(KINDS)
+
+
+def derivatives_from_files(file_id, input_path, output_path, watermark=True, folder=PREVIEW_FOLDER):
+    """Derivatives when the tool wrote the output: one decode of it, plus the upload's corner."""
+    from PIL import Image, ImageOps
+
+    before = None
+    if watermark:
+        with Image.open(input_path) as img:
+            if read_orientation(img) not in (0, 1):
+                img = ImageOps.exif_transpose(img)
+            before = img.crop(corner_box(*img.size))
+    with Image.open(output_path) as cleaned:
+        # Tool outputs and pass-through copies of orientation-free uploads are already upright
+        if read_orientation(cleaned) not in (0, 1):
+            cleaned = ImageOps.exif_transpose(cleaned)
+        cleaned.load()
+        return write_derivatives(file_id, cleaned, before, folder)
@@ -0,0 +1,120 @@
+import functools
+import math
+
+from config import PRECHECK, PRECHECK_THRESHOLD, WATERMARK_TEMPLATE_PATH
+from metrics import stage
+from preprocess import read_orientation
+from region import TOOL_LARGE_THRESHOLD
+
+# Where Gemini puts the sparkle: (logo size, margin from the right/bottom edge)
+LOGO_LARGE = (96, 64)
+LOGO_SMALL = (48, 32)
+# Correlation runs at this logo size; the corner patch is downscaled to match
+MATCH_SIZE = 32
+# Search +/- this many full-resolution pixels around the expected position
+SEARCH_PAD = 4
+
+
+def logo_box(width, height):
+    """Expected sparkle box (left, top, right, bottom) for an image of this display size."""
+    size, margin = LOGO_LARGE if width > TOOL_LARGE_THRESHOLD and height > TOOL_LARGE_THRESHOLD else LOGO_SMALL
+    right, bottom = width - margin, height - margin
+    return (right - size, bottom - size, right, bottom)
+
+
+def draw_sparkle(size, supersample=4):
+    """Four-pointed star with concave sides, as a float alpha map in 0..1."""
+    import numpy as np
+
+    n = size * supersample
+    coords = (np.arange(n) + 0.5) / n * 2 - 1
+    x, y = np.meshgrid(np.abs(coords), np.abs(coords))
+    inside = (np.sqrt(x) + np.sqrt(y)) <= 1.0
+    return inside.reshape(size, supersample, size, supersample).mean(axis=(1, 3)).astype(np.float32)
+
+
+@functools.lru_cache(maxsize=4)
+def template(size):
+    """Sparkle alpha at MATCH_SIZE, zero-mean and unit-norm, ready for correlation."""
+    import numpy as np
+    from PIL import Image
+
+    if WATERMARK_TEMPLATE_PATH:
+        with Image.open(WATERMARK_TEMPLATE_PATH) as img:
+            alpha = img.convert('L').resize((size, size), Image.BOX)
+        alpha = np.asarray(alpha, dtype=np.float32) / 255.0
+    else:
+        alpha = draw_sparkle(size)
+    alpha = alpha - alpha.mean()
+    return alpha / np.linalg.norm(alpha)
+
+
+def warm():
+    """Import NumPy and build the template ahead of the first upload. False if the check is off."""
+    if not PRECHECK:
+        return False
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    template(MATCH_SIZE)
+    return True
+
+
+def correlation(patch, tmpl):
+    """Best normalized cross-correlation of `tmpl` over every offset in `patch`."""
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    windows = sliding_window_view(patch, tmpl.shape)
+    windows = windows - windows.mean(axis=(2, 3), keepdims=True)
+    norms = np.sqrt(np.einsum('ijkl,ijkl->ij', windows, windows))
+    scores = np.einsum('ijkl,kl->ij', windows, tmpl) / np.maximum(norms, 1e-6)
+    return float(scores.max())
+
+
+def watermark_score(input_path):
+    """Correlation of the expected corner with the sparkle; None if NumPy is missing.
+
+    JPEGs are decoded at a reduced scale (draft mode) that still keeps the
+    logo at MATCH_SIZE or larger, so only a fraction of the pixels are decoded.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    from PIL import Image, ImageOps
+
+    with Image.open(input_path) as img:
+        orientation = read_orientation(img)
+        width, height = img.size
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+        left, top, right, bottom = logo_box(width, height)
+        logo = right - left
+        if img.format == 'JPEG':
+            img.draft(img.mode, (math.ceil(img.width * MATCH_SIZE / logo), math.ceil(img.height * MATCH_SIZE / logo)))
+        ratio = img.width / (height if orientation in (5, 6, 7, 8) else width)
+        if orientation not in (0, 1):
+            img = ImageOps.exif_transpose(img)
+        box = (
+            max(0, left - SEARCH_PAD), max(0, top - SEARCH_PAD),
+            min(width, right + SEARCH_PAD), min(height, bottom + SEARCH_PAD)
+        )
+        corner = img.crop(tuple(round(v * ratio) for v in box)).convert('L')
+
+    scale = MATCH_SIZE / (logo * ratio)
+    size = (max(MATCH_SIZE, round(corner.width * scale)), max(MATCH_SIZE, round(corner.height * scale)))
+    patch = np.asarray(corner.resize(size, Image.BOX), dtype=np.float32)
+    return correlation(patch, template(MATCH_SIZE))
+
+
+def has_watermark(input_path, threshold=PRECHECK_THRESHOLD):
+    """False only when the corner clearly lacks the sparkle; errors and missing NumPy say True."""
+    with stage('precheck'):
+        try:
+            score = watermark_score(input_path)
+        except Exception as e:
+            print(f"Watermark pre-check failed, running the tool: {e}")
+            return True
+    return score is None or score >= threshold
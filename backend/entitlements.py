@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config import ENTITLEMENT_TTL, ENTITLEMENT_NEGATIVE_TTL, ENTITLEMENT_FOLDER
+from metrics import stage
+
+LOCAL_MAX_ENTRIES = 10000
+# With Redis as the shared tier the local copy is only a short read-through
+# buffer, so an invalidation from another worker is seen within this window.
+LOCAL_TTL_WITH_REDIS = 5
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures (or calls slower than
+    `slow_call`), then lets a single trial call through after `reset_after`."""
+
+    def __init__(self, threshold=5, reset_after=30, slow_call=2.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.slow_call = slow_call
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                # Half-open: one trial call, the rest keep using cached answers
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, ok, duration=0.0):
+        with self._lock:
+            if ok and duration < self.slow_call:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"⚠️ Entitlement circuit OPEN after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+class EntitlementCache:
+    """Caches is-pro answers per user.
+
+    `fetch(user_id)` returns (is_pro, pro_until) where pro_until is a unix
+    timestamp for expiring Pro, or None. Pro answers are never cached past
+    pro_until. Non-pro answers are cached for a shorter negative TTL. Redis,
+    when available, is the shared tier so invalidate() reaches every worker.
+    Without it, invalidate() touches a per-user marker file in `folder` and
+    every worker on the node drops local answers cached before that mtime.
+    When the circuit is open, the last known answer is served even if stale.
+    """
+
+    def __init__(self, fetch, redis_client=None, breaker=None, folder=None):
+        self.fetch = fetch
+        self.redis = redis_client
+        self.breaker = breaker or CircuitBreaker()
+        self.folder = folder or ENTITLEMENT_FOLDER
+        os.makedirs(self.folder, exist_ok=True)
+        self._local = OrderedDict()  # user_id -> (is_pro, fresh_until, pro_until, cached_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+
+    def _ttl_for(self, is_pro, pro_until, now):
+        if is_pro:
+            ttl = ENTITLEMENT_TTL
+            if pro_until is not None:
+                ttl = min(ttl, pro_until - now)
+            return max(ttl, 0)
+        return ENTITLEMENT_NEGATIVE_TTL
+
+    def _get_local(self, user_id):
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry:
+                self._local.move_to_end(user_id)
+            return entry
+
+    def _set_local(self, user_id, is_pro, fresh_until, pro_until=None, cached_at=None):
+        with self._lock:
+            self._local[user_id] = (is_pro, fresh_until, pro_until, cached_at or time.time())
+            self._local.move_to_end(user_id)
+            while len(self._local) > LOCAL_MAX_ENTRIES:
+                self._local.popitem(last=False)
+
+    def is_pro(self, user_id):
+        now = time.time()
+
+        # 1. Local tier
+        entry = self._get_local(user_id)
+        if entry and entry[1] > now and not self._invalidated_since(user_id, entry[3]):
+            self.hits += 1
+            return entry[0]
+
+        # 2. Shared tier
+        if self.redis:
+            try:
+                with stage('redis'):
+                    data = self.redis.get(f"entitlement:{user_id}")
+                if data:
+                    cached = json.loads(data)
+                    fresh_until = cached['fresh_until']
+                    if fresh_until > now:
+                        self._set_local(user_id, cached['pro'], min(fresh_until, now + LOCAL_TTL_WITH_REDIS), cached.get('pro_until'))
+                        self.hits += 1
+                        return cached['pro']
+            except Exception as e:
+                print(f"⚠️ Redis entitlement READ error: {e}")
+
+        # 3. Source of truth, guarded by the breaker
+        self.misses += 1
+        if not self.breaker.allow():
+            return self._fallback(entry, now)
+
+        started = time.monotonic()
+        try:
+            with stage('supabase'):
+                is_pro, pro_until = self.fetch(user_id)
+        except Exception as e:
+            self.breaker.record(False)
+            print(f"Supabase Check Error: {e}")
+            return self._fallback(entry, now)
+        self.breaker.record(True, time.monotonic() - started)
+
+        ttl = self._ttl_for(is_pro, pro_until, now)
+        fresh_until = now + ttl
+        local_until = min(fresh_until, now + LOCAL_TTL_WITH_REDIS) if self.redis else fresh_until
+        # Stamped with the time before the fetch, so an invalidation during it still wins
+        self._set_local(user_id, is_pro, local_until, pro_until, cached_at=now)
+        if self.redis and ttl >= 1:
+            try:
+                data = json.dumps({'pro': is_pro, 'fresh_until': fresh_until, 'pro_until': pro_until})
+                with stage('redis'):
+                    self.redis.set(f"entitlement:{user_id}", data, ex=int(ttl))
+            except Exception as e:
+                print(f"⚠️ Redis entitlement WRITE error: {e}")
+        return is_pro
+
+    def _fallback(self, entry, now):
+        # Degrade to the last known answer rather than stalling the request,
+        # but never extend expiring Pro past its expiry instant
+        if not entry:
+            return False
+        is_pro, pro_until = entry[0], entry[2]
+        if is_pro and pro_until is not None and pro_until <= now:
+            return False
+        self.stale_served += 1
+        return is_pro
+
+    def _marker(self, user_id):
+        return os.path.join(self.folder, hashlib.sha256(str(user_id).encode()).hexdigest())
+
+    def _invalidated_since(self, user_id, cached_at):
+        # With Redis the local copy only lives LOCAL_TTL_WITH_REDIS; no marker needed
+        if self.redis:
+            return False
+        try:
+            return os.stat(self._marker(user_id)).st_mtime >= cached_at
+        except OSError:
+            return False
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._local.pop(user_id, None)
+        if not self.redis:
+            try:
+                with open(self._marker(user_id), 'a'):
+                    pass
+                os.utime(self._marker(user_id))
+            except OSError as e:
+                print(f"⚠️ Entitlement invalidation marker failed: {e}")
+        if self.redis:
+            try:
+                with stage('redis'):
+                    self.redis.delete(f"entitlement:{user_id}")
+            except Exception as e:
+                print(f"⚠️ Redis entitlement DELETE error: {e}")
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_served': self.stale_served,
+            'circuit': self.breaker.state
+        }
@@ -0,0 +1,45 @@
+class ProcessingError(Exception):
+    """Processing failure that maps directly onto an API error response."""
+
+    def __init__(self, message, status=500, code=None, details=None, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.code = code
+        self.details = details
+        self.retry_after = retry_after  # Seconds, sent as a Retry-After header
+
+    def to_dict(self):
+        body = {'error': self.message}
+        if self.code:
+            body['code'] = self.code
+        if self.details:
+            body['message'] = self.details
+        return body
+
+
+def low_resolution_error():
+    return ProcessingError(
+        'Image resolution too low for accurate removal.',
+        status=400,
+        code='LOW_RESOLUTION',
+        details='Uploaded image is a low-quality preview (likely from Gemini App). Please upload the original high-res image.'
+    )
+
+
+def image_too_large_error(max_pixels):
+    return ProcessingError(
+        'Image dimensions too large.',
+        status=413,
+        code='IMAGE_TOO_LARGE',
+        details=f'Maximum is {max_pixels // 1_000_000} megapixels.'
+    )
+
+
+def overloaded_error(retry_after):
+    return ProcessingError(
+        'Server busy. Please retry shortly.',
+        status=503,
+        code='OVERLOADED',
+        retry_after=max(1, int(retry_after + 0.999))
+    )
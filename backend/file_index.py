@@ -0,0 +1,88 @@
+import json
+import mimetypes
+import os
+
+from config import INDEX_FOLDER, INDEX_TTL
+from metrics import stage
+
+
+class FileIndex:
+    """file_id -> {path, filename, size, mtime, content_type, remote} for finished outputs.
+
+    Lets /api/download resolve an id with one key lookup instead of scanning
+    OUTPUT_FOLDER. Shared by all workers: a Redis hash per id when Redis is up,
+    otherwise one small JSON file per id in INDEX_FOLDER. `remote` entries are
+    also in object storage, so `path` may only exist on the node that made them.
+    """
+
+    def __init__(self, redis_client=None, folder=INDEX_FOLDER):
+        self.redis = redis_client
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, file_id):
+        return os.path.join(self.folder, f"{file_id}.json")
+
+    def add(self, file_id, path, remote=False):
+        st = os.stat(path)
+        filename = os.path.basename(path)
+        entry = {
+            'path': path,
+            'filename': filename,
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+            'content_type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+            'remote': remote
+        }
+        if self.redis:
+            try:
+                with stage('redis'):
+                    self.redis.set(f"file:{file_id}", json.dumps(entry), ex=INDEX_TTL)
+                return entry
+            except Exception as e:
+                print(f"⚠️ Redis index WRITE error: {e}")
+
+        tmp_path = self._path(file_id) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(file_id))
+        return entry
+
+    def get(self, file_id):
+        entry = None
+        if self.redis:
+            try:
+                with stage('redis'):
+                    data = self.redis.get(f"file:{file_id}")
+                entry = json.loads(data) if data else None
+            except Exception as e:
+                print(f"⚠️ Redis index READ error: {e}")
+        if entry is None:
+            try:
+                with open(self._path(file_id)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+
+        # Entry outlived its file (deleted out of band): drop it
+        if not entry.get('remote') and not os.path.exists(entry['path']):
+            self.remove(file_id)
+            return None
+        return entry
+
+    def remove(self, file_id):
+        if self.redis:
+            try:
+                with stage('redis'):
+                    self.redis.delete(f"file:{file_id}")
+            except Exception as e:
+                print(f"⚠️ Redis index DELETE error: {e}")
+        try:
+            os.remove(self._path(file_id))
+        except OSError:
+            pass
+
+
+def file_id_from_output(filename):
+    """'<file_id>_clean.jpg' -> '<file_id>'"""
+    return filename.split('_', 1)[0]
@@ -0,0 +1,10 @@
+import os
+import shutil
+
+
+def link_or_copy(src, dst):
+    """Hard-link src to dst, copying instead when they are on different filesystems."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
@@ -0,0 +1,21 @@
+# Read by gunicorn from the working directory (CLI flags still override it).
+bind = '0.0.0.0:5000'
+workers = 2
+threads = 4
+timeout = 120
+
+# Import the app once in the master and fork workers from it: modules, Pillow codecs,
+# the pre-check template and the tool's pages are then shared copy-on-write.
+preload_app = True
+
+
+def when_ready(server):
+    # Master, before the first fork: only steps that open no connections
+    import app
+    app.warmup.run(shared_only=True)
+
+
+def post_fork(server, worker):
+    # Each worker: background threads, Redis/Supabase connections
+    import app
+    app.start_worker()
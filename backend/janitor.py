@@ -0,0 +1,269 @@
+import fcntl
+import heapq
+import json
+import os
+import shutil
+import threading
+import time
+
+from config import JANITOR_FOLDER, JANITOR_INTERVAL, OUTPUT_TTL, OUTPUT_MAX_BYTES
+
+JOURNAL_MAX_BYTES = 1024 * 1024
+SWEEP_INTERVAL = 3600
+
+
+def track(path, ttl=OUTPUT_TTL):
+    """Register a freshly written output for expiry. Safe from any worker.
+
+    Appends one line to the node-local journal; O_APPEND writes this small
+    are atomic, so workers never interleave lines.
+    """
+    try:
+        size = os.path.getsize(path)
+        line = f"{time.time() + ttl:.3f}\t{size}\t{path}\n".encode()
+        fd = os.open(os.path.join(JANITOR_FOLDER, 'journal'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"⚠️ Janitor track failed for {path}: {e}")
+
+
+class Janitor:
+    """Expires outputs incrementally and keeps them under a disk quota.
+
+    Every worker runs the thread, but only the one holding an exclusive flock
+    on JANITOR_FOLDER/leader.lock does any work; if it dies the OS drops the
+    lock and another worker takes over on its next tick. The leader keeps a
+    min-heap of (expires_at, path), fed by the journal that track() appends
+    to, so each tick only looks at new and expired entries. Outputs are
+    evicted oldest-first whenever their total size exceeds the quota.
+    Small scratch folders (uploads, job records) only hold orphans and are
+    swept once an hour.
+
+    With remote `storage` the local file is only a copy: expiry deletes the
+    object as well, while quota eviction drops just the local copy and
+    downloads keep coming from the bucket.
+
+    Outputs may be hard-linked elsewhere (the result cache); unlinking one
+    copy frees nothing. Before quota eviction `on_evict` gets the victims'
+    paths and should drop those other links so the blocks really go.
+    """
+
+    def __init__(self, output_folder, sweep_folders=(), on_delete=None, storage=None, on_evict=None):
+        self.output_folder = output_folder
+        self.sweep_folders = list(sweep_folders)
+        self.on_delete = on_delete
+        self.on_evict = on_evict
+        self.storage = storage
+        # Default ceiling: half of the volume holding the outputs
+        self.max_bytes = OUTPUT_MAX_BYTES or int(shutil.disk_usage(output_folder).total * 0.5)
+        self.journal_path = os.path.join(JANITOR_FOLDER, 'journal')
+        self.stats_path = os.path.join(JANITOR_FOLDER, 'stats.json')
+        self._lock_file = None
+        self._heap = []
+        self._entries = {}  # path -> (expires_at, size); the heap may hold stale duplicates
+        self._tracked_bytes = 0
+        self._offset = 0
+        self._pending_old = None  # Rotated journal still being drained: (path, offset)
+        self._last_sweep = 0
+        self.metrics = {
+            'files_reclaimed': 0,
+            'bytes_reclaimed': 0,
+            'quota_evictions': 0,
+            'quota_bytes_reclaimed': 0,
+        }
+        os.makedirs(JANITOR_FOLDER, exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self._run, name='janitor', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                if self._is_leader():
+                    self.tick()
+            except Exception as e:
+                print(f"⚠️ Janitor error: {e}")
+            time.sleep(JANITOR_INTERVAL)
+
+    def _is_leader(self):
+        if self._lock_file:
+            return True
+        lock_file = open(os.path.join(JANITOR_FOLDER, 'leader.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        print(f"🧹 Janitor leader: pid {os.getpid()}")
+        self._seed()
+        return True
+
+    def _seed(self):
+        """One full scan when taking over; everything after is incremental."""
+        if os.path.exists(self.journal_path):
+            self._offset = os.path.getsize(self.journal_path)
+        for f in os.listdir(self.output_folder):
+            path = os.path.join(self.output_folder, f)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if os.path.isfile(path):
+                self._add(path, st.st_mtime + OUTPUT_TTL, st.st_size)
+
+    def _add(self, path, expires_at, size):
+        previous = self._entries.get(path)
+        if previous:
+            self._tracked_bytes -= previous[1]
+        self._entries[path] = (expires_at, size)
+        self._tracked_bytes += size
+        heapq.heappush(self._heap, (expires_at, path))
+
+    def _read_journal(self):
+        if self._pending_old:
+            path, offset = self._pending_old
+            self._consume(path, offset)
+            os.remove(path)
+            self._pending_old = None
+
+        if not os.path.exists(self.journal_path):
+            return
+        self._offset = self._consume(self.journal_path, self._offset)
+
+        # Rotate: writers reopen by name, so new lines go to a fresh file. The old
+        # one is drained again next tick to catch writes that raced the rename.
+        if self._offset > JOURNAL_MAX_BYTES:
+            old_path = self.journal_path + '.old'
+            os.replace(self.journal_path, old_path)
+            self._pending_old = (old_path, self._offset)
+            self._offset = 0
+
+    def _consume(self, path, offset):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        # Only consume complete lines
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode(errors='replace').splitlines():
+            try:
+                expires_at, size, file_path = line.split('\t', 2)
+                self._add(file_path, float(expires_at), int(size))
+            except ValueError:
+                continue
+        return offset + end
+
+    def _delete(self, path, expired=True):
+        """Remove a tracked file. Returns its size, or None if nothing was removed."""
+        expires_at, size = self._entries.pop(path)
+        self._tracked_bytes -= size
+        remote = self.storage is not None and self.storage.remote
+        if remote and expired:
+            try:
+                self.storage.delete(os.path.basename(path))
+            except Exception as e:
+                print(f"⚠️ Janitor could not remove {os.path.basename(path)} from storage: {e}")
+        elif remote:
+            # Only the local copy goes; keep the entry so the object still expires
+            self._add(path, expires_at, 0)
+
+        freed = None
+        try:
+            st = os.stat(path)
+            os.remove(path)
+            # Still hard-linked elsewhere (result cache): the blocks stay in use
+            freed = st.st_size if st.st_nlink == 1 else 0
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"⚠️ Janitor could not remove {path}: {e}")
+        if self.on_delete and (expired if remote else freed is not None):
+            self.on_delete(path)
+        return freed
+
+    def _pop_current(self):
+        """Pop the heap head, skipping entries superseded by a later track()."""
+        while self._heap:
+            expires_at, path = heapq.heappop(self._heap)
+            entry = self._entries.get(path)
+            if entry and entry[0] == expires_at:
+                return expires_at, path
+        return None
+
+    def tick(self, now=None):
+        now = now or time.time()
+        self._read_journal()
+
+        # 1. TTL expiry: only the expired head of the heap is touched
+        while self._heap and self._heap[0][0] <= now:
+            head = self._pop_current()
+            if not head:
+                break
+            expires_at, path = head
+            if expires_at > now:
+                heapq.heappush(self._heap, head)
+                break
+            freed = self._delete(path)
+            if freed is not None:
+                self.metrics['files_reclaimed'] += 1
+                self.metrics['bytes_reclaimed'] += freed
+
+        # 2. Disk quota: evict the oldest outputs until back under the ceiling
+        kept, victims = [], []
+        excess = self._tracked_bytes - self.max_bytes
+        while excess > 0:
+            head = self._pop_current()
+            if not head:
+                break
+            size = self._entries[head[1]][1]
+            if size == 0:
+                kept.append(head)  # Local copy already evicted, nothing to free
+                continue
+            victims.append(head[1])
+            excess -= size
+        if victims and self.on_evict:
+            try:
+                self.on_evict(victims)
+            except Exception as e:
+                print(f"⚠️ Janitor could not release cached links: {e}")
+        for path in victims:
+            freed = self._delete(path, expired=False)
+            if freed is not None:
+                self.metrics['quota_evictions'] += 1
+                self.metrics['quota_bytes_reclaimed'] += freed
+        for head in kept:
+            heapq.heappush(self._heap, head)
+
+        # 3. Orphans in small scratch folders
+        if now - self._last_sweep > SWEEP_INTERVAL:
+            self._last_sweep = now
+            for folder in self.sweep_folders:
+                for f in os.listdir(folder):
+                    path = os.path.join(folder, f)
+                    try:
+                        if os.path.isfile(path) and now - os.path.getmtime(path) > OUTPUT_TTL:
+                            os.remove(path)
+                            self.metrics['files_reclaimed'] += 1
+                    except OSError:
+                        pass
+
+        self._write_stats()
+
+    def _write_stats(self):
+        stats = dict(self.metrics, tracked_files=len(self._entries), tracked_bytes=self._tracked_bytes,
+                     max_bytes=self.max_bytes, leader_pid=os.getpid(), updated_at=time.time())
+        tmp_path = self.stats_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, self.stats_path)
+
+    def stats(self):
+        """Latest stats published by the leader (readable from any worker)."""
+        try:
+            with open(self.stats_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
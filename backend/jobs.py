@@ -0,0 +1,216 @@
+import fcntl
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+
+from config import JOB_FOLDER, JOB_TTL, JOB_STALE_AFTER
+
+TERMINAL_STATES = ('done', 'failed')
+HOST = socket.gethostname()
+LOST_ERROR = {'error': 'The server restarted while processing. Please upload again.', 'code': 'JOB_LOST'}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def is_stale(job, now=None):
+    """A non-terminal job whose worker process is gone (this node) or that stopped moving."""
+    if job['status'] in TERMINAL_STATES:
+        return False
+    now = now or time.time()
+    if now - job.get('updated_at', 0) > JOB_STALE_AFTER:
+        return True
+    return job.get('host') == HOST and bool(job.get('pid')) and not _pid_alive(job['pid'])
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobStore:
+    """Job status records. Redis when available, otherwise one JSON file per job
+    so every gunicorn worker on the node can answer a poll."""
+
+    def __init__(self, redis_client=None, folder=JOB_FOLDER):
+        self.redis = redis_client
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, job_id):
+        return os.path.join(self.folder, f"{job_id}.json")
+
+    def save(self, job):
+        data = json.dumps(job)
+        if self.redis:
+            try:
+                self.redis.set(f"job:{job['id']}", data, ex=JOB_TTL)
+                return
+            except Exception as e:
+                print(f"⚠️ Redis job WRITE error: {e}")
+        self._save_file(job['id'], data)
+
+    def _save_file(self, job_id, data):
+        # Atomic replace so readers never see a half-written file
+        tmp_path = f"{self._path(job_id)}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(job_id))
+
+    def get(self, job_id):
+        if self.redis:
+            try:
+                data = self.redis.get(f"job:{job_id}")
+                if data:
+                    return json.loads(data)
+            except Exception as e:
+                print(f"⚠️ Redis job READ error: {e}")
+        return self._get_file(job_id)
+
+    def _get_file(self, job_id):
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def update(self, job_id, **fields):
+        """Read-modify-write of one record, atomic across workers and nodes.
+
+        A terminal status is final: an update that arrives after the job is
+        done or failed (the stale-job check racing the worker's result, a late
+        'processing') is dropped and the stored record is returned unchanged.
+        """
+        if self.redis:
+            try:
+                return self._update_redis(job_id, fields)
+            except Exception as e:
+                print(f"⚠️ Redis job UPDATE error: {e}")
+
+        with open(os.path.join(self.folder, f"{job_id}.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            job = self.get(job_id) or {'id': job_id}
+            if _apply(job, fields):
+                self._save_file(job_id, json.dumps(job))
+            return job
+
+    def _update_redis(self, job_id, fields):
+        from redis.exceptions import WatchError
+
+        key = f"job:{job_id}"
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    job = json.loads(data) if data else {'id': job_id}
+                    if not _apply(job, fields):
+                        pipe.unwatch()
+                        return job
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job), ex=JOB_TTL)
+                    pipe.execute()
+                    return job
+                except WatchError:
+                    continue  # Written by someone else since the read: re-read and re-check
+
+
+def _apply(job, fields):
+    """Merge fields into job unless its status is already terminal. Returns whether it changed."""
+    if job.get('status') in TERMINAL_STATES:
+        return False
+    job.update(fields)
+    job['updated_at'] = time.time()
+    return True
+
+
+class JobQueue:
+    """Bounded queue drained by a pool of worker threads.
+
+    The tool runs as a subprocess, so threads are enough to keep it busy
+    without holding the request thread. Threads are started on first submit
+    so they are created in the serving process, not before a fork.
+
+    The queue lives in the worker's memory: if gunicorn recycles or loses
+    the worker, its jobs would stay queued forever. Each record notes the
+    owning process, and lookup() fails jobs that went stale (see is_stale)
+    and removes their upload.
+    """
+
+    def __init__(self, handler, store, workers, maxsize):
+        self.handler = handler
+        self.store = store
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+            self._started = True
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def submit(self, payload):
+        """Queue a job and return its id. Raises QueueFull instead of blocking."""
+        self._ensure_started()
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        job = {
+            'id': job_id, 'status': 'queued', 'created_at': now, 'updated_at': now,
+            'host': HOST, 'pid': os.getpid(), 'upload': payload.get('input_path')
+        }
+        self.store.save(job)
+        try:
+            self.queue.put_nowait((job_id, payload))
+        except queue.Full:
+            self.store.update(job_id, status='failed', error={'error': 'Server busy'})
+            raise QueueFull()
+        return job_id
+
+    def lookup(self, job_id):
+        """The job record, failing it first if its worker is gone."""
+        job = self.store.get(job_id)
+        if job and is_stale(job):
+            print(f"⚠️ Job {job_id} lost its worker (pid {job.get('pid')}), marking failed")
+            upload = job.get('upload')
+            if upload and job.get('host') == HOST and os.path.exists(upload):
+                os.remove(upload)
+            job = self.store.update(job_id, status='failed', error=LOST_ERROR, http_status=500)
+        return job
+
+    def _worker(self):
+        while True:
+            job_id, payload = self.queue.get()
+            try:
+                if self.store.update(job_id, status='processing')['status'] != 'processing':
+                    continue  # Failed as lost while it waited; its upload is gone
+                result = self.handler(payload)
+                self.store.update(job_id, status='done', result=result)
+            except Exception as e:
+                # Handlers raise ProcessingError-like objects carrying an API body
+                if hasattr(e, 'to_dict'):
+                    error, http_status = e.to_dict(), getattr(e, 'status', 500)
+                else:
+                    print(f"CRITICAL JOB ERROR: {e}")
+                    error, http_status = {'error': f'Server error: {str(e)}'}, 500
+                self.store.update(job_id, status='failed', error=error, http_status=http_status)
+            finally:
+                self.queue.task_done()
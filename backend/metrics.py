@@ -0,0 +1,347 @@
+import bisect
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import METRICS_FOLDER
+
+# Seconds; covers a Redis round trip up to a tool run near TOOL_TIMEOUT
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# How often a process rewrites its snapshot for the other workers to read
+FLUSH_INTERVAL = 1.0
+
+# Counters and histograms of exited processes, folded into one file (see _retire)
+RETIRED_FILE = 'retired.json'
+
+_registry = []
+_request = threading.local()
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+_token = None
+_token_pid = None
+_claimed_pid = None
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+def _format_labels(labelnames, key, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self, scrape=False):
+        with self.lock:
+            return [[list(k), v] for k, v in self.values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def render(self, merged):
+        for key, value in sorted(merged.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(Counter):
+    """Current value; `fn` (if given) is evaluated at snapshot time instead.
+
+    aggregate='sum' adds up live worker processes (e.g. tools in flight);
+    'max' is for node-wide values every worker sees the same (e.g. disk usage).
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), fn=None, aggregate='sum'):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.aggregate = aggregate
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(self.labelnames, labels)] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def snapshot(self, scrape=False):
+        # Node-wide values are only computed by the process serving the scrape
+        if self.fn and (scrape or self.aggregate == 'sum'):
+            try:
+                for labels, value in self.fn():
+                    self.set(value, **labels)
+            except Exception as e:
+                print(f"⚠️ Metric {self.name} failed: {e}")
+        return super().snapshot(scrape)
+
+    def merge(self, total, value):
+        if total is None:
+            return value
+        return max(total, value) if self.aggregate == 'max' else total + value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.values = {}  # label key -> [per-bucket counts (+Inf last), sum]
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def snapshot(self, scrape=False):
+        with self.lock:
+            return [[list(k), [list(counts), total]] for k, (counts, total) in self.values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return [list(value[0]), value[1]]
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+
+    def render(self, merged):
+        for key, (counts, total) in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [le])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}"
+
+
+STAGE_SECONDS = Histogram(
+    'byewatermark_stage_seconds', 'Time spent per /api/remove stage', ('stage',)
+)
+TOOL_RUNS = Counter(
+    'byewatermark_tool_runs_total', 'GeminiWatermarkTool runs by outcome (ok, exit_<code>, timeout, no_output)', ('result',)
+)
+TOOLS_IN_FLIGHT = Gauge('byewatermark_tools_in_flight', 'Tool subprocesses currently running')
+
+
+@contextmanager
+def stage(name):
+    """Time a block into STAGE_SECONDS and the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        timings = getattr(_request, 'timings', None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def tool_in_flight():
+    TOOLS_IN_FLIGHT.inc()
+    try:
+        yield
+    finally:
+        TOOLS_IN_FLIGHT.dec()
+
+
+def begin_request():
+    _request.timings = {}
+
+
+def end_request():
+    """Stage timings of the finished request, as a Server-Timing header value."""
+    timings = getattr(_request, 'timings', None)
+    _request.timings = None
+    if not timings:
+        return None
+    return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+def _process_token():
+    """Tells this process's snapshot apart from an exited one that had the same pid."""
+    global _token, _token_pid
+    if _token_pid != os.getpid():
+        _token_pid = os.getpid()
+        _token = uuid.uuid4().hex
+    return _token
+
+
+def _snapshot(scrape=False):
+    return {'pid': os.getpid(), 'token': _process_token(), 'metrics': {m.name: m.snapshot(scrape) for m in _registry}}
+
+
+def _fold(retired, snapshot):
+    metrics = {m.name: m for m in _registry}
+    for name, values in snapshot['metrics'].items():
+        metric = metrics.get(name)
+        # Gauges describe live processes only
+        if metric is None or metric.kind == 'gauge':
+            continue
+        merged = {tuple(key): value for key, value in retired['metrics'].get(name, [])}
+        for key, value in values:
+            merged[tuple(key)] = metric.merge(merged.get(tuple(key)), value)
+        retired['metrics'][name] = [[list(key), value] for key, value in merged.items()]
+
+
+def _retire(paths, finished):
+    """Fold the snapshots at `paths` into RETIRED_FILE and delete them.
+
+    Runs under an flock so two workers scraping at once cannot fold the same
+    file twice; `finished(snapshot)` is re-checked under the lock.
+    """
+    retired_path = os.path.join(METRICS_FOLDER, RETIRED_FILE)
+    with open(os.path.join(METRICS_FOLDER, 'retire.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(retired_path) as f:
+                retired = json.load(f)
+        except (OSError, ValueError):
+            retired = {'pid': None, 'metrics': {}}
+        folded = []
+        for path in paths:
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if finished(snapshot):
+                _fold(retired, snapshot)
+                folded.append(path)
+        if not folded:
+            return
+        tmp = f"{retired_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(retired, f)
+        os.replace(tmp, retired_path)
+        for path in folded:
+            os.remove(path)
+
+
+def _retire_dead():
+    """Fold snapshots of exited processes (gunicorn workers, batch-pool children)."""
+    try:
+        names = os.listdir(METRICS_FOLDER)
+    except FileNotFoundError:
+        return
+    dead = [
+        os.path.join(METRICS_FOLDER, name) for name in names
+        if name.endswith('.json') and name[:-5].isdigit() and not _pid_alive(int(name[:-5]))
+    ]
+    if dead:
+        _retire(dead, lambda snapshot: not _pid_alive(snapshot['pid']))
+
+
+def flush(force=False):
+    """Publish this process's metrics for /api/metrics in other workers (throttled)."""
+    global _last_flush, _claimed_pid
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = now
+        os.makedirs(METRICS_FOLDER, exist_ok=True)
+        path = os.path.join(METRICS_FOLDER, f"{os.getpid()}.json")
+        snapshot = _snapshot()
+        if _claimed_pid != os.getpid():
+            # First flush: a file here was left by an exited process whose pid we reused;
+            # keep its totals instead of overwriting them
+            if os.path.exists(path):
+                _retire([path], lambda old: old.get('token') != snapshot['token'])
+            _claimed_pid = os.getpid()
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"⚠️ Metrics flush failed: {e}")
+    finally:
+        _flush_lock.release()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _load_snapshots():
+    _retire_dead()
+    own = _snapshot(scrape=True)
+    snapshots = [own]
+    try:
+        names = os.listdir(METRICS_FOLDER)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if not name.endswith('.json') or name == f"{own['pid']}.json":
+            continue
+        try:
+            with open(os.path.join(METRICS_FOLDER, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def render():
+    """Prometheus text format, merged across every worker process on this node.
+
+    Counters and histograms include processes that have exited so totals do
+    not drop when gunicorn recycles a worker: their snapshots are folded into
+    one retired snapshot and deleted. Gauges only count live processes.
+    """
+    snapshots = _load_snapshots()
+    alive = {
+        s['pid']: s['pid'] is not None and (s['pid'] == os.getpid() or _pid_alive(s['pid']))
+        for s in snapshots
+    }
+    lines = []
+    for metric in _registry:
+        merged = {}
+        for snapshot in snapshots:
+            if metric.kind == 'gauge' and not alive[snapshot['pid']]:
+                continue
+            for key, value in snapshot['metrics'].get(metric.name, []):
+                key = tuple(key)
+                merged[key] = metric.merge(merged.get(key), value)
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render(merged))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,191 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+from config import (
+    OUTBOX_FOLDER, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE, OUTBOX_RETRY_MAX,
+    CONTACT_LIMIT_PER_DAY
+)
+from metrics import Counter, Histogram, flush as flush_metrics
+from rate_limiter import BoundedCounterStore
+
+POLL_INTERVAL = 1.0
+SWEEP_INTERVAL = 3600
+THROTTLED_TTL = 3 * 24 * 3600
+
+MESSAGES = Counter('byewatermark_contact_messages_total', 'Contact messages by outcome', ('result',))
+DELIVERY_SECONDS = Histogram(
+    'byewatermark_contact_delivery_seconds', 'Time from contact form submit to email accepted',
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 300, 1800, 3600, 14400)
+)
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Outbox:
+    """Durable queue of contact-form messages, emailed in the background.
+
+    The request thread only writes the message to
+    OUTBOX_FOLDER/pending/<id>.json (fsynced) and returns. One sender per
+    node, elected with an flock like the janitor, hands due messages to
+    `sender` in batches of OUTBOX_BATCH_SIZE, oldest first. `sender` returns
+    one error (or None) per message; raising fails the whole batch. Failed
+    messages are retried with exponential backoff and moved to dead/ after
+    OUTBOX_MAX_ATTEMPTS. Before its first attempt each message is counted
+    against its IP's daily allowance on this node; messages over it go to
+    throttled/ unsent. This backs up the per-request check, whose in-memory
+    fallback only counts within one worker.
+    """
+
+    def __init__(self, sender, folder=OUTBOX_FOLDER, batch_size=OUTBOX_BATCH_SIZE, limit_per_ip=CONTACT_LIMIT_PER_DAY):
+        self.sender = sender
+        self.folder = folder
+        self.batch_size = batch_size
+        self.limit_per_ip = limit_per_ip
+        self.sent_by_ip = BoundedCounterStore()
+        self._lock_file = None
+        self._last_sweep = 0
+        for state in ('pending', 'dead', 'throttled'):
+            os.makedirs(os.path.join(folder, state), exist_ok=True)
+
+    def _path(self, state, message_id):
+        return os.path.join(self.folder, state, f"{message_id}.json")
+
+    def _write(self, path, record):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def enqueue(self, message, ip):
+        """Persist a validated message. Returns its id."""
+        message_id = uuid.uuid4().hex
+        path = self._path('pending', message_id)
+        self._write(path, {
+            'id': message_id,
+            'ip': ip,
+            'message': message,
+            'received_at': time.time(),
+            'attempts': 0,
+            'next_attempt_at': 0,
+        })
+        _fsync_dir(os.path.dirname(path))
+        MESSAGES.inc(result='queued')
+        return message_id
+
+    def start(self):
+        threading.Thread(target=self._run, name='outbox-sender', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                if self._is_leader():
+                    self.tick()
+            except Exception as e:
+                print(f"⚠️ Outbox sender error: {e}")
+            time.sleep(POLL_INTERVAL)
+
+    def _is_leader(self):
+        if self._lock_file:
+            return True
+        lock_file = open(os.path.join(self.folder, 'sender.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        print(f"📮 Outbox sender: pid {os.getpid()}")
+        return True
+
+    def _pending(self):
+        folder = os.path.join(self.folder, 'pending')
+        records = []
+        for name in os.listdir(folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(folder, name)) as f:
+                    records.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return records
+
+    def _move(self, record, state):
+        self._write(self._path(state, record['id']), record)
+        os.remove(self._path('pending', record['id']))
+
+    def tick(self, now=None):
+        now = now or time.time()
+        due = []
+        for record in sorted(self._pending(), key=lambda r: r['received_at']):
+            if record['next_attempt_at'] > now:
+                continue
+            if record['attempts'] == 0:
+                allowed, _ = self.sent_by_ip.reserve(record['ip'], self.limit_per_ip)
+                if not allowed:
+                    self._move(record, 'throttled')
+                    MESSAGES.inc(result='throttled')
+                    continue
+            due.append(record)
+        for i in range(0, len(due), self.batch_size):
+            self._send(due[i:i + self.batch_size], now)
+        # The sender may sit in a worker that serves no requests; publish its counters
+        flush_metrics()
+
+        if now - self._last_sweep > SWEEP_INTERVAL:
+            self._last_sweep = now
+            folder = os.path.join(self.folder, 'throttled')
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                try:
+                    if now - os.path.getmtime(path) > THROTTLED_TTL:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _send(self, batch, now):
+        try:
+            errors = self.sender([record['message'] for record in batch])
+        except Exception as e:
+            print(f"⚠️ Outbox batch of {len(batch)} failed: {e}")
+            errors = [str(e)] * len(batch)
+
+        for record, error in zip(batch, errors):
+            if error is None:
+                os.remove(self._path('pending', record['id']))
+                DELIVERY_SECONDS.observe(time.time() - record['received_at'])
+                MESSAGES.inc(result='sent')
+                continue
+            record['attempts'] += 1
+            record['error'] = str(error)
+            if record['attempts'] >= OUTBOX_MAX_ATTEMPTS:
+                print(f"🔥 Contact message {record['id']} failed for good: {error}")
+                self._move(record, 'dead')
+                MESSAGES.inc(result='dead')
+                continue
+            delay = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** (record['attempts'] - 1))
+            record['next_attempt_at'] = now + delay
+            self._write(self._path('pending', record['id']), record)
+            MESSAGES.inc(result='retried')
+
+    def stats(self):
+        pending = self._pending()
+        now = time.time()
+        return {
+            'pending': len(pending),
+            'dead': len(os.listdir(os.path.join(self.folder, 'dead'))),
+            'throttled': len(os.listdir(os.path.join(self.folder, 'throttled'))),
+            'oldest_pending_seconds': round(now - min((r['received_at'] for r in pending), default=now), 3),
+        }
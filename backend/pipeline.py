@@ -0,0 +1,188 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from config import (
+    OUTPUT_FOLDER, BATCH_FOLDER, TOOL_PATH, TOOL_TIMEOUT,
+    TOOL_BATCH_WINDOW_MS, TOOL_BATCH_MAX, REGION_MODE, REGION_FORMATS, PRECHECK, PREVIEWS
+)
+from admission import AdmissionController, PRIORITY_PRO
+from batcher import ToolBatcher
+from derivatives import write_derivatives, derivatives_from_files
+from detect import has_watermark
+from errors import ProcessingError
+from metrics import TOOL_RUNS, flush as flush_metrics, stage, tool_in_flight
+from preprocess import preprocess_image, probe_image
+from region import process_region
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = ToolBatcher(
+                    TOOL_PATH, run_tool_single, BATCH_FOLDER,
+                    window_ms=TOOL_BATCH_WINDOW_MS, max_items=TOOL_BATCH_MAX, timeout=TOOL_TIMEOUT
+                )
+    return _batcher
+
+
+def run_tool(input_path, output_path):
+    """Run GeminiWatermarkTool for one file, through the micro-batcher when enabled."""
+    with stage('tool'):
+        if TOOL_BATCH_WINDOW_MS > 0 and os.path.exists(TOOL_PATH):
+            get_batcher().run(input_path, output_path)
+        else:
+            run_tool_single(input_path, output_path)
+
+
+def run_tool_single(input_path, output_path):
+    """Run GeminiWatermarkTool on a single file."""
+    if not os.path.exists(TOOL_PATH):
+        print(f"CRITICAL: Tool not found at {TOOL_PATH}")
+        raise ProcessingError(f'Server Config Error: Tool not found at {TOOL_PATH}')
+
+    try:
+        with tool_in_flight():
+            result = subprocess.run(
+                [TOOL_PATH, '-i', input_path, '-o', output_path],
+                capture_output=True,
+                text=True,
+                timeout=TOOL_TIMEOUT
+            )
+    except subprocess.TimeoutExpired:
+        TOOL_RUNS.inc(result='timeout')
+        raise ProcessingError('Processing timeout. Try a smaller image.')
+
+    if result.returncode != 0:
+        TOOL_RUNS.inc(result=f'exit_{result.returncode}')
+        print(f"TOOL FAILED: {result.stderr}")
+        raise ProcessingError(f'Tool execution failed: {result.stderr}')
+
+    if not os.path.exists(output_path):
+        TOOL_RUNS.inc(result='no_output')
+        raise ProcessingError('Processing failed. No output generated.')
+    TOOL_RUNS.inc(result='ok')
+
+
+def dry_run():
+    """Run the tool once on a small blank image so its binary and libraries are paged in.
+
+    Only a missing binary, a launch error or a timeout count as failures; the
+    exit code on a blank image does not matter. Not counted in TOOL_RUNS.
+    """
+    from PIL import Image
+
+    if not os.path.exists(TOOL_PATH):
+        raise FileNotFoundError(f'Tool not found at {TOOL_PATH}')
+    folder = tempfile.mkdtemp(prefix='warmup-')
+    try:
+        input_path = os.path.join(folder, 'warmup.png')
+        Image.new('RGB', (512, 512), 'gray').save(input_path)
+        subprocess.run(
+            [TOOL_PATH, '-i', input_path, '-o', os.path.join(folder, 'warmup_clean.png')],
+            capture_output=True,
+            timeout=TOOL_TIMEOUT
+        )
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def try_region(input_path, ext, output_path, on_clean=None):
+    """Region mode; False means "use the full-image path" (format not in REGION_FORMATS,
+    small image or Pillow trouble)."""
+    if ext not in REGION_FORMATS:
+        return False
+    try:
+        return process_region(input_path, ext, output_path, run_tool, on_clean)
+    except ProcessingError:
+        raise
+    except Exception as e:
+        print(f"Region processing failed, using full image: {e}")
+        return False
+
+
+def clean_image(input_path, ext, output_path, watermark=None, on_clean=None):
+    """Write the cleaned image to output_path. Intermediates go next to input_path.
+
+    watermark=None runs the pre-check here; callers that already ran it pass
+    the answer. Without a watermark the input is copied as is and no tool
+    runs. on_clean is handed to region mode (see process_region); it is not
+    called on the other paths. Returns whether a watermark was removed.
+    """
+    if watermark is None:
+        watermark = not PRECHECK or has_watermark(input_path)
+    if not watermark:
+        shutil.copyfile(input_path, output_path)
+        return False
+    # Large images: only the watermark corner goes through the tool
+    if not (REGION_MODE and try_region(input_path, ext, output_path, on_clean)):
+        tool_input = preprocess_image(input_path, ext)
+        try:
+            run_tool(tool_input, output_path)
+        finally:
+            if tool_input != input_path and os.path.exists(tool_input):
+                os.remove(tool_input)
+    return True
+
+
+def process_upload(input_path, ext, file_id, watermark=None, previews=PREVIEWS):
+    """Full pipeline for a saved upload. Returns the /api/remove success payload."""
+    output_filename = f"{file_id}_clean.{ext}"
+    output_path = os.path.join(OUTPUT_FOLDER, output_filename)
+    kinds = []
+
+    def on_clean(canvas, tile):
+        # A preview must never cost the result (or send region mode back to the full image)
+        try:
+            kinds.extend(write_derivatives(file_id, canvas, tile))
+        except Exception as e:
+            print(f"⚠️ Previews for {file_id} failed: {e}")
+            kinds.append(None)
+
+    found = clean_image(input_path, ext, output_path, watermark, on_clean if previews else None)
+
+    if previews and not kinds:
+        # Full-image tool path or pass-through copy: read the output back once
+        try:
+            kinds = derivatives_from_files(file_id, input_path, output_path, found)
+        except Exception as e:
+            print(f"⚠️ Previews for {file_id} failed: {e}")
+
+    return {
+        'success': True,
+        'download_id': file_id,
+        'filename': output_filename,
+        'watermark_found': found,
+        'previews': [kind for kind in kinds if kind]
+    }
+
+
+def process_batch_item(input_path, ext, file_id):
+    """Process-pool entry point for batch uploads.
+
+    Never raises: failures come back as the ProcessingError body so one bad
+    image does not abort the batch. Success adds the output 'path'.
+    """
+    try:
+        probe = probe_image(input_path)
+        # Batch items share the node's tool capacity with live requests
+        with AdmissionController().slot(PRIORITY_PRO, cost=probe['memory']):
+            # Batch results are downloaded as a zip, never viewed one by one
+            result = process_upload(input_path, ext, file_id, previews=False)
+    except ProcessingError as e:
+        return e.to_dict()
+    except Exception as e:
+        return {'error': f'Server error: {str(e)}'}
+    finally:
+        # Pool processes never serve /api/metrics; publish for the worker that does
+        flush_metrics()
+    result['path'] = os.path.join(OUTPUT_FOLDER, result['filename'])
+    return result
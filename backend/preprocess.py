@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+
+from PIL import Image
+
+from config import (
+    MIN_DIMENSION, PREPROCESS_INTERMEDIATE, MAX_IMAGE_PIXELS, ADMISSION_MEMORY_BYTES, PREVIEWS, PREVIEW_MAX_SIZE
+)
+from errors import ProcessingError, low_resolution_error, image_too_large_error
+from metrics import stage
+
+# Pillow's own decompression-bomb guard, for every decode in the process. Set once here:
+# it is global, so per-call assignments would race with (and undo) anyone else's setting.
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+EXIF_ORIENTATION = 0x0112
+
+# Decoded size per pixel by Pillow mode (anything unlisted counts as 4)
+BYTES_PER_PIXEL = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'I;16': 2, 'RGB': 3, 'YCbCr': 3, 'RGBA': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+
+# Cheapest encodings the tool can read back: no entropy coding, no filtering
+INTERMEDIATE_FORMATS = {
+    'bmp': ('BMP', {}),
+    'ppm': ('PPM', {}),
+    'png': ('PNG', {'compress_level': 0}),
+}
+
+# Per-format timing stats: (format, path) -> [count, total_seconds]
+# path is 'passthrough' (upload handed to the tool untouched) or 'rewrite'
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def record_timing(fmt, path, seconds):
+    with _timings_lock:
+        entry = _timings.setdefault((fmt, path), [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+def timing_stats():
+    with _timings_lock:
+        return {
+            f"{fmt}:{path}": {'count': count, 'avg_ms': round(total / count * 1000, 2)}
+            for (fmt, path), (count, total) in _timings.items()
+        }
+
+
+def warm_codecs():
+    """Load Pillow's plugins and run each codec the pipeline uses once (tiny encode + decode)."""
+    import io
+
+    Image.init()
+    for fmt in ('JPEG', 'PNG', 'WEBP', 'BMP'):
+        buf = io.BytesIO()
+        Image.new('RGB', (16, 16), 'white').save(buf, format=fmt)
+        buf.seek(0)
+        with Image.open(buf) as img:
+            img.load()
+
+
+def check_resolution(width, height):
+    # VALIDATION: Check for low resolution (thumbnail/preview images)
+    # The tool requires sufficient resolution to detect the watermark pattern accurately.
+    if width < MIN_DIMENSION and height < MIN_DIMENSION:
+        raise low_resolution_error()
+
+
+def estimate_memory(mode, width, height, orientation):
+    """Peak bytes of decoded pixels for one job, from header fields alone.
+
+    The stages run one after another, so the peak is the largest of them:
+    - prepare: Pillow's decoded source, exif_transpose's copy (made even with
+      nothing to rotate) and convert('RGB'). Region mode keeps this canvas
+      through the paste, the encode and the previews.
+    - tool: its own RGB decode of the full image.
+    - derivatives after a full-image run: the upload re-decoded (and turned
+      upright) for its corner, then the output decoded.
+    Preview-sized copies come on top of whichever stage makes them.
+    """
+    pixels = width * height
+    source = pixels * BYTES_PER_PIXEL.get(mode, 4)
+    rgb = 3 * pixels
+    prepare = 2 * source + (rgb if mode != 'RGB' else 0)
+    tool = rgb
+    if not PREVIEWS:
+        return max(prepare, tool)
+    derivatives = max(source + (source if orientation not in (0, 1) else 0), rgb)
+    preview = 3 * min(pixels, PREVIEW_MAX_SIZE * PREVIEW_MAX_SIZE)
+    return max(prepare, tool, derivatives) + preview
+
+
+def check_pixels(width, height, memory):
+    # Decompression bombs and images that could never fit the node's memory budget
+    if width * height > MAX_IMAGE_PIXELS or memory > ADMISSION_MEMORY_BYTES:
+        raise image_too_large_error(MAX_IMAGE_PIXELS)
+
+
+def read_orientation(img):
+    """EXIF orientation without touching pixel data."""
+    if img.format == 'PNG':
+        # PngImageFile.getexif() decodes the image to find a trailing eXIf chunk;
+        # only trust what was parsed with the header.
+        raw = img.info.get('exif')
+        if not raw:
+            return 1
+        exif = Image.Exif()
+        exif.load(raw)
+        return exif.get(EXIF_ORIENTATION, 1)
+    return img.getexif().get(EXIF_ORIENTATION, 1)
+
+
+def probe_image(path):
+    """Format, mode and display size (EXIF rotation applied) from the header alone.
+
+    Raises INVALID_IMAGE if Pillow cannot identify the file, IMAGE_TOO_LARGE
+    for decompression bombs and LOW_RESOLUTION for previews, so bad uploads
+    are rejected before any decode. 'memory' is the job's estimated peak.
+    """
+    from PIL import UnidentifiedImageError
+
+    try:
+        with Image.open(path) as img:
+            orientation = read_orientation(img)
+            width, height = img.size
+            mode, fmt = img.mode, img.format
+    except Image.DecompressionBombError:
+        raise image_too_large_error(MAX_IMAGE_PIXELS)
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        raise ProcessingError('Invalid or corrupted image file.', status=400, code='INVALID_IMAGE')
+
+    memory = estimate_memory(mode, width, height, orientation)
+    check_pixels(width, height, memory)
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+    check_resolution(width, height)
+    return {
+        'format': fmt, 'mode': mode, 'width': width, 'height': height,
+        'orientation': orientation, 'memory': memory
+    }
+
+
+def preprocess_image(input_path, ext):
+    """Prepare an upload for the tool and return the path the tool should read.
+
+    Fast path: an RGB image with identity EXIF orientation is handed to the tool
+    as-is, with no decode or re-encode. Otherwise the image is transposed and
+    converted to RGB (drops Alpha, which causes the "black watermark" issue) and
+    written to a cheap uncompressed intermediate next to the upload. Only the
+    tool reads the intermediate; the output keeps the upload's format.
+    """
+    start = time.perf_counter()
+    fmt = ext.upper()
+    try:
+        from PIL import ImageOps
+
+        # Image.open only parses the header; pixels are decoded on first access
+        with Image.open(input_path) as img:
+            fmt = img.format or fmt
+
+            # Symmetric in width/height, so EXIF rotation does not change the outcome
+            check_resolution(img.width, img.height)
+
+            orientation = read_orientation(img)
+            if img.mode == 'RGB' and orientation in (0, 1):
+                record_timing(fmt, 'passthrough', time.perf_counter() - start)
+                return input_path
+
+            with stage('convert'):
+                fixed_img = ImageOps.exif_transpose(img)
+                if fixed_img.mode != 'RGB':
+                    fixed_img = fixed_img.convert('RGB')
+
+            pil_format, save_kwargs = INTERMEDIATE_FORMATS.get(PREPROCESS_INTERMEDIATE, INTERMEDIATE_FORMATS['bmp'])
+            tool_input = f"{os.path.splitext(input_path)[0]}_pre.{pil_format.lower()}"
+            with stage('encode'):
+                fixed_img.save(tool_input, format=pil_format, **save_kwargs)
+
+        record_timing(fmt, 'rewrite', time.perf_counter() - start)
+        return tool_input
+
+    except ProcessingError:
+        raise
+    except Exception as e:
+        print(f"Image pre-processing failed: {e}")
+        # Fallback to raw file if Pillow fails
+        return input_path
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import stage
+
+WINDOW_SECONDS = 86400
+
+# Check-and-reserve in one round trip: only increments while under the limit.
+# Returns {allowed (0/1), usage after the call}.
+RESERVE_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current >= tonumber(ARGV[1]) then
+    return {0, current}
+end
+current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return {1, current}
+"""
+
+# Give back a reservation (tool failure, cache hit). Never goes below zero.
+REFUND_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if current > 0 then
+    return redis.call('DECR', KEYS[1])
+end
+return 0
+"""
+
+
+class BoundedCounterStore:
+    """In-memory fallback: per-key counters with a fixed TTL and a size cap.
+
+    Every key gets the same TTL from its first write, so insertion order is
+    also expiry order: expired keys are popped from the front in O(1), and
+    when the cap is hit the oldest key is dropped first.
+    """
+
+    def __init__(self, max_keys=100000, ttl=WINDOW_SECONDS):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> [count, expires_at]
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._data:
+            key, (count, expires_at) = next(iter(self._data.items()))
+            if expires_at > now and len(self._data) <= self.max_keys:
+                break
+            self._data.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if not entry or entry[1] <= time.time():
+                return 0
+            return entry[0]
+
+    def reserve(self, key, limit):
+        with self._lock:
+            now = time.time()
+            entry = self._data.get(key)
+            if entry and entry[1] <= now:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                if limit <= 0:
+                    return False, 0
+                self._data[key] = [1, now + self.ttl]
+                self._prune(now)
+                return True, 1
+            if entry[0] >= limit:
+                return False, entry[0]
+            entry[0] += 1
+            return True, entry[0]
+
+    def refund(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > 0:
+                entry[0] -= 1
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RateLimiter:
+    """Daily limiter per IP (free tier, contact form). Redis (atomic Lua) with in-memory fallback."""
+
+    def __init__(self, limit, redis_client=None, max_keys=100000, prefix='rate_limit'):
+        self.limit = limit
+        self.prefix = prefix
+        self.redis = redis_client
+        self.memory = BoundedCounterStore(max_keys=max_keys)
+        self._reserve = redis_client.register_script(RESERVE_SCRIPT) if redis_client else None
+        self._refund = redis_client.register_script(REFUND_SCRIPT) if redis_client else None
+
+    def key(self, ip):
+        today = time.strftime('%Y-%m-%d')
+        return f"{self.prefix}:{ip}:{today}"
+
+    def usage(self, ip):
+        key = self.key(ip)
+        if self.redis:
+            try:
+                with stage('redis'):
+                    val = self.redis.get(key)
+                return int(val) if val else 0
+            except Exception as e:
+                print(f"⚠️ Redis READ error: {e}")
+                pass # Fallback to memory
+        return self.memory.get(key)
+
+    def reserve(self, ip):
+        """Atomically take one use if under the limit. Returns True if taken."""
+        key = self.key(ip)
+        if self._reserve:
+            try:
+                with stage('redis'):
+                    allowed, _ = self._reserve(keys=[key], args=[self.limit, WINDOW_SECONDS])
+                return bool(allowed)
+            except Exception as e:
+                print(f"⚠️ Redis WRITE error: {e}")
+                pass
+        allowed, _ = self.memory.reserve(key, self.limit)
+        return allowed
+
+    def refund(self, ip):
+        key = self.key(ip)
+        if self._refund:
+            try:
+                with stage('redis'):
+                    self._refund(keys=[key])
+                return
+            except Exception as e:
+                print(f"⚠️ Redis WRITE error: {e}")
+                pass
+        self.memory.refund(key)
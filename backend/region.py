@@ -0,0 +1,93 @@
+import os
+import time
+
+from metrics import stage
+from preprocess import read_orientation, record_timing
+
+# GeminiWatermarkTool picks its template from the image size: 96x96 logo with a
+# 64px margin when both sides are > 1024, else 48x48 with 32px. The tile keeps
+# both sides above 1024 so the tool sees the same scale it would on the full image.
+TOOL_LARGE_THRESHOLD = 1024
+TILE_SIZE = 1040
+# Only worth it when the tile is a small part of the image
+MAX_TILE_FRACTION = 0.5
+
+# Same settings the full-image path has always used, to prevent generation loss:
+# lossless WebP, and JPEG at quality 100 without chroma subsampling (4:4:4)
+OUTPUT_FORMATS = {
+    'jpg': ('JPEG', {'quality': 100, 'subsampling': 0}),
+    'jpeg': ('JPEG', {'quality': 100, 'subsampling': 0}),
+    'png': ('PNG', {}),
+    'webp': ('WEBP', {'lossless': True}),
+}
+
+
+def region_box(width, height):
+    """Bottom-right tile (left, top, right, bottom), or None if the full image should be used."""
+    if width <= TOOL_LARGE_THRESHOLD or height <= TOOL_LARGE_THRESHOLD:
+        return None
+    if TILE_SIZE * TILE_SIZE > width * height * MAX_TILE_FRACTION:
+        return None
+    return (width - TILE_SIZE, height - TILE_SIZE, width, height)
+
+
+def process_region(input_path, ext, output_path, run_tool, on_clean=None):
+    """Clean only the watermark corner: crop, run the tool on the tile, paste back.
+
+    Returns False (without touching anything) when the image is too small for a
+    tile to pay off; the caller then runs the full-image pipeline. on_clean, if
+    given, gets the cleaned canvas and the original tile before it is encoded.
+    """
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    base = os.path.splitext(input_path)[0]
+    tile_in = f"{base}_tile.bmp"
+    tile_out = f"{base}_tile_clean.bmp"
+
+    with Image.open(input_path) as img:
+        orientation = read_orientation(img)
+        width, height = img.size
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+        box = region_box(width, height)
+        if box is None:
+            return False
+
+        # Untouched JPEGs are pasted into in place so they can be re-saved with
+        # their own quantization tables and subsampling (quality='keep').
+        keep_jpeg = img.format == 'JPEG' and img.mode == 'RGB' and orientation in (0, 1)
+        with stage('convert'):
+            if keep_jpeg:
+                img.load()
+                canvas = img
+            else:
+                canvas = ImageOps.exif_transpose(img)
+                if canvas.mode != 'RGB':
+                    canvas = canvas.convert('RGB')
+
+        try:
+            tile = canvas.crop(box)
+            with stage('encode'):
+                tile.save(tile_in, format='BMP')
+            run_tool(tile_in, tile_out)
+            with Image.open(tile_out) as cleaned:
+                canvas.paste(cleaned.convert('RGB'), box[:2])
+        finally:
+            for path in (tile_in, tile_out):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        if on_clean:
+            on_clean(canvas, tile)
+
+        pil_format, save_kwargs = OUTPUT_FORMATS.get(ext, OUTPUT_FORMATS['png'])
+        if keep_jpeg:
+            save_kwargs = {'quality': 'keep', 'subsampling': 'keep'}
+        if img.info.get('icc_profile'):
+            save_kwargs = dict(save_kwargs, icc_profile=img.info['icc_profile'])
+        with stage('encode'):
+            canvas.save(output_path, format=pil_format, **save_kwargs)
+
+    record_timing(img.format or ext.upper(), 'region', time.perf_counter() - start)
+    return True
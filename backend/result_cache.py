@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import threading
+
+from fsutil import link_or_copy
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """SHA-256 of the raw upload bytes."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Content-addressed cache of cleaned outputs, keyed by SHA-256 of the upload.
+
+    Entries live in `folder` as `<sha256>.<ext>` (a hard link to the output when
+    possible) plus `<sha256>.<ext>.json` with the /api/remove payload (download id,
+    preview kinds, watermark_found). The entry's mtime is
+    its LRU clock: hits touch it, and inserts evict the least recently used
+    entries until the folder is back under `max_bytes`. Being plain files, the
+    cache is shared by every worker on the node.
+    """
+
+    def __init__(self, folder, output_folder, max_bytes):
+        self.folder = folder
+        self.output_folder = output_folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _paths(self, digest, ext):
+        base = os.path.join(self.folder, digest)
+        return f"{base}.{ext}", f"{base}.{ext}.json"
+
+    def lookup(self, digest, ext):
+        """Return the stored /api/remove payload for this upload, or None."""
+        if not self.enabled:
+            return None
+        data_path, meta_path = self._paths(digest, ext)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+            # The download copy may have been cleaned up; re-publish it under the same id
+            output_path = os.path.join(self.output_folder, meta['filename'])
+            if not os.path.exists(output_path):
+                link_or_copy(data_path, output_path)
+
+            os.utime(data_path)
+            os.utime(meta_path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return {
+            'success': True,
+            'download_id': meta['download_id'],
+            'filename': meta['filename'],
+            # Only removals are stored; entries from before previews existed have none
+            'watermark_found': meta.get('watermark_found', True),
+            'previews': meta.get('previews', []),
+        }
+
+    def store(self, digest, ext, result):
+        if not self.enabled:
+            return
+        data_path, meta_path = self._paths(digest, ext)
+        try:
+            link_or_copy(os.path.join(self.output_folder, result['filename']), data_path + '.tmp')
+            os.replace(data_path + '.tmp', data_path)
+            with open(meta_path + '.tmp', 'w') as f:
+                json.dump({
+                    'download_id': result['download_id'],
+                    'filename': result['filename'],
+                    'watermark_found': result.get('watermark_found', True),
+                    'previews': result.get('previews', []),
+                }, f)
+            os.replace(meta_path + '.tmp', meta_path)
+        except OSError as e:
+            print(f"⚠️ Result cache write failed: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its byte budget."""
+        entries = {}
+        total = 0
+        for name in os.listdir(self.folder):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest = name.split('.', 1)[0]
+            entry = entries.setdefault(digest, {'paths': [], 'size': 0, 'mtime': 0})
+            entry['paths'].append(path)
+            entry['size'] += st.st_size
+            entry['mtime'] = max(entry['mtime'], st.st_mtime)
+            total += st.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        for digest, entry in sorted(entries.items(), key=lambda item: item[1]['mtime']):
+            for path in entry['paths']:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= entry['size']
+            with self._lock:
+                self.evictions += 1
+            if total <= self.max_bytes:
+                break
+
+    def release(self, paths):
+        """Drop the entries hard-linked to any of `paths` (outputs about to be
+        evicted), so unlinking those outputs actually frees their blocks."""
+        inodes = set()
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                inodes.add((st.st_dev, st.st_ino))
+        if not inodes:
+            return
+        for name in os.listdir(self.folder):
+            if name.endswith(('.json', '.tmp')):
+                continue
+            data_path = os.path.join(self.folder, name)
+            try:
+                st = os.stat(data_path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) not in inodes:
+                continue
+            for path in (data_path, data_path + '.json'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
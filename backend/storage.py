@@ -0,0 +1,139 @@
+import mimetypes
+import os
+
+from config import (
+    OUTPUT_FOLDER, STORAGE_BACKEND, S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL, S3_REGION,
+    S3_PART_SIZE, S3_PRESIGN_TTL
+)
+from fsutil import link_or_copy
+from metrics import stage
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def is_not_found(error):
+    """True for a storage client error meaning the object does not exist."""
+    code = (getattr(error, 'response', None) or {}).get('Error', {}).get('Code')
+    return code in ('404', 'NoSuchKey', 'NotFound')
+
+
+class LocalStorage:
+    """Outputs served straight from a folder on this node (the default).
+
+    The pipeline already writes into OUTPUT_FOLDER, so put() is a no-op for
+    files that are in place. Downloads only work on the node that produced
+    the file, and are served from the path in the file index.
+    """
+
+    remote = False
+
+    def __init__(self, root=OUTPUT_FOLDER):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def put(self, key, path):
+        target = self._path(key)
+        if os.path.abspath(path) != os.path.abspath(target):
+            link_or_copy(path, target)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def presigned_url(self, key, download_name=None, ttl=S3_PRESIGN_TTL):
+        return None
+
+
+class S3Storage:
+    """Outputs in an S3-compatible bucket, so any replica can serve any download.
+
+    Files up to `part_size` go up in one PUT; larger ones stream as a
+    multipart upload, one part in memory at a time, and the upload is
+    aborted if any part fails. Downloads either redirect to a presigned
+    GET or stream the object body in chunks. `client` is any object with
+    the boto3 S3 client methods used here; by default one is built from
+    S3_ENDPOINT_URL / S3_REGION (MinIO, R2, etc. work as well as AWS).
+    """
+
+    remote = True
+
+    def __init__(self, bucket=S3_BUCKET, prefix=S3_PREFIX, client=None, part_size=S3_PART_SIZE):
+        if not bucket:
+            raise ValueError('S3_BUCKET is required for STORAGE_BACKEND=s3')
+        if client is None:
+            import boto3
+            client = boto3.client('s3', endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def put(self, key, path):
+        content_type = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        with stage('storage'), open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size <= self.part_size:
+                self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=f, ContentType=content_type)
+                return
+            upload = self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(key), ContentType=content_type)
+            parts = []
+            try:
+                while True:
+                    chunk = f.read(self.part_size)
+                    if not chunk:
+                        break
+                    number = len(parts) + 1
+                    part = self.client.upload_part(
+                        Bucket=self.bucket, Key=self._key(key), UploadId=upload['UploadId'],
+                        PartNumber=number, Body=chunk
+                    )
+                    parts.append({'PartNumber': number, 'ETag': part['ETag']})
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self._key(key), UploadId=upload['UploadId'],
+                    MultipartUpload={'Parts': parts}
+                )
+            except BaseException:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload['UploadId'])
+                raise
+
+    def exists(self, key):
+        try:
+            with stage('storage'):
+                self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except Exception as e:
+            if is_not_found(e):
+                return False
+            raise
+
+    def open(self, key):
+        """Streaming body of the object (has iter_chunks() and close())."""
+        with stage('storage'):
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+
+    def delete(self, key):
+        with stage('storage'):
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def presigned_url(self, key, download_name=None, ttl=S3_PRESIGN_TTL):
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if download_name:
+            params['ResponseContentDisposition'] = f'attachment; filename="{download_name}"'
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=ttl)
+
+
+def get_storage():
+    """Output storage selected by STORAGE_BACKEND."""
+    if STORAGE_BACKEND == 's3':
+        return S3Storage()
+    return LocalStorage()
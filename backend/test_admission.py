@@ -0,0 +1,100 @@
+import unittest
+import tempfile
+import threading
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from admission import AdmissionController, PRIORITY_FREE, PRIORITY_PRO
+from errors import ProcessingError
+
+
+class TestAdmission(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.controller = AdmissionController(folder=self.tmp, slots=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_slot_is_released(self):
+        with self.controller.slot():
+            self.assertEqual(self.controller.stats()['in_flight'], 1)
+        self.assertEqual(self.controller.stats()['in_flight'], 0)
+
+    def test_unsampled_slot_keeps_service_estimate(self):
+        before = self.controller.stats()['service_seconds']
+        with self.controller.slot(sample=False):
+            pass
+        self.assertEqual(self.controller.stats()['service_seconds'], before)
+
+    def test_overloaded_rejected_with_retry_after(self):
+        with self.controller.slot():
+            # One holder, seeded 2s service time: the next request would wait ~2s
+            with self.assertRaises(ProcessingError) as ctx:
+                with self.controller.slot(max_wait=0.5):
+                    pass
+        self.assertEqual((ctx.exception.status, ctx.exception.code), (503, 'OVERLOADED'))
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(self.controller.stats()['queued'], 0)
+
+    def test_pro_served_before_earlier_free(self):
+        order = []
+        release = threading.Event()
+
+        def hold():
+            with self.controller.slot():
+                release.wait(2)
+
+        def wait_for_slot(name, priority):
+            with self.controller.slot(priority):
+                order.append(name)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        while self.controller.stats()['in_flight'] == 0:
+            time.sleep(0.01)
+        free = threading.Thread(target=wait_for_slot, args=('free', PRIORITY_FREE))
+        free.start()
+        while self.controller.stats()['queued'] == 0:
+            time.sleep(0.01)
+        pro = threading.Thread(target=wait_for_slot, args=('pro', PRIORITY_PRO))
+        pro.start()
+        while self.controller.stats()['queued'] < 2:
+            time.sleep(0.01)
+        release.set()
+        for t in (holder, free, pro):
+            t.join(5)
+        self.assertEqual(order, ['pro', 'free'])
+
+    def test_memory_budget_limits_concurrency(self):
+        controller = AdmissionController(folder=self.tmp, slots=4, memory_bytes=100)
+        with controller.slot(cost=20), controller.slot(cost=20):
+            self.assertEqual(controller.stats()['memory_used'], 40)
+            # Half the budget or more runs alone: it would have to wait
+            self.assertGreater(controller.predicted_wait(cost=60), 0)
+            self.assertEqual(controller.predicted_wait(cost=20), 0)
+        self.assertEqual(controller.charge(60), 100)
+        self.assertEqual(controller.predicted_wait(cost=60), 0)
+
+    def test_large_job_at_head_is_not_starved(self):
+        controller = AdmissionController(folder=self.tmp, slots=4, memory_bytes=100)
+        with controller._state() as state:
+            state['holders']['h'] = {'pid': os.getpid(), 'since': time.time(), 'cost': 30}
+            state['waiters']['big'] = {'pid': os.getpid(), 'priority': PRIORITY_FREE, 'since': 1, 'cost': 100}
+            state['waiters']['small'] = {'pid': os.getpid(), 'priority': PRIORITY_FREE, 'since': 2, 'cost': 10}
+            self.assertEqual(controller._grantable(state), [])
+            del state['holders']['h']
+            self.assertEqual(controller._grantable(state), ['big'])
+
+    def test_dead_process_entries_dropped(self):
+        with self.controller._state() as state:
+            state['holders']['gone'] = {'pid': 2 ** 22 + 1, 'since': time.time(), 'cost': 0}
+        self.assertEqual(self.controller.stats()['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
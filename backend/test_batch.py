@@ -0,0 +1,84 @@
+import unittest
+import tempfile
+import zipfile
+import shutil
+import sys
+import io
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import batch
+from batch import BatchError, collect_items, _StreamBuffer, _unique
+
+
+class TestCollectItems(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._upload_folder = batch.UPLOAD_FOLDER
+        batch.UPLOAD_FOLDER = self.tmp
+
+    def tearDown(self):
+        batch.UPLOAD_FOLDER = self._upload_folder
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data=b'x'):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return {'name': name, 'path': path}
+
+    def make_zip(self, members):
+        path = os.path.join(self.tmp, 'in.zip')
+        with zipfile.ZipFile(path, 'w') as zf:
+            for name, data in members.items():
+                zf.writestr(name, data)
+        return {'name': 'in.zip', 'path': path}
+
+    def test_plain_files_keep_errors_per_item(self):
+        items = collect_items([self.write('a.png'), self.write('b.gif')])
+        self.assertEqual(items[0]['ext'], 'png')
+        self.assertIn('error', items[1])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, 'b.gif')))
+
+    def test_zip_is_expanded_and_removed(self):
+        upload = self.make_zip({'dir/a.jpg': b'1', '__MACOSX/dir/._a.jpg': b'', 'notes.txt': b'2', 'dir/': b''})
+        items = collect_items([upload])
+        self.assertEqual([i['name'] for i in items], ['a.jpg', 'notes.txt'])
+        self.assertTrue(os.path.exists(items[0]['path']))
+        self.assertIn('error', items[1])
+        self.assertFalse(os.path.exists(upload['path']))
+
+    def test_zip_member_count_capped(self):
+        upload = self.make_zip({f'{i}.png': b'' for i in range(batch.BATCH_MAX_FILES + 1)})
+        with self.assertRaises(BatchError):
+            collect_items([upload])
+        # Members extracted before the cap was hit are not left behind
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_invalid_zip(self):
+        with self.assertRaises(BatchError):
+            collect_items([self.write('in.zip', b'not a zip')])
+
+
+class TestStreaming(unittest.TestCase):
+    def test_zip_written_through_buffer_is_readable(self):
+        buffer = _StreamBuffer()
+        out = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as zf:
+            zf.writestr('a.txt', b'hello')
+            out.write(buffer.drain())
+            zf.writestr('manifest.json', b'[]')
+        out.write(buffer.drain())
+        with zipfile.ZipFile(out) as zf:
+            self.assertEqual(zf.read('a.txt'), b'hello')
+            self.assertEqual(zf.namelist(), ['a.txt', 'manifest.json'])
+
+    def test_unique_names(self):
+        used = set()
+        self.assertEqual(_unique('a.png', used), 'a.png')
+        self.assertEqual(_unique('a.png', used), 'a (1).png')
+
+
+if __name__ == '__main__':
+    unittest.main()
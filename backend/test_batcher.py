@@ -0,0 +1,104 @@
+import unittest
+import tempfile
+import threading
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from batcher import ToolBatcher
+
+# Directory-mode stub: copies every input except files whose content is "bad"; hangs on "hang"
+STUB_TOOL = """#!{python}
+import os, shutil, sys, time
+src, dst = sys.argv[2], sys.argv[4]
+for name in sorted(os.listdir(src)):
+    content = open(os.path.join(src, name)).read()
+    if content == 'hang':
+        time.sleep(30)
+    if content != 'bad':
+        shutil.copyfile(os.path.join(src, name), os.path.join(dst, name))
+"""
+
+
+class TestToolBatcher(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.tool = os.path.join(self.tmp, 'tool')
+        with open(self.tool, 'w') as f:
+            f.write(STUB_TOOL.format(python=sys.executable))
+        os.chmod(self.tool, 0o755)
+        self.single_runs = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def run_single(self, input_path, output_path):
+        self.single_runs.append(input_path)
+        if open(input_path).read() == 'bad':
+            raise RuntimeError('tool failed')
+        shutil.copyfile(input_path, output_path)
+
+    def make_input(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_batch_fans_out_and_isolates_failures(self):
+        batcher = ToolBatcher(self.tool, self.run_single, os.path.join(self.tmp, 'staging'),
+                              window_ms=200, max_items=3)
+        inputs = [self.make_input('a.jpg', 'a'), self.make_input('b.png', 'bad'), self.make_input('c.jpg', 'c')]
+        outputs = [os.path.join(self.tmp, f'out_{n}.jpg') for n in range(3)]
+        errors = {}
+
+        def call(n):
+            try:
+                batcher.run(inputs[n], outputs[n])
+            except Exception as e:
+                errors[n] = e
+
+        threads = [threading.Thread(target=call, args=(n,)) for n in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+
+        self.assertEqual(batcher.batches, 1)
+        self.assertEqual(open(outputs[0]).read(), 'a')
+        self.assertEqual(open(outputs[2]).read(), 'c')
+        self.assertFalse(os.path.exists(outputs[1]))
+        self.assertIsInstance(errors.get(1), RuntimeError)
+        self.assertEqual(set(errors), {1})
+        # Only the failed item was retried on its own
+        self.assertEqual(self.single_runs, [inputs[1]])
+
+    def test_hung_batch_is_bounded_by_one_timeout(self):
+        batcher = ToolBatcher(self.tool, self.run_single, os.path.join(self.tmp, 'staging'),
+                              window_ms=200, max_items=3, timeout=1)
+        inputs = [self.make_input('a.jpg', 'a'), self.make_input('b.jpg', 'hang'), self.make_input('c.jpg', 'c')]
+        outputs = [os.path.join(self.tmp, f'out_{n}.jpg') for n in range(3)]
+        start = time.monotonic()
+        threads = [threading.Thread(target=batcher.run, args=(inputs[n], outputs[n])) for n in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(10)
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([open(path).read() for path in outputs], ['a', 'hang', 'c'])
+        # Unfinished items (and the newest output, possibly half written) are redone on their own
+        self.assertIn(inputs[1], self.single_runs)
+        self.assertIn(inputs[2], self.single_runs)
+
+    def test_single_item_skips_staging(self):
+        batcher = ToolBatcher(self.tool, self.run_single, os.path.join(self.tmp, 'staging'), window_ms=10)
+        output = os.path.join(self.tmp, 'out.jpg')
+        batcher.run(self.make_input('a.jpg', 'a'), output)
+        self.assertEqual(open(output).read(), 'a')
+        self.assertEqual(batcher.batches, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import tarfile
+import shutil
+import json
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cli
+from cli import iter_sources, load_manifest, trim_torn_line
+
+
+class TestSources(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmp, 'src')
+        self.scratch = os.path.join(self.tmp, 'scratch')
+        os.makedirs(os.path.join(self.src, 'sub'))
+        os.makedirs(self.scratch)
+        for name in ('a.jpg', 'sub/b.PNG', 'notes.txt'):
+            with open(os.path.join(self.src, name), 'wb') as f:
+                f.write(name.encode())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_directory_walk_filters_and_stages(self):
+        sources = list(iter_sources(self.src, self.scratch))
+        self.assertEqual([rel for rel, _, _ in sources], ['a.jpg', os.path.join('sub', 'b.PNG')])
+        staged = sources[1][2]()
+        self.assertTrue(staged.startswith(self.scratch))
+        self.assertTrue(staged.endswith('.png'))
+        self.assertEqual(open(staged, 'rb').read(), b'sub/b.PNG')
+
+    def test_tarball_members_staged_lazily(self):
+        tar_path = os.path.join(self.tmp, 'in.tar.gz')
+        with tarfile.open(tar_path, 'w:gz') as tar:
+            tar.add(self.src, arcname='src')
+        staged = [(rel, stage()) for rel, _, stage in iter_sources(tar_path, self.scratch)]
+        self.assertEqual([rel for rel, _ in staged], ['src/a.jpg', 'src/sub/b.PNG'])
+        self.assertEqual(open(staged[0][1], 'rb').read(), b'a.jpg')
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write(json.dumps({'path': 'a.jpg', 'status': 'ok'}) + '\n')
+            f.write(json.dumps({'path': 'b.jpg', 'status': 'error'}) + '\n')
+            f.write('{"path": "c.jp')  # Interrupted mid-write
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_resume_skips_recorded_files(self):
+        self.assertEqual(load_manifest(self.path), {'a.jpg', 'b.jpg'})
+
+    def test_retry_failed(self):
+        self.assertEqual(load_manifest(self.path, retry_failed=True), {'a.jpg'})
+
+    def test_torn_line_is_trimmed_before_appending(self):
+        trim_torn_line(self.path)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'path': 'c.jpg', 'status': 'ok'}) + '\n')
+        self.assertEqual(load_manifest(self.path, retry_failed=True), {'a.jpg', 'c.jpg'})
+
+
+class TestRun(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_unreadable_source_is_recorded_not_fatal(self):
+        def sources(source, scratch):
+            def stage():
+                raise FileNotFoundError('gone')
+            yield 'a.jpg', 3, stage
+
+        dest = os.path.join(self.tmp, 'dest')
+        with patch.object(cli, 'iter_sources', sources):
+            progress = cli.run(self.tmp, dest, workers=1, report_every=3600)
+        self.assertEqual((progress.ok, progress.failed), (0, 1))
+        with open(os.path.join(dest, cli.MANIFEST_NAME)) as f:
+            record = json.loads(f.read())
+        self.assertEqual((record['path'], record['status']), ('a.jpg', 'error'))
+
+
+if __name__ == '__main__':
+    unittest.main()
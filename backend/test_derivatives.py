@@ -0,0 +1,69 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from config import PREVIEW_MAX_SIZE, THUMB_MAX_SIZE
+from derivatives import corner_box, derivative_path, derivatives_from_files, write_derivatives
+from region import process_region
+
+
+class TestDerivatives(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def open(self, file_id, kind):
+        with Image.open(derivative_path(file_id, kind, self.tmp)) as img:
+            img.load()
+            return img
+
+    def test_sizes_and_no_corners_without_watermark(self):
+        Image.new('RGB', (3000, 2000), 'gray').save(self.path('in.png'))
+        kinds = derivatives_from_files('f1', self.path('in.png'), self.path('in.png'), watermark=False, folder=self.tmp)
+        self.assertEqual(kinds, ['preview', 'thumb'])
+        self.assertEqual(self.open('f1', 'preview').size, (PREVIEW_MAX_SIZE, round(2000 * PREVIEW_MAX_SIZE / 3000)))
+        self.assertEqual(max(self.open('f1', 'thumb').size), THUMB_MAX_SIZE)
+        self.assertFalse(os.path.exists(derivative_path('f1', 'before', self.tmp)))
+
+    def test_small_image_is_not_upscaled(self):
+        Image.new('RGB', (200, 100), 'gray').save(self.path('in.png'))
+        derivatives_from_files('f1', self.path('in.png'), self.path('in.png'), watermark=False, folder=self.tmp)
+        self.assertEqual(self.open('f1', 'preview').size, (200, 100))
+
+    def test_region_corners_come_from_the_canvas(self):
+        Image.new('RGB', (3000, 2000), (200, 0, 0)).save(self.path('in.png'))
+        written = []
+
+        def run_tool(tile_in, tile_out):
+            with Image.open(tile_in) as tile:
+                Image.new('RGB', tile.size, (0, 0, 200)).save(tile_out, format='BMP')
+
+        def on_clean(canvas, tile):
+            written.extend(write_derivatives('f1', canvas, tile, folder=self.tmp))
+
+        self.assertTrue(process_region(self.path('in.png'), 'png', self.path('out.png'), run_tool, on_clean))
+        self.assertEqual(written, ['preview', 'thumb', 'before', 'after'])
+        left, top, right, bottom = corner_box(3000, 2000)
+        before, after = self.open('f1', 'before'), self.open('f1', 'after')
+        self.assertEqual(before.size, (right - left, bottom - top))
+        self.assertEqual(after.size, before.size)
+        # JPEG: compare dominant channels, not exact values
+        r, g, b = before.getpixel((10, 10))
+        self.assertGreater(r, b)
+        r, g, b = after.getpixel((10, 10))
+        self.assertGreater(b, r)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from detect import draw_sparkle, has_watermark, logo_box, watermark_score
+
+
+def stamp(img, opacity=0.5):
+    """Blend a white sparkle into the corner the way Gemini does.
+
+    This is the detector's own drawn template, so the tests cover the mechanics
+    (crop, scaling, orientation, draft decode), not accuracy on real watermarks;
+    that is measured with benchmarks/bench_detect.py --samples.
+    """
+    left, top, right, bottom = logo_box(*img.size)
+    alpha = draw_sparkle(right - left) * opacity
+    corner = np.asarray(img.crop((left, top, right, bottom)), dtype=np.float32)
+    blended = corner * (1 - alpha[..., None]) + 255 * alpha[..., None]
+    img.paste(Image.fromarray(blended.astype(np.uint8)), (left, top))
+    return img
+
+
+@unittest.skipUnless(np, 'numpy not installed')
+class TestDetect(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.rng = np.random.default_rng(7)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def save(self, name, img, **kwargs):
+        path = os.path.join(self.tmp, name)
+        img.save(path, **kwargs)
+        return path
+
+    def photo(self, size):
+        # Smooth gradient plus grain, so the corner is neither flat nor pure noise
+        w, h = size
+        ramp = np.linspace(40, 180, w)[None, :, None] + np.linspace(0, 40, h)[:, None, None]
+        grain = self.rng.normal(0, 12, (h, w, 3))
+        return Image.fromarray(np.clip(ramp + grain, 0, 255).astype(np.uint8))
+
+    def test_logo_geometry(self):
+        self.assertEqual(logo_box(2048, 2048), (1888, 1888, 1984, 1984))
+        self.assertEqual(logo_box(1024, 2048), (944, 1968, 992, 2016))
+
+    def test_watermarked_large_jpeg_detected(self):
+        path = self.save('a.jpg', stamp(self.photo((1600, 1200))), quality=90)
+        self.assertTrue(has_watermark(path))
+
+    def test_watermarked_small_png_detected(self):
+        path = self.save('a.png', stamp(self.photo((800, 600))))
+        self.assertTrue(has_watermark(path))
+
+    def test_clean_image_not_detected(self):
+        for name in ('a.jpg', 'a.png'):
+            path = self.save(name, self.photo((1600, 1200)))
+            self.assertFalse(has_watermark(path), name)
+
+    def test_flat_corner_scores_zero(self):
+        path = self.save('a.png', Image.new('RGB', (800, 600), 'white'))
+        self.assertEqual(watermark_score(path), 0.0)
+
+    def test_exif_rotation_uses_display_corner(self):
+        # Stamped in display orientation, stored rotated with orientation 6 (rotate 90 CW to view)
+        shown = stamp(self.photo((1200, 1600)))
+        stored = shown.transpose(Image.Transpose.ROTATE_90)
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        path = self.save('a.jpg', stored, quality=90, exif=exif)
+        self.assertTrue(has_watermark(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
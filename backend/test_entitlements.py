@@ -0,0 +1,88 @@
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from entitlements import EntitlementCache, CircuitBreaker
+
+
+class FakeSource:
+    def __init__(self, answer=(False, None)):
+        self.answer = answer
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self, user_id):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError('supabase down')
+        return self.answer
+
+
+class TestEntitlementCache(unittest.TestCase):
+    def test_positive_and_negative_answers_are_cached(self):
+        source = FakeSource((True, None))
+        cache = EntitlementCache(source)
+        self.assertTrue(cache.is_pro('u1'))
+        self.assertTrue(cache.is_pro('u1'))
+        source.answer = (False, None)
+        self.assertFalse(cache.is_pro('u2'))
+        self.assertFalse(cache.is_pro('u2'))
+        self.assertEqual(source.calls, 2)
+
+    def test_never_cached_past_expiry(self):
+        source = FakeSource((True, time.time() + 0.05))
+        cache = EntitlementCache(source)
+        self.assertTrue(cache.is_pro('u1'))
+        time.sleep(0.06)
+        source.answer = (False, None)
+        self.assertFalse(cache.is_pro('u1'))
+        self.assertEqual(source.calls, 2)
+
+    def test_invalidate_forces_refetch(self):
+        source = FakeSource((False, None))
+        cache = EntitlementCache(source)
+        self.assertFalse(cache.is_pro('u1'))
+        source.answer = (True, None)
+        cache.invalidate('u1')
+        self.assertTrue(cache.is_pro('u1'))
+
+    def test_invalidate_reaches_other_workers_without_redis(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        source = FakeSource((False, None))
+        webhook_worker = EntitlementCache(source, folder=folder)
+        other_worker = EntitlementCache(source, folder=folder)
+        self.assertFalse(other_worker.is_pro('u1'))
+        source.answer = (True, None)
+        webhook_worker.invalidate('u1')
+        self.assertTrue(other_worker.is_pro('u1'))
+        self.assertTrue(other_worker.is_pro('u1'))
+        self.assertEqual(source.calls, 2)
+
+    def test_open_circuit_serves_stale_answer(self):
+        source = FakeSource((True, None))
+        cache = EntitlementCache(source, breaker=CircuitBreaker(threshold=1, reset_after=60))
+        self.assertTrue(cache.is_pro('u1'))
+        cache._local['u1'] = (True, 0, None)  # Expire it
+        source.fail = True
+        self.assertTrue(cache.is_pro('u1'))
+        self.assertEqual(cache.breaker.state, 'open')
+        # Open circuit: no further calls reach the source
+        self.assertFalse(cache.is_pro('u2'))
+        self.assertEqual(source.calls, 2)
+
+    def test_stale_expiring_pro_is_not_extended(self):
+        source = FakeSource()
+        source.fail = True
+        cache = EntitlementCache(source)
+        cache._local['u1'] = (True, 0, time.time() - 1)
+        self.assertFalse(cache.is_pro('u1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
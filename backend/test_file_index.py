@@ -0,0 +1,47 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from file_index import FileIndex, file_id_from_output
+
+
+class TestFileIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.index = FileIndex(folder=os.path.join(self.tmp, 'index'))
+        self.output = os.path.join(self.tmp, 'abc_clean.png')
+        with open(self.output, 'wb') as f:
+            f.write(b'x' * 42)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_add_and_get(self):
+        self.index.add('abc', self.output)
+        entry = self.index.get('abc')
+        self.assertEqual(entry['path'], self.output)
+        self.assertEqual(entry['size'], 42)
+        self.assertEqual(entry['content_type'], 'image/png')
+        self.assertIsNone(self.index.get('ab'))
+
+    def test_missing_file_drops_entry(self):
+        self.index.add('abc', self.output)
+        os.remove(self.output)
+        self.assertIsNone(self.index.get('abc'))
+        self.assertFalse(os.listdir(os.path.join(self.tmp, 'index')))
+
+    def test_remove(self):
+        self.index.add('abc', self.output)
+        self.index.remove('abc')
+        self.assertIsNone(self.index.get('abc'))
+
+    def test_file_id_from_output(self):
+        self.assertEqual(file_id_from_output('1f0e-77_clean.webp'), '1f0e-77')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import janitor
+from janitor import Janitor
+from result_cache import ResultCache
+
+
+class TestJanitor(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.outputs = os.path.join(self.tmp, 'outputs')
+        os.makedirs(self.outputs)
+        self.patcher = patch.object(janitor, 'JANITOR_FOLDER', os.path.join(self.tmp, 'janitor'))
+        self.patcher.start()
+        self.deleted = []
+        self.janitor = Janitor(self.outputs, on_delete=self.deleted.append)
+        self.janitor.max_bytes = 1000
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, size=100, ttl=3600):
+        path = os.path.join(self.outputs, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        janitor.track(path, ttl=ttl)
+        return path
+
+    def test_leader_is_exclusive(self):
+        other = Janitor(self.outputs)
+        self.assertTrue(self.janitor._is_leader())
+        self.assertFalse(other._is_leader())
+
+    def test_expiry_is_incremental(self):
+        old = self.write('old_clean.jpg', ttl=-1)
+        fresh = self.write('fresh_clean.jpg')
+        self.janitor.tick()
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(fresh))
+        self.assertEqual(self.deleted, [old])
+        self.assertEqual(self.janitor.metrics['files_reclaimed'], 1)
+        self.assertEqual(self.janitor.metrics['bytes_reclaimed'], 100)
+        self.assertEqual(self.janitor.stats()['tracked_bytes'], 100)
+
+    def test_retrack_extends_expiry(self):
+        path = self.write('a_clean.jpg', ttl=1)
+        janitor.track(path, ttl=3600)
+        self.janitor.tick(now=time.time() + 10)
+        self.assertTrue(os.path.exists(path))
+
+    def test_quota_evicts_oldest_first(self):
+        paths = [self.write(f'{n}_clean.jpg', size=400, ttl=3600 + n) for n in range(3)]
+        self.janitor.tick()
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+        self.assertTrue(os.path.exists(paths[2]))
+        self.assertEqual(self.janitor.metrics['quota_evictions'], 1)
+
+    def test_quota_frees_outputs_shared_with_the_cache(self):
+        cache = ResultCache(os.path.join(self.tmp, 'cache'), self.outputs, max_bytes=10 ** 6)
+        self.janitor.on_evict = cache.release
+        for n in range(4):
+            path = self.write(f'{n}_clean.jpg', size=400, ttl=3600 + n)
+            cache.store(f'digest{n}', 'jpg', {'download_id': str(n), 'filename': os.path.basename(path)})
+        self.janitor.tick()
+
+        # Count each inode once: the blocks actually in use across outputs and cache
+        on_disk = {}
+        for folder in (self.outputs, cache.folder):
+            for name in os.listdir(folder):
+                st = os.stat(os.path.join(folder, name))
+                on_disk[(st.st_dev, st.st_ino)] = st.st_size
+        self.assertLessEqual(sum(on_disk.values()), self.janitor.max_bytes)
+        self.assertEqual(self.janitor.metrics['quota_bytes_reclaimed'], 800)
+        self.assertIsNone(cache.lookup('digest0', 'jpg'))
+        self.assertIsNotNone(cache.lookup('digest3', 'jpg'))
+
+    def test_journal_rotation_keeps_entries(self):
+        with patch.object(janitor, 'JOURNAL_MAX_BYTES', 10):
+            first = self.write('a_clean.jpg', ttl=-1)
+            self.janitor.tick()
+            second = self.write('b_clean.jpg', ttl=-1)
+            self.janitor.tick()
+        self.assertFalse(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+
+
+if __name__ == '__main__':
+    unittest.main()
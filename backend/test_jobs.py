@@ -0,0 +1,107 @@
+import unittest
+import subprocess
+import tempfile
+import threading
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from jobs import HOST, JobStore, JobQueue, QueueFull
+
+
+class FailingJob(Exception):
+    status = 400
+
+    def to_dict(self):
+        return {'error': 'bad', 'code': 'BAD'}
+
+
+def wait_for(store, job_id, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = store.get(job_id)
+        if job and job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    return store.get(job_id)
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = JobStore(folder=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_job_completes(self):
+        q = JobQueue(lambda p: {'download_id': p['file_id']}, self.store, workers=1, maxsize=4)
+        job_id = q.submit({'file_id': 'abc'})
+        job = wait_for(self.store, job_id)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['result'], {'download_id': 'abc'})
+
+    def test_job_failure_keeps_error_body(self):
+        def handler(payload):
+            raise FailingJob()
+        q = JobQueue(handler, self.store, workers=1, maxsize=4)
+        job = wait_for(self.store, q.submit({}))
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['error'], {'error': 'bad', 'code': 'BAD'})
+        self.assertEqual(job['http_status'], 400)
+
+    def test_full_queue_rejects(self):
+        release = threading.Event()
+        q = JobQueue(lambda payload: release.wait(2), self.store, workers=1, maxsize=1)
+        q.submit({})
+        time.sleep(0.05)  # Worker picks up the first job
+        q.submit({})
+        with self.assertRaises(QueueFull):
+            q.submit({})
+        release.set()
+        q.queue.join()
+
+    def test_job_of_dead_worker_is_failed(self):
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        upload = os.path.join(self.tmp.name, 'upload.png')
+        open(upload, 'wb').close()
+        now = time.time()
+        self.store.save({'id': 'j1', 'status': 'queued', 'created_at': now, 'updated_at': now,
+                         'host': HOST, 'pid': dead.pid, 'upload': upload})
+        q = JobQueue(lambda payload: None, self.store, workers=1, maxsize=1)
+        job = q.lookup('j1')
+        self.assertEqual((job['status'], job['error']['code']), ('failed', 'JOB_LOST'))
+        self.assertFalse(os.path.exists(upload))
+
+    def test_live_job_is_left_alone(self):
+        release = threading.Event()
+        q = JobQueue(lambda payload: release.wait(2), self.store, workers=1, maxsize=1)
+        job_id = q.submit({})
+        self.assertIn(q.lookup(job_id)['status'], ('queued', 'processing'))
+        release.set()
+        q.queue.join()
+
+    def test_terminal_status_is_final(self):
+        self.store.save({'id': 'j1', 'status': 'processing'})
+        self.store.update('j1', status='done', result={'download_id': 'abc'})
+        # The stale-job check (or a late worker write) loses the race
+        job = self.store.update('j1', status='failed', error={'error': 'lost'})
+        self.assertEqual((job['status'], job['result']), ('done', {'download_id': 'abc'}))
+        self.assertEqual(self.store.get('j1')['status'], 'done')
+
+    def test_concurrent_updates_are_not_lost(self):
+        self.store.save({'id': 'j1', 'status': 'processing'})
+        threads = [threading.Thread(target=self.store.update, args=('j1',), kwargs={f'k{i}': i}) for i in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        job = self.store.get('j1')
+        self.assertEqual({k: job[k] for k in job if k.startswith('k')}, {f'k{i}': i for i in range(20)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import tempfile
+import shutil
+import json
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+from metrics import Counter, Gauge, Histogram
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self._folder = metrics.METRICS_FOLDER
+        metrics.METRICS_FOLDER = self.tmp
+
+    def tearDown(self):
+        metrics.METRICS_FOLDER = self._folder
+        shutil.rmtree(self.tmp)
+
+    def metric(self, cls, *args, **kwargs):
+        """A test metric, dropped from the global registry afterwards."""
+        metric = cls(*args, **kwargs)
+        self.addCleanup(metrics._registry.remove, metric)
+        return metric
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = self.metric(Histogram, 'test_latency_seconds', 'test', ('stage',), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            h.observe(value, stage='tool')
+        text = metrics.render()
+        self.assertIn('test_latency_seconds_bucket{stage="tool",le="0.1"} 1', text)
+        self.assertIn('test_latency_seconds_bucket{stage="tool",le="1"} 2', text)
+        self.assertIn('test_latency_seconds_bucket{stage="tool",le="+Inf"} 3', text)
+        self.assertIn('test_latency_seconds_count{stage="tool"} 3', text)
+
+    def test_stage_feeds_server_timing(self):
+        metrics.begin_request()
+        with metrics.stage('redis'):
+            pass
+        with metrics.stage('redis'):
+            pass
+        header = metrics.end_request()
+        self.assertTrue(header.startswith('redis;dur='))
+        self.assertEqual(header.count('redis'), 1)
+        self.assertIsNone(metrics.end_request())
+
+    def test_other_workers_are_merged(self):
+        c = self.metric(Counter, 'test_runs_total', 'test', ('result',))
+        g = self.metric(Gauge, 'test_in_flight', 'test')
+        c.inc(result='ok')
+        g.inc()
+        # A worker that has exited: its counters still count, its gauges do not
+        dead = {'pid': 2 ** 22 + 1, 'metrics': {'test_runs_total': [[['ok'], 4]], 'test_in_flight': [[[], 7]]}}
+        with open(os.path.join(self.tmp, 'dead.json'), 'w') as f:
+            json.dump(dead, f)
+        text = metrics.render()
+        self.assertIn('test_runs_total{result="ok"} 5', text)
+        self.assertIn('test_in_flight 1', text)
+
+    def test_flush_writes_snapshot(self):
+        metrics.flush(force=True)
+        with open(os.path.join(self.tmp, f"{os.getpid()}.json")) as f:
+            self.assertEqual(json.load(f)['pid'], os.getpid())
+
+    def test_exited_process_is_folded_and_removed(self):
+        c = self.metric(Counter, 'test_runs_total', 'test', ('result',))
+        c.inc(result='ok')
+        dead_pid = 2 ** 22 + 1
+        path = os.path.join(self.tmp, f"{dead_pid}.json")
+        with open(path, 'w') as f:
+            json.dump({'pid': dead_pid, 'token': 'x', 'metrics': {'test_runs_total': [[['ok'], 4]]}}, f)
+        self.assertIn('test_runs_total{result="ok"} 5', metrics.render())
+        self.assertFalse(os.path.exists(path))
+        # Folded once: the total holds on the next scrape
+        self.assertIn('test_runs_total{result="ok"} 5', metrics.render())
+
+    def test_reused_pid_keeps_the_old_totals(self):
+        c = self.metric(Counter, 'test_runs_total', 'test', ('result',))
+        c.inc(result='ok')
+        with open(os.path.join(self.tmp, f"{os.getpid()}.json"), 'w') as f:
+            json.dump({'pid': os.getpid(), 'token': 'old', 'metrics': {'test_runs_total': [[['ok'], 4]]}}, f)
+        metrics._claimed_pid = None
+        metrics.flush(force=True)
+        self.assertIn('test_runs_total{result="ok"} 5', metrics.render())
+
+
+if __name__ == '__main__':
+    unittest.main()
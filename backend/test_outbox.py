@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import outbox
+from contact import render
+from outbox import Outbox
+
+
+def message(text='Hello', email='user@example.com'):
+    return {'email': email, 'subject': 'Question', 'message': text}
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.batches = []
+        self.failures = 0
+        self.outbox = Outbox(self.send, folder=self.tmp, batch_size=2, limit_per_ip=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def send(self, messages):
+        if self.failures:
+            self.failures -= 1
+            raise IOError('resend timeout')
+        self.batches.append([m['message'] for m in messages])
+        return [None] * len(messages)
+
+    def test_sends_in_batches_oldest_first(self):
+        for i in range(3):
+            self.outbox.enqueue(message(f'm{i}'), ip='1.1.1.1')
+            time.sleep(0.001)
+        self.assertEqual(self.outbox.stats()['pending'], 3)
+        self.outbox.tick()
+        self.assertEqual(self.batches, [['m0', 'm1'], ['m2']])
+        self.assertEqual(self.outbox.stats()['pending'], 0)
+
+    def test_per_ip_throttle(self):
+        for i in range(5):
+            self.outbox.enqueue(message(f'm{i}'), ip='6.6.6.6')
+        self.outbox.enqueue(message('other'), ip='2.2.2.2')
+        self.outbox.tick()
+        self.assertEqual(sum(len(b) for b in self.batches), 4)
+        self.assertEqual(self.outbox.stats()['throttled'], 2)
+
+    def test_failed_batch_retries_with_backoff(self):
+        self.failures = 1
+        self.outbox.enqueue(message(), ip='1.1.1.1')
+        now = time.time()
+        self.outbox.tick(now=now)
+        self.outbox.tick(now=now + 1)
+        self.assertEqual(self.batches, [])  # Still backing off
+        self.outbox.tick(now=now + outbox.OUTBOX_RETRY_BASE + 1)
+        self.assertEqual(self.batches, [['Hello']])
+        # A retried message was already counted against its IP once
+        self.assertEqual(self.outbox.stats()['throttled'], 0)
+
+    def test_per_message_error_goes_dead_after_max_attempts(self):
+        self.outbox.sender = lambda messages: ['invalid reply_to' if m['email'] == 'bad@x.y' else None for m in messages]
+        self.outbox.enqueue(message(email='bad@x.y'), ip='1.1.1.1')
+        self.outbox.enqueue(message(), ip='1.1.1.1')
+        with patch.object(outbox, 'OUTBOX_MAX_ATTEMPTS', 2):
+            self.outbox.tick(now=time.time())
+            self.outbox.tick(now=time.time() + 3600)
+        stats = self.outbox.stats()
+        self.assertEqual((stats['pending'], stats['dead']), (0, 1))
+
+    def test_email_body_is_escaped(self):
+        html = render(message('<script>alert(1)</script>\nbye'))
+        self.assertNotIn('<script>', html)
+        self.assertIn('&lt;script&gt;alert(1)&lt;/script&gt;<br>bye', html)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from errors import ProcessingError
+import preprocess
+from preprocess import preprocess_image, probe_image, EXIF_ORIENTATION
+
+
+class TestPreprocess(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def save(self, name, mode='RGB', size=(1200, 900), **kwargs):
+        path = os.path.join(self.tmp, name)
+        Image.new(mode, size, 'red').save(path, **kwargs)
+        return path
+
+    def test_rgb_jpeg_passthrough(self):
+        path = self.save('a.jpg')
+        before = open(path, 'rb').read()
+        self.assertEqual(preprocess_image(path, 'jpg'), path)
+        self.assertEqual(open(path, 'rb').read(), before)
+
+    def test_rgba_png_rewritten_to_intermediate(self):
+        path = self.save('a.png', mode='RGBA')
+        tool_input = preprocess_image(path, 'png')
+        self.assertNotEqual(tool_input, path)
+        with Image.open(tool_input) as img:
+            self.assertEqual((img.format, img.mode), ('BMP', 'RGB'))
+
+    def test_rotated_jpeg_is_transposed(self):
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 6
+        path = self.save('a.jpg', exif=exif)
+        with Image.open(preprocess_image(path, 'jpg')) as img:
+            self.assertEqual(img.size, (900, 1200))
+
+    def test_low_resolution_rejected(self):
+        path = self.save('a.jpg', size=(640, 480))
+        with self.assertRaises(ProcessingError) as ctx:
+            preprocess_image(path, 'jpg')
+        self.assertEqual(ctx.exception.code, 'LOW_RESOLUTION')
+
+    def test_probe_reads_rotated_size_from_header(self):
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = 8
+        probe = probe_image(self.save('a.jpg', size=(1200, 900), exif=exif))
+        self.assertEqual((probe['width'], probe['height']), (900, 1200))
+        self.assertEqual(probe['format'], 'JPEG')
+
+    def test_probe_estimates_memory(self):
+        rgb = probe_image(self.save('a.jpg'))['memory']
+        rgba = probe_image(self.save('a.png', mode='RGBA'))['memory']
+        # Source plus exif_transpose's copy, plus the preview-sized copies
+        self.assertEqual(rgb, 1200 * 900 * 6 + 1200 * 900 * 3)
+        self.assertGreater(rgba, rgb)
+
+    def test_probe_rejects_decompression_bombs(self):
+        path = self.save('a.png', mode='L')
+        # Over our limit from the header, and over Pillow's own guard on open
+        for target, limit in ((preprocess, 1000 * 900), (Image, 1000 * 900 // 2)):
+            with patch.object(target, 'MAX_IMAGE_PIXELS', limit):
+                with self.assertRaises(ProcessingError) as ctx:
+                    probe_image(path)
+            self.assertEqual((ctx.exception.status, ctx.exception.code), (413, 'IMAGE_TOO_LARGE'))
+
+    def test_probe_rejects_non_images(self):
+        path = os.path.join(self.tmp, 'a.jpg')
+        with open(path, 'wb') as f:
+            f.write(b'not an image')
+        with self.assertRaises(ProcessingError) as ctx:
+            probe_image(path)
+        self.assertEqual(ctx.exception.code, 'INVALID_IMAGE')
+
+
+if __name__ == '__main__':
+    unittest.main()
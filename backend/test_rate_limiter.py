@@ -0,0 +1,51 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rate_limiter import RateLimiter, BoundedCounterStore
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_reserve_up_to_limit(self):
+        limiter = RateLimiter(3)
+        self.assertEqual([limiter.reserve('1.2.3.4') for _ in range(4)], [True, True, True, False])
+        self.assertEqual(limiter.usage('1.2.3.4'), 3)
+        self.assertEqual(limiter.usage('5.6.7.8'), 0)
+
+    def test_refund_gives_back_one_use(self):
+        limiter = RateLimiter(1)
+        self.assertTrue(limiter.reserve('1.2.3.4'))
+        self.assertFalse(limiter.reserve('1.2.3.4'))
+        limiter.refund('1.2.3.4')
+        self.assertEqual(limiter.usage('1.2.3.4'), 0)
+        self.assertTrue(limiter.reserve('1.2.3.4'))
+        limiter.refund('9.9.9.9')  # Unknown key is a no-op
+        self.assertEqual(limiter.usage('9.9.9.9'), 0)
+
+
+class TestBoundedCounterStore(unittest.TestCase):
+    def test_size_is_capped(self):
+        store = BoundedCounterStore(max_keys=100)
+        for n in range(1000):
+            store.reserve(f'ip{n}', 3)
+        self.assertEqual(len(store), 100)
+        self.assertEqual(store.get('ip0'), 0)
+        self.assertEqual(store.get('ip999'), 1)
+
+    def test_expired_keys_are_pruned(self):
+        store = BoundedCounterStore(ttl=10)
+        with patch('rate_limiter.time.time', return_value=1000):
+            store.reserve('a', 3)
+            store.reserve('a', 3)
+        with patch('rate_limiter.time.time', return_value=1011):
+            self.assertEqual(store.get('a'), 0)
+            store.reserve('b', 3)
+            self.assertEqual(len(store), 1)
+            self.assertEqual(store.reserve('a', 3), (True, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
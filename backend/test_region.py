@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from pipeline import try_region
+from region import process_region, region_box, TILE_SIZE
+
+
+def white_tool(input_path, output_path):
+    """Stand-in for the tool: returns a white image of the same size."""
+    with Image.open(input_path) as img:
+        Image.new('RGB', img.size, 'white').save(output_path)
+
+
+class TestRegion(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_region_box(self):
+        self.assertIsNone(region_box(1024, 4000))
+        self.assertIsNone(region_box(1100, 1100))
+        self.assertEqual(region_box(3000, 2000), (3000 - TILE_SIZE, 2000 - TILE_SIZE, 3000, 2000))
+
+    def test_small_image_falls_back(self):
+        path = os.path.join(self.tmp, 'a.png')
+        Image.new('RGB', (1200, 900), 'red').save(path)
+        self.assertFalse(process_region(path, 'png', os.path.join(self.tmp, 'out.png'), white_tool))
+
+    def test_tile_is_composited_back(self):
+        path = os.path.join(self.tmp, 'a.png')
+        output = os.path.join(self.tmp, 'out.png')
+        Image.new('RGB', (3000, 2000), 'red').save(path)
+        self.assertTrue(process_region(path, 'png', output, white_tool))
+        with Image.open(output) as img:
+            self.assertEqual(img.size, (3000, 2000))
+            self.assertEqual(img.getpixel((2999, 1999)), (255, 255, 255))
+            self.assertEqual(img.getpixel((3000 - TILE_SIZE, 2000 - TILE_SIZE)), (255, 255, 255))
+            self.assertEqual(img.getpixel((3000 - TILE_SIZE - 1, 1999)), (255, 0, 0))
+            self.assertEqual(img.getpixel((0, 0)), (255, 0, 0))
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['a.png', 'out.png'])
+
+    def test_lossless_formats_use_the_full_image_by_default(self):
+        path = os.path.join(self.tmp, 'a.png')
+        Image.new('RGB', (3000, 2000), 'red').save(path)
+        self.assertFalse(try_region(path, 'png', os.path.join(self.tmp, 'out.png')))
+        self.assertEqual(os.listdir(self.tmp), ['a.png'])
+
+    def test_jpeg_keeps_quantization(self):
+        path = os.path.join(self.tmp, 'a.jpg')
+        output = os.path.join(self.tmp, 'out.jpg')
+        Image.new('RGB', (3000, 2000), 'red').save(path, quality=80)
+        self.assertTrue(process_region(path, 'jpg', output, white_tool))
+        with Image.open(path) as src, Image.open(output) as out:
+            self.assertEqual(src.quantization, out.quantization)
+
+    def test_webp_stays_lossless(self):
+        path = os.path.join(self.tmp, 'a.webp')
+        output = os.path.join(self.tmp, 'out.webp')
+        Image.new('RGB', (3000, 2000), (12, 34, 56)).save(path, lossless=True)
+        self.assertTrue(process_region(path, 'webp', output, white_tool))
+        with Image.open(output) as img:
+            self.assertEqual(img.getpixel((0, 0)), (12, 34, 56))
+            self.assertEqual(img.getpixel((2999, 1999)), (255, 255, 255))
+
+
+if __name__ == '__main__':
+    unittest.main()
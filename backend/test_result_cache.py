@@ -0,0 +1,62 @@
+import unittest
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.outputs = os.path.join(self.tmp, 'outputs')
+        os.makedirs(self.outputs)
+        self.cache = ResultCache(os.path.join(self.tmp, 'cache'), self.outputs, max_bytes=400)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def add_output(self, file_id, size=100):
+        filename = f"{file_id}_clean.jpg"
+        with open(os.path.join(self.outputs, filename), 'wb') as f:
+            f.write(b'x' * size)
+        return {'success': True, 'download_id': file_id, 'filename': filename}
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.lookup('a' * 64, 'jpg'))
+        self.cache.store('a' * 64, 'jpg', self.add_output('id1'))
+        self.assertEqual(self.cache.lookup('a' * 64, 'jpg')['download_id'], 'id1')
+        self.assertIsNone(self.cache.lookup('a' * 64, 'png'))
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 2, 'evictions': 0})
+
+    def test_hit_has_the_same_keys_as_the_original_result(self):
+        result = dict(self.add_output('id1'), watermark_found=True, previews=['preview', 'thumb', 'before', 'after'])
+        self.cache.store('a' * 64, 'jpg', result)
+        self.assertEqual(self.cache.lookup('a' * 64, 'jpg'), result)
+
+    def test_hit_republishes_expired_output(self):
+        result = self.add_output('id1')
+        self.cache.store('a' * 64, 'jpg', result)
+        os.remove(os.path.join(self.outputs, result['filename']))
+        self.assertIsNotNone(self.cache.lookup('a' * 64, 'jpg'))
+        self.assertTrue(os.path.exists(os.path.join(self.outputs, result['filename'])))
+
+    def test_lru_eviction(self):
+        self.cache.store('a' * 64, 'jpg', self.add_output('id1'))
+        time.sleep(0.01)
+        self.cache.store('b' * 64, 'jpg', self.add_output('id2'))
+        time.sleep(0.01)
+        self.cache.lookup('a' * 64, 'jpg')  # 'a' is now most recently used
+        time.sleep(0.01)
+        self.cache.store('c' * 64, 'jpg', self.add_output('id3'))
+        self.assertIsNotNone(self.cache.lookup('a' * 64, 'jpg'))
+        self.assertIsNone(self.cache.lookup('b' * 64, 'jpg'))
+        self.assertIsNotNone(self.cache.lookup('c' * 64, 'jpg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
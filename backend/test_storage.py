@@ -0,0 +1,172 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import janitor
+from janitor import Janitor
+from storage import LocalStorage, S3Storage, is_not_found
+
+
+class NotFound(Exception):
+    response = {'Error': {'Code': '404'}}
+
+
+class MemoryS3:
+    """In-memory stand-in for the boto3 S3 client calls S3Storage makes."""
+
+    def __init__(self, fail_part=None):
+        self.objects = {}
+        self.uploads = {}
+        self.calls = []
+        self.fail_part = fail_part
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.calls.append('put_object')
+        self.objects[Key] = Body.read()
+
+    def create_multipart_upload(self, Bucket, Key, ContentType):
+        self.calls.append('create_multipart_upload')
+        upload_id = f"u{len(self.uploads)}"
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if PartNumber == self.fail_part:
+            raise IOError('connection reset')
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b''.join(parts[p['PartNumber']] for p in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.calls.append('abort_multipart_upload')
+        self.uploads.pop(UploadId)
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise NotFound()
+        return {'ContentLength': len(self.objects[Key])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+    def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_local_put_in_place_and_elsewhere(self):
+        store = LocalStorage(os.path.join(self.tmp, 'outputs'))
+        store.put('a_clean.png', self.write('a.png', b'abc'))
+        self.assertTrue(store.exists('a_clean.png'))
+        target = os.path.join(self.tmp, 'outputs', 'a_clean.png')
+        store.put('a_clean.png', target)
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'abc')
+        store.delete('a_clean.png')
+        self.assertFalse(store.exists('a_clean.png'))
+        self.assertIsNone(store.presigned_url('a_clean.png'))
+
+    def test_is_not_found(self):
+        self.assertTrue(is_not_found(NotFound()))
+        self.assertFalse(is_not_found(IOError('connection reset')))
+
+    def test_small_file_single_put(self):
+        client = MemoryS3()
+        store = S3Storage('bucket', 'outputs/', client=client, part_size=10)
+        store.put('a_clean.png', self.write('a.png', b'small'))
+        self.assertEqual(client.calls, ['put_object'])
+        self.assertEqual(client.objects['outputs/a_clean.png'], b'small')
+        self.assertTrue(store.exists('a_clean.png'))
+        self.assertFalse(store.exists('b_clean.png'))
+
+    def test_large_file_multipart(self):
+        client = MemoryS3()
+        store = S3Storage('bucket', client=client, part_size=4)
+        store.put('a_clean.jpg', self.write('a.jpg', b'0123456789'))
+        self.assertEqual(client.calls, ['create_multipart_upload'])
+        self.assertEqual(client.objects['outputs/a_clean.jpg'], b'0123456789')
+
+    def test_failed_part_aborts_upload(self):
+        client = MemoryS3(fail_part=2)
+        store = S3Storage('bucket', client=client, part_size=4)
+        with self.assertRaises(IOError):
+            store.put('a_clean.jpg', self.write('a.jpg', b'0123456789'))
+        self.assertIn('abort_multipart_upload', client.calls)
+        self.assertEqual((client.objects, client.uploads), ({}, {}))
+
+    def test_presigned_url(self):
+        store = S3Storage('bucket', 'outputs/', client=MemoryS3())
+        url = store.presigned_url('a_clean.png', 'cleaned_a_clean.png', ttl=60)
+        self.assertEqual(url, 'https://s3.test/bucket/outputs/a_clean.png?expires=60')
+
+    def test_missing_bucket_rejected(self):
+        with self.assertRaises(ValueError):
+            S3Storage(None, client=MemoryS3())
+
+
+class TestJanitorRemote(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.outputs = os.path.join(self.tmp, 'outputs')
+        os.makedirs(self.outputs)
+        self.patcher = patch.object(janitor, 'JANITOR_FOLDER', os.path.join(self.tmp, 'janitor'))
+        self.patcher.start()
+        self.client = MemoryS3()
+        self.storage = S3Storage('bucket', client=self.client)
+        self.deleted = []
+        self.janitor = Janitor(self.outputs, on_delete=self.deleted.append, storage=self.storage)
+        self.janitor.max_bytes = 150
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, ttl):
+        path = os.path.join(self.outputs, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        self.storage.put(name, path)
+        janitor.track(path, ttl=ttl)
+        return path
+
+    def test_quota_keeps_object_and_index(self):
+        old = self.write('old_clean.jpg', ttl=100)
+        self.write('new_clean.jpg', ttl=200)
+        self.janitor.tick()
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(self.storage.exists('old_clean.jpg'))
+        self.assertEqual(self.deleted, [])
+
+    def test_expiry_deletes_object_after_local_eviction(self):
+        old = self.write('old_clean.jpg', ttl=100)
+        self.write('new_clean.jpg', ttl=200)
+        self.janitor.tick()
+        self.janitor.tick(now=time.time() + 150)
+        self.assertFalse(self.storage.exists('old_clean.jpg'))
+        self.assertTrue(self.storage.exists('new_clean.jpg'))
+        self.assertEqual(self.deleted, [old])
+
+
+if __name__ == '__main__':
+    unittest.main()
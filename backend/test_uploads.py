@@ -0,0 +1,41 @@
+import unittest
+import tempfile
+import shutil
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from uploads import CappedUploadFile
+
+
+class TestCappedUploadFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'a.part')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_writes_through_to_disk(self):
+        f = CappedUploadFile(self.path, limit=10)
+        f.write(b'12345')
+        f.write(b'67890')
+        f.seek(0)
+        self.assertEqual(f.read(), b'1234567890')
+        f.close()
+        self.assertEqual(open(self.path, 'rb').read(), b'1234567890')
+
+    def test_rejects_past_cap_while_streaming(self):
+        f = CappedUploadFile(self.path, limit=10)
+        f.write(b'123456')
+        with self.assertRaises(RequestEntityTooLarge):
+            f.write(b'123456')
+        f.close()
+        self.assertEqual(os.path.getsize(self.path), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import threading
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from warmup import Warmup
+
+
+class TestWarmup(unittest.TestCase):
+    def test_steps_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=2)
+        warmup = Warmup()
+        warmup.add('a', barrier.wait)
+        warmup.add('b', barrier.wait)
+        warmup.run()
+        ready, steps = warmup.report()
+        self.assertTrue(ready)
+        self.assertEqual({s['status'] for s in steps.values()}, {'ok'})
+
+    def test_shared_only_leaves_per_process_steps(self):
+        calls = []
+        warmup = Warmup()
+        warmup.add('codecs', lambda: calls.append('codecs'), shared=True)
+        warmup.add('redis', lambda: calls.append('redis'))
+        warmup.run(shared_only=True)
+        self.assertEqual(calls, ['codecs'])
+        self.assertFalse(warmup.report()[0])
+        # After fork: the worker only runs what is left
+        warmup.run()
+        self.assertEqual(calls, ['codecs', 'redis'])
+        self.assertTrue(warmup.report()[0])
+
+    def test_required_failure_is_not_ready(self):
+        def boom():
+            raise FileNotFoundError('tool missing')
+
+        warmup = Warmup()
+        warmup.add('redis', lambda: False)
+        warmup.add('supabase', boom)
+        warmup.run()
+        ready, steps = warmup.report()
+        self.assertTrue(ready)
+        self.assertEqual((steps['redis']['status'], steps['supabase']['status']), ('skipped', 'failed'))
+
+        warmup.add('tool', boom, required=True)
+        warmup.run()
+        ready, steps = warmup.report()
+        self.assertFalse(ready)
+        self.assertEqual(steps['tool']['error'], 'tool missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
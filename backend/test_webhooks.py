@@ -0,0 +1,107 @@
+import unittest
+from unittest.mock import patch
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import webhooks
+from webhooks import WebhookSpool, event_key
+
+
+def event(name, user='u1', subscription='s1', updated_at='2026-01-01T00:00:00Z', status='active'):
+    return {
+        'meta': {'event_name': name, 'custom_data': {'user_id': user}},
+        'data': {'id': subscription, 'attributes': {'status': status, 'updated_at': updated_at}},
+    }
+
+
+class TestWebhookSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.applied = []
+        self.failures = 0
+        self.failing_user = None
+        self.spool = WebhookSpool(self.handle, folder=self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def handle(self, record):
+        if self.failures and self.failing_user in (None, record['user_id']):
+            self.failures -= 1
+            raise IOError('supabase timeout')
+        self.applied.append((record['event_name'], record['data']['data']['attributes']['status']))
+
+    def test_duplicate_delivery_is_acked_once(self):
+        self.assertTrue(self.spool.enqueue('e1', event('subscription_created')))
+        self.assertFalse(self.spool.enqueue('e1', event('subscription_created')))
+        self.spool.tick()
+        # Redelivered after it was applied
+        self.assertFalse(self.spool.enqueue('e1', event('subscription_created')))
+        self.spool.tick()
+        self.assertEqual(self.applied, [('subscription_created', 'active')])
+
+    def test_per_user_order_and_coalescing(self):
+        self.spool.enqueue('e3', event('subscription_updated', updated_at='2026-01-01T00:00:03Z', status='past_due'))
+        self.spool.enqueue('e1', event('subscription_created', updated_at='2026-01-01T00:00:01Z'))
+        self.spool.enqueue('e2', event('subscription_updated', updated_at='2026-01-01T00:00:02Z', status='on_trial'))
+        self.spool.enqueue('e4', event('subscription_cancelled', updated_at='2026-01-01T00:00:04Z', status='cancelled'))
+        self.spool.tick()
+        self.assertEqual(self.applied, [
+            ('subscription_created', 'active'),
+            ('subscription_updated', 'past_due'),
+            ('subscription_cancelled', 'cancelled'),
+        ])
+        self.assertEqual(self.spool.stats()['pending'], 0)
+
+    def test_failure_blocks_user_and_retries_with_backoff(self):
+        self.failures = 1
+        self.failing_user = 'u1'
+        self.spool.enqueue('e1', event('subscription_created', updated_at='2026-01-01T00:00:01Z'))
+        self.spool.enqueue('e2', event('subscription_cancelled', updated_at='2026-01-01T00:00:02Z', status='cancelled'))
+        self.spool.enqueue('o1', event('subscription_created', user='u2'))
+        now = time.time()
+        self.spool.tick(now=now)
+        self.assertEqual(self.applied, [('subscription_created', 'active')])  # u2 only
+        self.spool.tick(now=now + 1)
+        self.assertEqual(len(self.applied), 1)  # Still backing off
+        self.spool.tick(now=now + webhooks.WEBHOOK_RETRY_BASE + 1)
+        self.assertEqual(self.applied[1:], [('subscription_created', 'active'), ('subscription_cancelled', 'cancelled')])
+
+    def test_gives_up_after_max_attempts(self):
+        self.failures = 100
+        self.spool.enqueue('e1', event('subscription_created'))
+        self.spool.enqueue('e2', event('subscription_cancelled', updated_at='2026-01-01T00:00:05Z'))
+        with patch.object(webhooks, 'WEBHOOK_MAX_ATTEMPTS', 2):
+            self.spool.tick(now=time.time())
+            self.spool.tick(now=time.time() + 3600)
+        stats = self.spool.stats()
+        self.assertEqual(stats['dead'], 1)
+        self.assertEqual(stats['pending'], 1)
+        self.assertFalse(self.spool.enqueue('e1', event('subscription_created')))
+
+    def test_event_key_ignores_body_serialization(self):
+        data = event('subscription_updated')
+        compact = json.dumps(data, separators=(',', ':')).encode()
+        spaced = json.dumps(data, indent=2).encode()
+        self.assertEqual(event_key(data, compact), event_key(data, spaced))
+        later = event('subscription_updated', updated_at='2026-01-01T00:00:09Z')
+        self.assertNotEqual(event_key(data, compact), event_key(later, compact))
+
+    def test_older_event_after_newer_is_outdated(self):
+        self.spool.enqueue('e2', event('subscription_updated', updated_at='2026-01-01T00:00:02Z', status='past_due'))
+        self.spool.tick()
+        # Delivered late, after the newer state was applied
+        self.spool.enqueue('e1', event('subscription_created', updated_at='2026-01-01T00:00:01Z'))
+        self.spool.tick()
+        self.assertEqual(self.applied, [('subscription_updated', 'past_due')])
+        self.assertEqual(self.spool.stats()['pending'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import uuid
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from config import UPLOAD_FOLDER, MAX_FILE_SIZE, BATCH_MAX_BYTES
+
+
+class CappedUploadFile:
+    """Multipart file part written straight to UPLOAD_FOLDER.
+
+    Raises 413 as soon as more than `limit` bytes have arrived, instead of
+    buffering the whole body and checking the size afterwards.
+    """
+
+    def __init__(self, path, limit):
+        self.path = path
+        self.limit = limit
+        self.size = 0
+        self._file = open(path, 'w+b')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge()
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadRequest(Request):
+    """Request whose file uploads stream to disk under a hard per-file byte cap."""
+
+    # Set by the batch route once the caller is known to be Pro, before the body is read
+    batch_allowed = False
+
+    @property
+    def upload_limit(self):
+        # Batch uploads carry many images (or one ZIP) in a single request
+        if self.endpoint == 'remove_batch' and self.batch_allowed:
+            return BATCH_MAX_BYTES
+        return MAX_FILE_SIZE
+
+    @property
+    def max_content_length(self):
+        # Whole-body cap (files + form fields); werkzeug rejects on Content-Length up front
+        return self.upload_limit + 1024 * 1024
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4()}.part")
+        if not hasattr(self, 'upload_parts'):
+            self.upload_parts = []
+        self.upload_parts.append(path)
+        return CappedUploadFile(path, self.upload_limit)
+
+
+def claim_upload(file, path):
+    """Move a streamed upload to its final name (same directory, no copy)."""
+    file.stream.close()
+    os.replace(file.stream.path, path)
+
+
+def discard_unclaimed(request):
+    """Remove parts left behind by rejected or aborted requests."""
+    for path in getattr(request, 'upload_parts', ()):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
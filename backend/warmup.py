@@ -0,0 +1,71 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+FINISHED = ('ok', 'skipped', 'failed')
+
+
+class Warmup:
+    """Named start-up steps, run concurrently, with their outcome kept for /api/ready.
+
+    Shared steps only load code and data (modules, codecs, the tool binary's
+    pages). Run in the gunicorn master before it forks (--preload), they
+    leave every worker warm through copy-on-write. The other steps open
+    connections, which must not cross a fork, so each worker runs them
+    itself. A step returning False is reported as skipped. The process is
+    ready once every step has finished and no required step failed.
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self.state = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, fn, shared=False, required=False):
+        self.steps[name] = (fn, shared, required)
+        self.state[name] = {'status': 'pending', 'required': required}
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self.state[name] = dict(self.state[name], **fields)
+
+    def _run_step(self, name):
+        fn = self.steps[name][0]
+        self._set(name, status='running')
+        start = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            print(f"⚠️ Warm-up {name} failed: {e}")
+            self._set(name, status='failed', error=str(e), seconds=round(time.perf_counter() - start, 3))
+            return
+        self._set(name, status='skipped' if result is False else 'ok', seconds=round(time.perf_counter() - start, 3))
+
+    def run(self, shared_only=False):
+        """Run every step not yet done in this process (only the shared ones if asked)."""
+        with self._lock:
+            names = [
+                name for name, (fn, shared, required) in self.steps.items()
+                if self.state[name]['status'] == 'pending' and (shared or not shared_only)
+            ]
+            for name in names:
+                self.state[name] = dict(self.state[name], status='queued')
+        if not names:
+            return
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='warmup') as pool:
+            list(pool.map(self._run_step, names))
+        print(f"🔥 Warm-up done in {time.perf_counter() - start:.2f}s: {', '.join(names)}")
+
+    def start(self):
+        threading.Thread(target=self.run, name='warmup', daemon=True).start()
+
+    def report(self):
+        """(ready, per-step state)"""
+        with self._lock:
+            steps = {name: dict(state) for name, state in self.state.items()}
+        ready = all(
+            s['status'] in FINISHED and not (s['required'] and s['status'] == 'failed')
+            for s in steps.values()
+        )
+        return ready, steps
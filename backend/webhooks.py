@@ -0,0 +1,319 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import (
+    WEBHOOK_FOLDER, WEBHOOK_MAX_ATTEMPTS, WEBHOOK_RETRY_BASE, WEBHOOK_RETRY_MAX, WEBHOOK_DEDUP_TTL
+)
+from metrics import Counter, Histogram, flush as flush_metrics, stage
+
+POLL_INTERVAL = 0.5
+SWEEP_INTERVAL = 3600
+USER_LOCK_TIMEOUT = 60  # Seconds a node may hold a user's events; covers a slow Supabase call
+# Events that restate the whole subscription: a later one makes an earlier update moot
+FULL_STATE_EVENTS = ('subscription_created', 'subscription_updated')
+COALESCED_EVENTS = ('subscription_updated',)
+
+EVENTS = Counter('byewatermark_webhook_events_total', 'Webhook events by outcome', ('result',))
+APPLY_SECONDS = Histogram(
+    'byewatermark_webhook_apply_seconds', 'Time from webhook receipt to applied',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60, 300, 1800, 3600)
+)
+
+
+def event_key(data, body):
+    """Id for one Lemon Squeezy event, stable across redeliveries.
+
+    A retry carries the same resource, event name and updated_at even when
+    it is re-signed with a differently serialized body. The raw body hash is
+    only the fallback for payloads without those fields.
+    """
+    meta = data.get('meta') or {}
+    resource = data.get('data') or {}
+    updated_at = (resource.get('attributes') or {}).get('updated_at')
+    if resource.get('id') is None or not updated_at:
+        return hashlib.sha256(body).hexdigest()
+    key = f"{resource.get('type')}:{resource['id']}:{meta.get('event_name')}:{updated_at}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class _NoLock:
+    def release(self):
+        pass
+
+
+_NO_LOCK = _NoLock()
+
+
+class WebhookSpool:
+    """Durable, deduplicated inbox for Lemon Squeezy events.
+
+    The request thread only verifies and writes the event to
+    WEBHOOK_FOLDER/pending/<event_id>.json (fsynced, created with link() so
+    two concurrent deliveries of the same event cannot both land), then acks.
+    One consumer per node, elected with an flock like the janitor, applies
+    pending events through `handler`: per user in event order, skipping a
+    subscription_updated that a later full-state event supersedes. A failure
+    blocks that user's later events and is retried with exponential backoff;
+    after WEBHOOK_MAX_ATTEMPTS the event moves to dead/ for inspection.
+    Applied events move to done/ and answer redeliveries for
+    WEBHOOK_DEDUP_TTL.
+
+    Each user keeps a watermark: the updated_at of the newest event applied.
+    An older event that shows up later is skipped, since applying it would
+    roll the subscription back. With Redis the watermark and the seen-event
+    ids are shared, and a per-user lock keeps two nodes from applying the
+    same user's events at once. So ordering and dedup hold across replicas
+    even though each node spools what it received. Without Redis they live
+    in WEBHOOK_FOLDER, which should be a persistent volume either way.
+    """
+
+    def __init__(self, handler, folder=WEBHOOK_FOLDER, redis_client=None):
+        self.handler = handler
+        self.folder = folder
+        self.redis = redis_client
+        self._lock_file = None
+        self._last_sweep = 0
+        for state in ('pending', 'done', 'dead', 'watermarks'):
+            os.makedirs(os.path.join(folder, state), exist_ok=True)
+
+    def _path(self, state, event_id):
+        return os.path.join(self.folder, state, f"{event_id}.json")
+
+    def _seen(self, event_id):
+        return any(os.path.exists(self._path(state, event_id)) for state in ('done', 'dead'))
+
+    def _write(self, path, record):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_path
+
+    def enqueue(self, event_id, data):
+        """Persist a verified event. Returns False if this event was already received."""
+        if self._seen(event_id):
+            EVENTS.inc(result='duplicate')
+            return False
+        meta = data.get('meta') or {}
+        body = data.get('data') or {}
+        record = {
+            'id': event_id,
+            'event_name': meta.get('event_name'),
+            'user_id': (meta.get('custom_data') or {}).get('user_id'),
+            'subscription_id': body.get('id'),
+            'occurred_at': (body.get('attributes') or {}).get('updated_at') or '',
+            'received_at': time.time(),
+            'attempts': 0,
+            'next_attempt_at': 0,
+            'data': data,
+        }
+        path = self._path('pending', event_id)
+        tmp_path = self._write(path, record)
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            EVENTS.inc(result='duplicate')
+            return False
+        finally:
+            os.remove(tmp_path)
+        if not self._claim(event_id):
+            # Another node already took this delivery
+            os.remove(path)
+            EVENTS.inc(result='duplicate')
+            return False
+        _fsync_dir(os.path.dirname(path))
+        EVENTS.inc(result='queued')
+        return True
+
+    def _claim(self, event_id):
+        """Cross-node dedup. Without Redis (or if it is down) the local spool decides."""
+        if not self.redis:
+            return True
+        try:
+            with stage('redis'):
+                return bool(self.redis.set(f"webhook_seen:{event_id}", 1, nx=True, ex=WEBHOOK_DEDUP_TTL))
+        except Exception as e:
+            print(f"⚠️ Redis webhook dedup error: {e}")
+            return True
+
+    def _watermark_path(self, user_id):
+        return os.path.join(self.folder, 'watermarks', hashlib.sha256(str(user_id).encode()).hexdigest())
+
+    def _watermark(self, user_id):
+        """updated_at of the newest event applied for this user, or ''."""
+        if self.redis:
+            try:
+                with stage('redis'):
+                    value = self.redis.get(f"webhook_applied:{user_id}")
+                return value.decode() if value else ''
+            except Exception as e:
+                print(f"⚠️ Redis webhook watermark READ error: {e}")
+        try:
+            with open(self._watermark_path(user_id)) as f:
+                return f.read()
+        except OSError:
+            return ''
+
+    def _advance(self, user_id, occurred_at):
+        if not occurred_at or occurred_at <= self._watermark(user_id):
+            return
+        if self.redis:
+            try:
+                with stage('redis'):
+                    self.redis.set(f"webhook_applied:{user_id}", occurred_at, ex=WEBHOOK_DEDUP_TTL)
+            except Exception as e:
+                print(f"⚠️ Redis webhook watermark WRITE error: {e}")
+        path = self._watermark_path(user_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(occurred_at)
+        os.replace(tmp_path, path)
+
+    def _user_lock(self, user_id):
+        """Redis lock held while this node applies the user's events; None = skip them this tick."""
+        if not self.redis:
+            return _NO_LOCK
+        try:
+            lock = self.redis.lock(f"webhook_lock:{user_id}", timeout=USER_LOCK_TIMEOUT)
+            return lock if lock.acquire(blocking=False) else None
+        except Exception as e:
+            print(f"⚠️ Redis webhook lock error: {e}")
+            return _NO_LOCK
+
+    def start(self):
+        threading.Thread(target=self._run, name='webhook-consumer', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                if self._is_leader():
+                    self.tick()
+            except Exception as e:
+                print(f"⚠️ Webhook consumer error: {e}")
+            time.sleep(POLL_INTERVAL)
+
+    def _is_leader(self):
+        if self._lock_file:
+            return True
+        lock_file = open(os.path.join(self.folder, 'consumer.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        print(f"🔔 Webhook consumer: pid {os.getpid()}")
+        return True
+
+    def _pending(self):
+        folder = os.path.join(self.folder, 'pending')
+        records = []
+        for name in os.listdir(folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(folder, name)) as f:
+                    records.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return records
+
+    def _finish(self, record, state, **fields):
+        record.update(fields, finished_at=time.time())
+        path = self._path(state, record['id'])
+        os.replace(self._write(path, record), path)
+        os.remove(self._path('pending', record['id']))
+
+    def tick(self, now=None):
+        now = now or time.time()
+        by_user = {}
+        for record in self._pending():
+            by_user.setdefault(record['user_id'], []).append(record)
+        for user_id, records in by_user.items():
+            lock = self._user_lock(user_id)
+            if lock is None:
+                continue  # Another node is applying this user's events
+            try:
+                records.sort(key=lambda r: (r['occurred_at'], r['received_at']))
+                self._drain(records, now)
+            finally:
+                try:
+                    lock.release()
+                except Exception:
+                    pass  # Expired; the events it covered were applied or are retried
+        # The consumer may sit in a worker that serves no requests; publish its counters
+        flush_metrics()
+
+        if now - self._last_sweep > SWEEP_INTERVAL:
+            self._last_sweep = now
+            folder = os.path.join(self.folder, 'done')
+            for name in os.listdir(folder):
+                path = os.path.join(folder, name)
+                try:
+                    if now - os.path.getmtime(path) > WEBHOOK_DEDUP_TTL:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _drain(self, records, now):
+        """Apply one user's events in order; stop at the first that has to wait for a retry."""
+        watermark = self._watermark(records[0]['user_id'])
+        for i, record in enumerate(records):
+            if record['occurred_at'] and record['occurred_at'] < watermark:
+                # A newer state of this user's subscription was applied already
+                self._finish(record, 'done', result='outdated')
+                EVENTS.inc(result='outdated')
+                continue
+            if record['event_name'] in COALESCED_EVENTS and any(
+                later['event_name'] in FULL_STATE_EVENTS and later['subscription_id'] == record['subscription_id']
+                for later in records[i + 1:]
+            ):
+                self._finish(record, 'done', result='superseded')
+                EVENTS.inc(result='superseded')
+                continue
+            if record['next_attempt_at'] > now:
+                return
+            try:
+                self.handler(record)
+            except Exception as e:
+                record['attempts'] += 1
+                record['error'] = str(e)
+                if record['attempts'] >= WEBHOOK_MAX_ATTEMPTS:
+                    print(f"🔥 Webhook {record['event_name']} for User {record['user_id']} failed for good: {e}")
+                    self._finish(record, 'dead', result='dead')
+                    EVENTS.inc(result='dead')
+                    continue
+                delay = min(WEBHOOK_RETRY_MAX, WEBHOOK_RETRY_BASE * 2 ** (record['attempts'] - 1))
+                record['next_attempt_at'] = now + delay
+                print(f"⚠️ Webhook {record['event_name']} for User {record['user_id']} failed, retry in {delay:.0f}s: {e}")
+                path = self._path('pending', record['id'])
+                os.replace(self._write(path, record), path)
+                EVENTS.inc(result='retried')
+                return
+            self._advance(record['user_id'], record['occurred_at'])
+            watermark = max(watermark, record['occurred_at'])
+            self._finish(record, 'done', result='applied')
+            APPLY_SECONDS.observe(time.time() - record['received_at'])
+            EVENTS.inc(result='applied')
+
+    def stats(self):
+        pending = self._pending()
+        now = time.time()
+        return {
+            'pending': len(pending),
+            'dead': len(os.listdir(os.path.join(self.folder, 'dead'))),
+            'oldest_pending_seconds': round(now - min((r['received_at'] for r in pending), default=now), 3),
+        }
@@ -94,6 +94,12 @@ export function Hero() {
 
                             {items[0].status === 'success' && items[0].originalPreview && items[0].processedPreview && (
                                 <div className="space-y-8 animate-in fade-in zoom-in duration-500">
+                                    {items[0].watermarkFound === false && (
+                                        <div className="rounded-xl p-4 max-w-lg mx-auto bg-yellow-500/10 border border-yellow-500/20 text-yellow-200/80 text-sm">
+                                            <p className="font-semibold text-yellow-500 mb-1">No Gemini watermark found</p>
+                                            Your image was returned unchanged and did not count against your daily limit.
+                                        </div>
+                                    )}
                                     <BeforeAfter
                                         originalUrl={items[0].originalPreview}
                                         processedUrl={items[0].processedPreview}
@@ -170,7 +176,8 @@ export function Hero() {
                                         {/* Status Overlay */}
                                         <div className="absolute top-2 right-2 z-20">
                                             {item.status === 'uploading' && <span className="animate-spin text-accent">⏳</span>}
-                                            {item.status === 'success' && <span className="text-green-500 bg-black/50 rounded-full p-1">✅</span>}
+                                            {item.status === 'success' && item.watermarkFound !== false && <span className="text-green-500 bg-black/50 rounded-full p-1">✅</span>}
+                                            {item.status === 'success' && item.watermarkFound === false && <span className="bg-black/50 rounded-full p-1" title="No watermark found, returned unchanged">ℹ️</span>}
                                             {item.status === 'error' && <span className="text-red-500 bg-black/50 rounded-full p-1">❌</span>}
                                         </div>
 
@@ -178,7 +185,7 @@ export function Hero() {
                                             {/* Show Processed if ready, else Original */}
                                             {/* eslint-disable-next-line @next/next/no-img-element */}
                                             <img
-                                                src={item.processedPreview || item.originalPreview}
+                                                src={item.processedThumb || item.processedPreview || item.originalPreview}
                                                 alt={`Item ${idx}`}
                                                 className="w-full h-full object-cover transition-transform duration-300 group-hover:scale-105"
                                             />
@@ -1,5 +1,5 @@
 import { useState, useCallback, ChangeEvent, DragEvent, useEffect } from 'react';
-import { removeWatermark, getDownloadUrl, checkRemaining } from '@/lib/api';
+import { removeWatermark, getDownloadUrl, getPreviewUrl, checkRemaining } from '@/lib/api';
 import { useAuth } from '@/contexts/auth-context';
 import { trackUpload, trackUploadSuccess, trackUploadError } from '@/lib/analytics';
 
@@ -13,6 +13,8 @@ export interface UploadItem {
     downloadUrl: string | null;
     originalPreview: string; // URL
     processedPreview: string | null; // URL
+    processedThumb: string | null; // URL
+    watermarkFound: boolean | null; // false: returned unchanged, nothing was removed
 }
 
 interface UseUploadProps {
@@ -63,12 +65,15 @@ export function useUpload({ onFilesAccepted }: UseUploadProps = {}) {
 
             if (result.success && result.download_id) {
                 const downloadUrl = getDownloadUrl(result.download_id);
+                const previews = result.previews || [];
                 setItems(prev => prev.map(i => i.id === item.id ? {
                     ...i,
                     status: 'success',
                     progress: 100,
                     downloadUrl,
-                    processedPreview: downloadUrl
+                    processedPreview: previews.includes('preview') ? getPreviewUrl(result.download_id, 'preview') : downloadUrl,
+                    processedThumb: previews.includes('thumb') ? getPreviewUrl(result.download_id, 'thumb') : null,
+                    watermarkFound: result.watermark_found !== false
                 } : i));
                 trackUploadSuccess();
                 fetchRemaining();
@@ -118,7 +123,9 @@ export function useUpload({ onFilesAccepted }: UseUploadProps = {}) {
             error: null,
             downloadUrl: null,
             originalPreview: URL.createObjectURL(file), // create preview immediately
-            processedPreview: null
+            processedPreview: null,
+            processedThumb: null,
+            watermarkFound: null
         }));
 
         setItems(newItems);
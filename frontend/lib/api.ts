@@ -5,7 +5,7 @@ export async function checkRemaining(): Promise<{ remaining: number; limit: numb
     return res.json();
 }
 
-export async function removeWatermark(file: File, userId?: string): Promise<{ success: boolean; download_id: string; error?: string; code?: string; message?: string }> {
+export async function removeWatermark(file: File, userId?: string): Promise<{ success: boolean; download_id: string; watermark_found?: boolean; previews?: string[]; error?: string; code?: string; message?: string }> {
     const formData = new FormData();
     formData.append('file', file);
     if (userId) {
@@ -23,3 +23,10 @@ export async function removeWatermark(file: File, userId?: string): Promise<{ su
 export function getDownloadUrl(downloadId: string): string {
     return `${API_URL}/api/download/${downloadId}`;
 }
+
+export type PreviewKind = 'preview' | 'thumb' | 'before' | 'after';
+
+// Small JPEGs for the result view; the full-size output is only fetched on download
+export function getPreviewUrl(downloadId: string, kind: PreviewKind): string {
+    return `${API_URL}/api/preview/${downloadId}/${kind}`;
+}